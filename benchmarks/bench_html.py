@@ -0,0 +1,37 @@
+"""Compare the time and peak memory (on top of the graph) of HTML output as one string
+(graph_to_html), streamed to a file (write_html), and split into pages (write_html_pages), on a
+synthetic corpus of prefixed and compound codes. Times include the overhead of tracing memory.
+
+Usage: python benchmarks/bench_html.py [-n CODES] [--page-size N]
+"""
+import os
+import tempfile
+
+from argparse import ArgumentParser
+from bench_streaming import get_corpus, measure
+from units_of_measurement.convert import UnitConverter, graph_to_html, write_html
+from units_of_measurement.writers import write_html_pages
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--codes", type=int, default=2000, help="Number of codes in the corpus")
+    parser.add_argument("--page-size", type=int, help="Units per page (default: one page per letter)")
+    args = parser.parse_args()
+
+    gout = UnitConverter().convert(get_corpus(args.codes))
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w", encoding="utf-8") as devnull:
+        runs = {
+            "string": lambda: devnull.write(graph_to_html(gout)),
+            "stream": lambda: write_html(gout, devnull),
+            "pages": lambda: write_html_pages(gout, tmp, page_size=args.page_size),
+        }
+        print(f"{args.codes} codes, {len(gout)} triples")
+        print(f"{'output':<8}  {'seconds':>8}  {'peak MiB':>9}")
+        for name, func in runs.items():
+            _, elapsed, peak = measure(func)
+            print(f"{name:<8}  {elapsed:>8.2f}  {peak:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
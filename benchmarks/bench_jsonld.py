@@ -0,0 +1,47 @@
+"""Compare the time and peak memory of JSON-LD output through rdflib (convert, then
+serialize_graph) with the direct emitter (write_jsonld) and its JSON lines mode, on a synthetic
+corpus of prefixed and compound codes. The records are cached before the runs, so that the times
+are those of building and writing the output; the outputs are checked to be the same graph.
+
+Usage: python benchmarks/bench_jsonld.py [-n CODES]
+"""
+import os
+
+from argparse import ArgumentParser
+from io import StringIO
+from bench_streaming import get_corpus, measure
+from rdflib import Graph
+from rdflib.compare import isomorphic
+from units_of_measurement.convert import UnitConverter
+from units_of_measurement.writers import serialize_graph, write_jsonld
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--codes", type=int, default=2000, help="Number of codes in the corpus")
+    args = parser.parse_args()
+
+    codes = get_corpus(args.codes)
+    converter = UnitConverter()
+    gout = converter.convert(codes)
+
+    # The direct emitter must describe the same graph as the rdflib serializer
+    output = StringIO()
+    write_jsonld(converter, iter(codes), output)
+    assert isomorphic(Graph().parse(data=output.getvalue(), format="json-ld"), gout)
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        runs = {
+            "rdflib": lambda: devnull.write(serialize_graph(converter.convert(codes), "json-ld")),
+            "direct": lambda: write_jsonld(converter, iter(codes), devnull),
+            "ndjson": lambda: write_jsonld(converter, iter(codes), devnull, lines=True),
+        }
+        print(f"{args.codes} codes, {len(gout)} triples")
+        print(f"{'output':<8}  {'seconds':>8}  {'peak MiB':>9}")
+        for name, func in runs.items():
+            _, elapsed, peak = measure(func)
+            print(f"{name:<8}  {elapsed:>8.2f}  {peak:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Compare annotating a synthetic corpus of prefixed and compound codes in several languages in one
+pass (UnitConverter with a list of languages) with one pass per language, from loading the tables
+to the graph. Each pass starts with an empty record cache.
+
+Usage: python benchmarks/bench_lang.py [-n CODES] [-l LANGS]
+"""
+import logging
+import time
+
+from argparse import ArgumentParser
+from bench_streaming import get_corpus
+from units_of_measurement.convert import UnitConverter
+
+
+def run(codes, lang):
+    converter = UnitConverter(lang=lang)
+    return len(converter.convert(codes))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--codes", type=int, default=2000, help="Number of codes in the corpus")
+    parser.add_argument("-l", "--langs", default="en,fr,zh", help="Comma-separated languages")
+    args = parser.parse_args()
+    # Codes without a label in a language are reported once per pass
+    logging.disable(logging.WARNING)
+
+    codes = get_corpus(args.codes)
+    langs = args.langs.split(",")
+    # Load the snapshots of the tables before timing
+    for lang in langs + [args.langs]:
+        UnitConverter(lang=lang)
+
+    start = time.perf_counter()
+    separate = sum(run(codes, lang) for lang in langs)
+    separate_time = time.perf_counter() - start
+    start = time.perf_counter()
+    single = run(codes, langs)
+    single_time = time.perf_counter() - start
+    start = time.perf_counter()
+    run(codes, langs[0])
+    one_time = time.perf_counter() - start
+
+    print(f"{len(codes)} codes in {args.langs}")
+    print(f"{'passes':<16}  {'seconds':>8}  {'triples':>8}")
+    print(f"{'one per language':<16}  {separate_time:>8.2f}  {separate:>8}")
+    print(f"{'single':<16}  {single_time:>8.2f}  {single:>8}")
+    print(f"{langs[0] + ' only':<16}  {one_time:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
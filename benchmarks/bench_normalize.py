@@ -0,0 +1,78 @@
+"""Compare the ways to resolve UCUM codes to the IRIs of their units: normalize.to_iri (cached
+and uncached), the record of UnitConverter.get_record (without triples), and convert (reading the
+subject back out of the graph). Also times importing each module in a fresh interpreter.
+
+Usage: python benchmarks/bench_normalize.py [-n CODES] [-r REPEAT]
+"""
+import subprocess
+import sys
+import timeit
+
+from argparse import ArgumentParser
+from itertools import islice, product
+from rdflib import OWL, RDF
+from urllib.parse import quote as url_quote
+
+PREFIXES = ["", "m", "k", "u", "c", "n", "M", "G"]
+UNITS = ["m", "g", "s", "L", "mol", "Pa", "J", "W", "Hz", "A"]
+EXPONENTS = ["", "2", "3"]
+
+
+def get_corpus(n):
+    """Build up to n distinct quotients of prefixed units with exponents."""
+    powers = [p + u + e for p, u, e in product(PREFIXES, UNITS, EXPONENTS)]
+    return list(islice((f"{a}/{b}" for a, b in product(powers, powers) if a != b), n))
+
+
+def get_import_time(module):
+    """Get the time in seconds to import a module in a fresh interpreter."""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    return float(subprocess.check_output([sys.executable, "-c", code]))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--codes", type=int, default=2000, help="Number of codes in the corpus")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of measurements")
+    args = parser.parse_args()
+
+    for module in ["units_of_measurement.normalize", "units_of_measurement.convert"]:
+        print(f"import {module}: {get_import_time(module) * 1000:.0f} ms")
+
+    from units_of_measurement.convert import UnitConverter, convert
+    from units_of_measurement.normalize import get_canonical_code, to_iri
+
+    codes = get_corpus(args.codes)
+    converter = UnitConverter()
+    base_iri = converter.base_iri
+
+    def to_iri_uncached():
+        get_canonical_code.cache_clear()
+        return [to_iri(code) for code in codes]
+
+    def get_record_uncached():
+        converter.cache.clear()
+        return [base_iri + url_quote(converter.get_record(code)["ucum_codes"][0]) for code in codes]
+
+    def convert_subjects():
+        return [
+            str(next(convert([code]).subjects(RDF.type, OWL.NamedIndividual))) for code in codes[: len(codes) // 10]
+        ]
+
+    expected = to_iri_uncached()
+    assert expected == get_record_uncached()
+    assert expected[: len(codes) // 10] == convert_subjects()
+    methods = {
+        "to_iri (cached)": (lambda: [to_iri(code) for code in codes], len(codes)),
+        "to_iri (uncached)": (to_iri_uncached, len(codes)),
+        "get_record": (get_record_uncached, len(codes)),
+        "convert": (convert_subjects, len(codes) // 10),
+    }
+    print(f"{'method':<20}  {'us/code':>9}  {'codes/s':>9}")
+    for name, (func, n) in methods.items():
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat)) / n
+        print(f"{name:<20}  {best * 1e6:>9.2f}  {1 / best:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Time the conversion of a synthetic corpus of distinct codes with 1 to N worker processes
+and check that the output is the same for every number of jobs. The codes are streamed to
+N-Triples (write_ntriples), or with --graph converted to a graph (UnitConverter.convert, which
+also groups the spellings of each unit).
+
+Usage: python benchmarks/bench_parallel.py [-n CODES] [-j MAX_JOBS] [--graph]
+"""
+import hashlib
+import os
+import time
+
+from argparse import ArgumentParser
+from itertools import islice, product
+from units_of_measurement.convert import UnitConverter
+from units_of_measurement.writers import write_ntriples
+
+PREFIXES = ["", "m", "k", "u", "c", "n", "M", "G"]
+UNITS = ["m", "g", "s", "L", "mol", "Pa", "J", "W", "Hz", "A"]
+EXPONENTS = ["", "2", "3", "4"]
+
+
+class HashWriter:
+    """Text stream that only keeps a hash of what is written to it."""
+
+    def __init__(self):
+        self.hash = hashlib.sha256()
+
+    def write(self, s):
+        self.hash.update(s.encode("utf-8"))
+
+
+def get_corpus(n):
+    """Build up to n distinct codes from quotients and products of prefixed units with exponents."""
+    simple = [p + u for p, u in product(PREFIXES, UNITS)]
+    powers = [s + e for s, e in product(simple, EXPONENTS)]
+    quotients = (f"{a}/{b}" for a, b in product(powers, powers) if a != b)
+    products = (f"{a}.{b}/{c}" for a, b, c in product(simple, powers, powers))
+    return list(islice((code for codes in (quotients, products) for code in codes), n))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--codes", type=int, default=1000000, help="Number of codes in the corpus")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Maximum number of jobs")
+    parser.add_argument("--graph", action="store_true", help="Time UnitConverter.convert instead of write_ntriples")
+    args = parser.parse_args()
+
+    codes = get_corpus(args.codes)
+    jobs = [1]
+    while jobs[-1] * 2 <= args.jobs:
+        jobs.append(jobs[-1] * 2)
+    if jobs[-1] != args.jobs:
+        jobs.append(args.jobs)
+
+    print(f"{len(codes)} codes")
+    print(f"{'jobs':>4}  {'seconds':>8}  {'speedup':>7}  {'codes/s':>8}  output sha256")
+    serial_time = None
+    for n in jobs:
+        # A fresh converter for each run so that no records are cached
+        converter = UnitConverter(jobs=n)
+        output = HashWriter()
+        start = time.perf_counter()
+        if args.graph:
+            gout = converter.convert(codes)
+            elapsed = time.perf_counter() - start
+            output.write("\n".join(sorted(gout.serialize(format="nt").splitlines())))
+        else:
+            write_ntriples(converter, iter(codes), output)
+            elapsed = time.perf_counter() - start
+        serial_time = serial_time or elapsed
+        print(
+            f"{n:>4}  {elapsed:>8.2f}  {serial_time / elapsed:>7.2f}  {len(codes) / elapsed:>8.0f}  "
+            f"{output.hash.hexdigest()[:16]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
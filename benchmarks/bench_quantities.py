@@ -0,0 +1,52 @@
+"""Compare converting a column of values between units value by value (reducing the units to
+their scales for each value, or calling convert_values with the cached factor) with one
+convert_values call for the whole column, as a list and, if NumPy is installed, as an array.
+
+Usage: python benchmarks/bench_quantities.py [-n VALUES] [-r REPEAT]
+"""
+import random
+import timeit
+
+from argparse import ArgumentParser
+from units_of_measurement.quantities import QuantityConverter, convert_values
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--values", type=int, default=1000000, help="Number of values in each column")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of measurements")
+    args = parser.parse_args()
+
+    random.seed(0)
+    values = [random.uniform(0, 100) for _ in range(args.values)]
+    from_code, to_code = "[mi_i]/h", "m/s"
+
+    converter = QuantityConverter()
+
+    def uncached(v):
+        # The units are reduced to their scales again for each value
+        converter.scales.clear()
+        converter.factors.clear()
+        return converter.convert(v, from_code, to_code)
+
+    methods = {
+        "per value (uncached)": (lambda: [uncached(v) for v in values[:10000]], 10000),
+        "per value (cached)": (lambda: [convert_values(v, from_code, to_code) for v in values], len(values)),
+        "column (list)": (lambda: convert_values(values, from_code, to_code), len(values)),
+    }
+    try:
+        import numpy as np
+
+        array = np.array(values)
+        methods["column (numpy)"] = (lambda: convert_values(array, from_code, to_code), len(values))
+    except ImportError:
+        pass
+
+    print(f"{'method':<22}  {'ns/value':>10}  {'values/s':>12}")
+    for name, (func, n) in methods.items():
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat)) / n
+        print(f"{name:<22}  {best * 1e9:>10.1f}  {1 / best:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compare the time to build a registry of units in full with the time to update it after adding a
+few codes, or after changing one row of the exponents table.
+
+Usage: python benchmarks/bench_registry.py [-n CODES] [-a ADDED] [-f FORMAT]
+"""
+import os
+import tempfile
+import time
+
+from argparse import ArgumentParser
+from itertools import islice, product
+from units_of_measurement.convert import UnitConverter
+from units_of_measurement.helpers import get_exponents
+from units_of_measurement.registry import update_registry
+
+PREFIXES = ["", "m", "k", "u", "c", "n", "M", "G"]
+UNITS = ["m", "g", "s", "L", "mol", "Pa", "J", "W", "Hz", "A"]
+EXPONENTS = ["", "2", "3", "4"]
+
+
+def get_corpus(n):
+    """Build n distinct quotients of prefixed units with exponents."""
+    powers = [p + u + e for p, u, e in product(PREFIXES, UNITS, EXPONENTS)]
+    return list(islice((f"{a}/{b}" for a, b in product(powers, powers) if a != b), n))
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    stats = func()
+    print(f"{label:<28}  {time.perf_counter() - start:>8.2f}  {stats}")
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--codes", type=int, default=5000, help="Number of codes in the registry")
+    parser.add_argument("-a", "--added", type=int, default=10, help="Number of codes to add")
+    parser.add_argument("-f", "--format", default="ttl", help="Registry format (default: ttl)")
+    args = parser.parse_args()
+
+    codes = get_corpus(args.codes + args.added)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"registry.{args.format}")
+        converter = UnitConverter()
+        print(f"{'build':<28}  {'seconds':>8}  units")
+        timed(f"full ({args.codes} codes)", lambda: update_registry(converter, codes[:args.codes], path, args.format))
+        timed(f"add {args.added} codes", lambda: update_registry(converter, codes, path, args.format))
+
+        # Change the label of the 4th power, so that only the codes with a 4th power are converted again
+        exponents = get_exponents()
+        exponents["4"]["label_en"] = "fourth power"
+        converter = UnitConverter(unit_exponents=exponents)
+        timed("change exponents row '4'", lambda: update_registry(converter, codes, path, args.format))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compare the fast-path scanner (grammar.scan_code) with parsing by si_grammar and
+UnitsTransformer on the mapped UCUM codes and on a synthetic corpus of compound codes, and check
+that both give the same parts.
+
+Usage: python benchmarks/bench_scanner.py [-n CODES] [-r REPEAT]
+"""
+import timeit
+
+from argparse import ArgumentParser
+from itertools import islice, product
+from units_of_measurement.convert import flatten
+from units_of_measurement.grammar import UnitsTransformer, scan_code, si_grammar
+from units_of_measurement.snapshot import load_resources
+
+PREFIXES = ["", "m", "k", "u", "c", "n", "M", "G"]
+UNITS = ["m", "g", "s", "L", "mol", "Pa", "J", "W", "Hz", "A"]
+EXPONENTS = ["", "2", "-3"]
+
+
+def get_compound(n):
+    """Build up to n distinct products and quotients of prefixed units with exponents."""
+    powers = [p + u + e for p, u, e in product(PREFIXES, UNITS, EXPONENTS)]
+    return list(islice((f"{a}.{b}/{c}" for a, b, c in product(powers, powers, powers)), n))
+
+
+def parse(code):
+    try:
+        return flatten(UnitsTransformer().transform(si_grammar.parse(code)))
+    except Exception:
+        return None
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--codes", type=int, default=5000, help="Number of synthetic compound codes")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Number of measurements")
+    args = parser.parse_args()
+
+    mapped = list(dict.fromkeys(code for codes in load_resources()["mappings"].values() for code in codes))
+    corpora = {"mapped": mapped, "compound": get_compound(args.codes)}
+    print(f"{'corpus':<10}  {'codes':>6}  {'scanned':>7}  {'lark us':>8}  {'scan us':>8}  {'speedup':>7}")
+    for name, codes in corpora.items():
+        scanned = [code for code in codes if scan_code(code) is not None]
+        mismatches = [code for code in scanned if scan_code(code) != parse(code)]
+        if mismatches:
+            raise AssertionError(f"Scanner and parser differ on {mismatches[:10]}")
+        lark = min(timeit.repeat(lambda codes=scanned: [parse(code) for code in codes], number=1, repeat=args.repeat))
+        scan = min(timeit.repeat(lambda codes=scanned: [scan_code(code) for code in codes], number=1, repeat=args.repeat))
+        print(
+            f"{name:<10}  {len(codes):>6}  {len(scanned):>7}  {lark / len(scanned) * 1e6:>8.2f}  "
+            f"{scan / len(scanned) * 1e6:>8.2f}  {lark / scan:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
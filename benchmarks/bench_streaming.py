@@ -0,0 +1,62 @@
+"""Compare the time and peak memory of Turtle output (whole graph in memory) with streamed
+N-Triples output on a synthetic corpus of prefixed and compound codes.
+
+Usage: python benchmarks/bench_streaming.py [-n CODES]
+"""
+import os
+import time
+import tracemalloc
+
+from argparse import ArgumentParser
+from itertools import cycle, islice, product
+from units_of_measurement.convert import UnitConverter
+from units_of_measurement.writers import write_ntriples
+
+PREFIXES = ["", "m", "k", "u", "c", "n", "M", "G"]
+UNITS = ["m", "g", "s", "L", "mol", "Pa", "J", "W", "Hz", "A"]
+
+
+def get_corpus(n):
+    """Build n distinct codes: prefixed units, their squares, and quotients of two units."""
+    simple = [p + u for p, u in product(PREFIXES, UNITS)]
+    codes = simple + [c + "2" for c in simple] + [f"{a}/{b}" for a, b in product(simple, simple) if a != b]
+    return list(islice(cycle(codes), n))
+
+
+def measure(func):
+    """Run func and return its result, wall time in seconds and peak traced memory in MiB."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--codes", type=int, default=2000, help="Number of codes in the corpus")
+    args = parser.parse_args()
+
+    codes = get_corpus(args.codes)
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+
+        def run_ttl():
+            # A fresh converter so that both runs start with an empty record cache
+            devnull.write(UnitConverter().convert(codes).serialize(format="ttl"))
+
+        def run_nt():
+            return write_ntriples(UnitConverter(), iter(codes), devnull)
+
+        _, ttl_time, ttl_peak = measure(run_ttl)
+        lines, nt_time, nt_peak = measure(run_nt)
+
+    print(f"{len(codes)} codes, {lines} triples")
+    print(f"{'format':<8}  {'seconds':>8}  {'peak MiB':>9}")
+    print(f"{'ttl':<8}  {ttl_time:>8.2f}  {ttl_peak:>9.1f}")
+    print(f"{'nt':<8}  {nt_time:>8.2f}  {nt_peak:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Load-test a uom server: send GET /{code} requests (or POST /batch requests) for a synthetic
+corpus of codes over several keep-alive connections at once, and report the throughput, the
+latency percentiles and the response statuses, followed by the server's own metrics.
+
+By default a server is started on a free port for the test (with the given number of jobs);
+use --url to test a server that is already running.
+
+Usage: python benchmarks/load_test.py [--url URL] [-n REQUESTS] [-c CONNECTIONS] [-d DISTINCT]
+                                      [--batch SIZE] [-j JOBS]
+"""
+import asyncio
+import json
+import socket
+import subprocess
+import sys
+import time
+
+from argparse import ArgumentParser
+from collections import Counter
+from itertools import islice, product
+from urllib.parse import quote, urlsplit
+from units_of_measurement.profiling import get_percentile
+
+PREFIXES = ["", "m", "k", "u", "c", "n", "M", "G"]
+UNITS = ["m", "g", "s", "L", "mol", "Pa", "J", "W", "Hz", "A"]
+EXPONENTS = ["", "2", "3"]
+
+
+def get_corpus(n):
+    """Build up to n distinct quotients of prefixed units with exponents."""
+    powers = [p + u + e for p, u, e in product(PREFIXES, UNITS, EXPONENTS)]
+    return list(islice((f"{a}/{b}" for a, b in product(powers, powers) if a != b), n))
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def request(reader, writer, method, path, body=b""):
+    """Send one request on a keep-alive connection and read the status and body of the response."""
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n"
+    if body:
+        head += "Content-Type: application/json\r\n"
+    writer.write((head + "\r\n").encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def run_connection(host, port, jobs, latencies, statuses):
+    """Send the requests in jobs (a shared list of (method, path, body)) one after the other."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while jobs:
+            method, path, body = jobs.pop()
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, method, path, body)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+    finally:
+        writer.close()
+
+
+async def run_load_test(host, port, jobs, connections):
+    latencies = []
+    statuses = Counter()
+    start = time.perf_counter()
+    await asyncio.gather(*(run_connection(host, port, jobs, latencies, statuses) for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection(host, port)
+    _, metrics = await request(reader, writer, "GET", "/_metrics")
+    writer.close()
+    return elapsed, sorted(latencies), statuses, json.loads(metrics)
+
+
+async def wait_for_server(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--url", help="URL of a running server (default: start one)")
+    parser.add_argument("-n", "--requests", type=int, default=5000, help="Number of requests")
+    parser.add_argument("-c", "--connections", type=int, default=16, help="Number of concurrent connections")
+    parser.add_argument("-d", "--distinct", type=int, default=500, help="Number of distinct codes requested")
+    parser.add_argument("--batch", type=int, help="Send POST /batch requests of this many codes instead")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of jobs of the server that is started")
+    args = parser.parse_args()
+
+    codes = get_corpus(args.distinct)
+    if args.batch:
+        jobs = [
+            ("POST", "/batch", json.dumps([codes[(i * args.batch + k) % len(codes)] for k in range(args.batch)]).encode())
+            for i in range(args.requests)
+        ]
+    else:
+        jobs = [("GET", "/" + quote(codes[i % len(codes)], safe="/"), b"") for i in range(args.requests)]
+    jobs.reverse()
+
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = "127.0.0.1", get_free_port()
+        cmd = [sys.executable, "-m", "units_of_measurement.cli", "serve", "--port", str(port), "-j", str(args.jobs)]
+        server = subprocess.Popen(cmd, stderr=subprocess.DEVNULL)
+    try:
+        asyncio.run(wait_for_server(host, port))
+        elapsed, latencies, statuses, metrics = asyncio.run(
+            run_load_test(host, port, jobs, args.connections)
+        )
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    print(f"{args.requests} requests in {elapsed:.2f} s ({args.requests / elapsed:.0f} requests/s)")
+    print("latency ms: " + ", ".join(
+        f"p{p} {get_percentile(latencies, p) * 1000:.2f}" for p in [50, 90, 99]
+    ) + f", max {latencies[-1] * 1000:.2f}")
+    print("statuses: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items())))
+    print("server metrics:")
+    print(json.dumps(metrics, indent=2))
+
+
+if __name__ == "__main__":
+    main()
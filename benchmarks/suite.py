@@ -0,0 +1,266 @@
+"""Time each stage of the conversion on synthetic corpora of UCUM codes and compare the results
+with a stored baseline.
+
+Stages: scan (the fast-path scanner, grammar.scan_code), parse (si_grammar.parse), transform
+(UnitsTransformer.transform), flatten, process_result, parts (get_annotated_parts: codes, labels
+and synonyms of each part), label, synonyms, definition (the canonical builders), record
+(get_unit_record, all of the above), triples (get_triples) and serialize-FORMAT for ttl, json-ld,
+xml and html. Times are the best of REPEAT measurements over the corpus, in microseconds per code.
+
+Corpora: atoms (units without a prefix), prefixed (units with a prefix), compound (products and
+quotients of 6 to 12 parts), bracketed (conventional units in square brackets) and exponents
+(units and products with powers up to 9).
+
+Baselines depend on the machine and the Python version, so save one (--save) on the machine that
+is used for comparisons before relying on the regression flags. To absorb changes in the speed of
+the machine during and between runs (e.g., other load), each measurement of a stage is paired with
+a measurement of a fixed pure-Python calibration workload, and regressions are flagged on the
+time of the stage relative to the calibration.
+
+Usage: python benchmarks/suite.py [--save] [--check] [--baseline PATH] [--tolerance T]
+                                  [-n SIZE] [-r REPEAT] [--stage STAGE ...] [--corpus CORPUS ...]
+"""
+import json
+import os
+import platform
+import sys
+import timeit
+
+from argparse import ArgumentParser
+from rdflib import Graph
+from units_of_measurement.convert import (
+    UnitConverter,
+    flatten,
+    get_annotated_parts,
+    get_canonical_definition,
+    get_canonical_label,
+    get_canonical_synonyms,
+    get_sort_key,
+    get_unit_record,
+    process_result,
+)
+from units_of_measurement.grammar import SIMPLE_UNITS, UnitsTransformer, scan_code, si_grammar
+from units_of_measurement.writers import serialize_graph
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+FORMATS = ["ttl", "json-ld", "xml", "html"]
+
+PREFIXES = ["", "m", "k", "u", "d", "c", "n", "p", "h", "M", "G", "T"]
+
+# Minimum duration of one measurement in seconds (fast stages are run several times)
+MIN_TIME = 0.05
+
+
+def calibrate():
+    """A fixed workload of string, dict and list operations, like those of the conversion."""
+    d = {}
+    for i in range(20000):
+        key = f"{i % 97}.{i % 89}"
+        d[key] = d.get(key, 0) + len(key.split("."))
+    return sorted(d.items(), key=lambda x: (-x[1], x[0]))
+
+
+def get_atoms():
+    return [code for code, unit in SIMPLE_UNITS.items() if "prefix" not in unit and "[" not in code]
+
+
+def get_bracketed():
+    return [code for code in SIMPLE_UNITS if "[" in code]
+
+
+def get_compound():
+    """Products of prefixed litres, powers of REM and chains of divisions, of 6 to 12 parts."""
+    codes = []
+    for n in range(6, 13):
+        codes.append(".".join(prefix + "L" for prefix in PREFIXES[:n]))
+        codes.append(".".join(f"REM{i}" for i in range(1, n + 1)))
+        codes.append("/".join(prefix + "m" for prefix in PREFIXES[:n]))
+        codes.append(".".join(f"{prefix}{unit}" for prefix, unit in zip(PREFIXES[:n], ["g", "s", "A", "K"] * 3)))
+    return codes
+
+
+def get_exponents():
+    atoms = ["m", "g", "s", "A", "K", "mol", "cd", "L", "Pa", "J"]
+    codes = [f"{atom}{sign}{power}" for atom in atoms for sign in ["", "-"] for power in range(2, 10)]
+    codes.extend(f"k{a}{i + 2}.{b}-{9 - i}" for i, (a, b) in enumerate(zip(atoms, reversed(atoms))))
+    return codes
+
+
+def get_prefixed():
+    return [code for code, unit in SIMPLE_UNITS.items() if "prefix" in unit]
+
+
+CORPORA = {
+    "atoms": get_atoms,
+    "prefixed": get_prefixed,
+    "compound": get_compound,
+    "bracketed": get_bracketed,
+    "exponents": get_exponents,
+}
+
+
+def get_corpus(name, converter, size):
+    """Get up to size codes of a corpus, evenly spaced, that can be converted."""
+    codes = []
+    for code in CORPORA[name]():
+        try:
+            if converter.get_record(code) is not None:
+                codes.append(code)
+        except ValueError:
+            continue
+    step = max(1, len(codes) // size)
+    return codes[::step][:size]
+
+
+def get_stages(codes, converter):
+    """Prepare the inputs of each stage from the outputs of the previous stages, and get a function
+    that runs the stage on all of them."""
+    ucum_si = converter.ucum_si
+    unit_prefixes = converter.unit_prefixes
+    unit_exponents = converter.unit_exponents
+    trees = [si_grammar.parse(code) for code in codes]
+    results = [UnitsTransformer().transform(tree) for tree in trees]
+    flat = [flatten(result) for result in results]
+
+    def get_lists(code, flat_result):
+        num_list, denom_list = get_annotated_parts(
+            code, [process_result(r, code) for r in flat_result], ucum_si, unit_prefixes, unit_exponents
+        )
+        return sorted(num_list, key=get_sort_key), sorted(denom_list, key=get_sort_key)
+
+    lists = [get_lists(code, f) for code, f in zip(codes, flat)]
+    records = [converter.get_record(code) for code in codes]
+    gout = Graph()
+    for ns, base in converter.namespaces.items():
+        gout.bind(ns, base)
+    for record in records:
+        for t in converter.get_triples(record):
+            gout.add(t)
+
+    stages = {
+        "scan": lambda: [scan_code(code) for code in codes],
+        "parse": lambda: [si_grammar.parse(code) for code in codes],
+        "transform": lambda: [UnitsTransformer().transform(tree) for tree in trees],
+        "flatten": lambda: [flatten(result) for result in results],
+        "process_result": lambda: [[process_result(r, code) for r in f] for code, f in zip(codes, flat)],
+        "parts": lambda: [
+            get_annotated_parts(code, [process_result(r, code) for r in f], ucum_si, unit_prefixes, unit_exponents)
+            for code, f in zip(codes, flat)
+        ],
+        "label": lambda: [get_canonical_label(n, d) for n, d in lists],
+        "synonyms": lambda: [get_canonical_synonyms(n, d) for n, d in lists],
+        "definition": lambda: [
+            get_canonical_definition(n, d, ucum_si, unit_prefixes, unit_exponents) for n, d in lists
+        ],
+        "record": lambda: [
+            get_unit_record(
+                code, ucum_si, unit_prefixes, unit_exponents, converter.mappings_index, converter.eq_codes
+            )
+            for code in codes
+        ],
+        "triples": lambda: [converter.get_triples(record) for record in records],
+    }
+    for fmt in FORMATS:
+        stages[f"serialize-{fmt}"] = lambda fmt=fmt: serialize_graph(gout, fmt)
+    return stages
+
+
+def get_number(timer):
+    """Get the number of calls for one measurement to take at least MIN_TIME."""
+    number = 1
+    while timer.timeit(number) < MIN_TIME:
+        number *= 2
+    return number
+
+
+def measure(func, repeat):
+    """Get the best time of one call of func over repeat measurements, and the best time relative
+    to the calibration workload measured right after each measurement."""
+    timer = timeit.Timer(func)
+    calibration_timer = timeit.Timer(calibrate)
+    number = get_number(timer)
+    calibration_number = get_number(calibration_timer)
+    times = []
+    relative = []
+    for _ in range(repeat):
+        t = timer.timeit(number) / number
+        times.append(t)
+        relative.append(t / (calibration_timer.timeit(calibration_number) / calibration_number))
+    return min(times), min(relative)
+
+
+def compare(results, baseline, tolerance):
+    """Print the results next to the baseline and return the keys of the stages that are slower
+    than the baseline, relative to the calibration workload, by more than the tolerance."""
+    regressions = []
+    print(f"{'stage/corpus':<34}  {'us/code':>10}  {'baseline':>10}  {'ratio':>6}")
+    for key, result in results.items():
+        us = result["us"]
+        base = baseline.get(key)
+        if base is None:
+            print(f"{key:<34}  {us:>10.2f}  {'-':>10}  {'-':>6}")
+            continue
+        ratio = result["relative"] / base["relative"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 - tolerance:
+            flag = "  faster"
+        print(f"{key:<34}  {us:>10.2f}  {base['us']:>10.2f}  {ratio:>6.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description="Stage-level benchmarks of the conversion")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline path (default: benchmarks/baseline.json)")
+    parser.add_argument("--save", action="store_true", help="Save the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="Exit with an error if any stage regressed")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.3, help="Allowed slowdown relative to the baseline (default: 0.3)"
+    )
+    parser.add_argument("-n", "--size", type=int, default=50, help="Maximum number of codes per corpus")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Number of measurements per stage")
+    parser.add_argument("--stage", nargs="+", help="Only run these stages")
+    parser.add_argument("--corpus", nargs="+", choices=list(CORPORA), help="Only use these corpora")
+    args = parser.parse_args()
+
+    converter = UnitConverter()
+    results = {}
+    for name in args.corpus or CORPORA:
+        codes = get_corpus(name, converter, args.size)
+        stages = get_stages(codes, converter)
+        for stage, func in stages.items():
+            if args.stage and stage not in args.stage:
+                continue
+            best, relative = measure(func, args.repeat)
+            results[f"{stage}/{name}"] = {"us": best / len(codes) * 1e6, "relative": relative}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": {k: {m: round(v, 4) for m, v in result.items()} for k, result in results.items()},
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
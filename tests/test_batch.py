@@ -0,0 +1,30 @@
+import pytest
+
+from units_of_measurement.batch import BATCH_COLUMNS, convert_batch
+from units_of_measurement.cache import LRUCache
+from units_of_measurement.convert import UnitConverter
+
+CODES = ["m/s", "kg", None, "m.s-1", "xyz[", " kg ", float("nan"), "", "m/s"]
+
+
+def test_convert_batch():
+    converter = UnitConverter(cache=LRUCache())
+    result = convert_batch(CODES, converter)
+    assert BATCH_COLUMNS == list(result)
+    assert all(len(values) == len(CODES) for values in result.values())
+    assert ["m.s-1", "kg", None, "m.s-1", None, "kg", None, None, "m.s-1"] == result["ucum_code"]
+    assert converter.base_iri + "m.s-1" == result["iri"][0]
+    assert ("metre per second", "m s-1") == (result["label"][0], result["si_code"][0])
+    # Unparseable rows get an error instead of a log line, missing rows get nothing
+    assert "Could not process 'xyz[' with SI parser" == result["error"][4]
+    assert [4] == [i for i, error in enumerate(result["error"]) if error]
+    # Each distinct code is converted once
+    assert (1, 4) == (converter.cache.cache_info().hits, converter.cache.cache_info().misses)
+
+
+def test_convert_batch_frame():
+    pd = pytest.importorskip("pandas")
+    codes = pd.Series(CODES, index=range(10, 10 + len(CODES)))
+    frame = convert_batch(codes, as_frame=True)
+    assert list(codes.index) == list(frame.index)
+    assert convert_batch(CODES) == {column: list(frame[column]) for column in BATCH_COLUMNS}
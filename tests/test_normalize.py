@@ -0,0 +1,103 @@
+import os
+import pickle
+import subprocess
+import sys
+
+from units_of_measurement.convert import UnitConverter
+from units_of_measurement.normalize import get_canonical_code, get_unit_part, get_unit_parts, normalize, to_iri
+
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
+
+
+def get_import_times(module, runs=3):
+    # Best cumulative import time in microseconds of each module imported with module, in new processes
+    times = {}
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            stderr=subprocess.PIPE,
+            text=True,
+            check=True,
+        ).stderr
+        # Each line is "import time: self [us] | cumulative [us] | module", after a header line
+        for _, us, name in (line.split("|") for line in output.splitlines()[1:]):
+            times[name.strip()] = min(int(us), times.get(name.strip(), int(us)))
+    return times
+
+
+def test_normalize():
+    assert "m.s-2" == normalize("m/s2")
+    assert "m.s-1" == normalize("s-1.m")
+    assert normalize("xyz[") is None
+    assert "https://w3id.org/uom/%5Bdiop%5D" == to_iri("[diop]")
+    assert "http://example.com/m.s-2" == to_iri("m/s2", base_iri="http://example.com/")
+    assert to_iri("xyz[") is None
+
+    # The IRIs are the subjects of the units built by the converter
+    converter = UnitConverter()
+    with open(os.path.join(RESOURCES_DIR, "test_1.txt"), "r") as f:
+        codes = [line.strip() for line in f]
+    for code in codes:
+        record = converter.get_record(code)
+        assert str(converter.get_triples(record)[0][0]) == to_iri(code)
+
+
+def test_normalize_imports():
+    # Resolving codes does not import rdflib, and lark is only imported for codes that cannot be scanned
+    code = (
+        "import sys; from units_of_measurement.normalize import to_iri; to_iri('m/s'); "
+        "print('rdflib' in sys.modules, 'lark' in sys.modules); to_iri('10.m'); print('lark' in sys.modules)"
+    )
+    assert "False False\nTrue" == subprocess.check_output([sys.executable, "-c", code], text=True).strip()
+
+
+def test_startup_imports():
+    # The help and uom cache stats do not import rdflib, lark or asyncio
+    code = (
+        "import sys; from units_of_measurement.cli import main; sys.argv = ['uom', 'cache', '-h']\n"
+        "try:\n    main()\nexcept SystemExit:\n    pass\n"
+        "print([m for m in ('rdflib', 'lark', 'asyncio') if m in sys.modules])"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert "[]" == output.splitlines()[-1]
+
+    # Importing the CLI does not import rdflib or lark, and takes less time than importing rdflib
+    # alone. Both are timed on the same machine (the best of a few runs, as other processes can slow
+    # any one of them down), so that the check does not depend on how fast or loaded the machine is
+    cli_times = get_import_times("units_of_measurement.cli")
+    assert "rdflib" not in cli_times and "lark" not in cli_times
+    assert cli_times["units_of_measurement.cli"] < get_import_times("rdflib")["rdflib"]
+
+
+def test_unit_parts():
+    # Parts are interned, immutable, and totally ordered
+    km, per_s = get_unit_parts("km/s")
+    assert km is get_unit_parts("km.s-1")[0] and per_s is get_unit_parts("/s")[0]
+    assert ("k", "m", "metric", 1, "km") == (km.prefix, km.unit, km.type, km.exponent, km.ucum_code)
+    assert km is pickle.loads(pickle.dumps(km))
+    immutable = False
+    try:
+        km.exponent = 2
+    except AttributeError:
+        immutable = True
+    assert immutable
+    parts = get_unit_parts("s.m2.m.Pa.mol.Mm.K")
+    expected = [("K", 1), ("m", 1), ("m", 2), ("Mm", 1), ("mol", 1), ("Pa", 1), ("s", 1)]
+    assert expected == [(p.ucum_code, p.exponent) for p in sorted(parts)]
+    assert sorted(parts) == sorted(reversed(parts))
+
+
+def test_bounded_caches():
+    # Distinct codes (e.g., sent by clients of the server) do not grow the memoized codes and parts
+    # beyond their limits, and parts built again are equal to the evicted ones
+    converter = UnitConverter()
+    km = get_unit_parts("km")[0]
+    for exponent in range(2, 20000):
+        get_canonical_code(f"m{exponent}")
+    converter.get_record("km/s")
+    for exponent in range(2, 17000):
+        converter.get_record(f"s{exponent}")
+    assert get_canonical_code.cache_info().currsize <= get_canonical_code.cache_info().maxsize
+    assert get_unit_part.cache_info().currsize <= get_unit_part.cache_info().maxsize
+    assert len(converter.terms) <= converter.terms.maxsize
+    assert km == get_unit_parts("km")[0] and hash(km) == hash(get_unit_parts("km")[0])
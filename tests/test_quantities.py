@@ -0,0 +1,44 @@
+import pytest
+
+from units_of_measurement.quantities import QuantityConverter, convert_values, get_dimension_code
+
+
+def test_convert_values():
+    converter = QuantityConverter()
+    assert 1000.0 == converter.get_factor("km", "m")
+    assert 2.54 == converter.get_factor("[in_i]", "cm")
+    assert 0.45359237 == converter.get_factor("[lb_av]", "kg")
+    assert 0.44704 == converter.get_factor("[mi_i]/h", "m.s-1")
+    assert 3.785411784 == converter.get_factor("[gal_us]", "L")
+    assert 0.01 == converter.get_factor("mg/dL", "g/L")
+    assert 1e-4 == converter.get_factor("[ppm]", "%")
+    assert abs(converter.get_factor("[HP]", "W") - 745.69987158227) < 1e-9
+    assert "m.s-2.g" == get_dimension_code(converter.get_dimension("N"))
+    assert "1" == get_dimension_code(converter.get_dimension("mol"))
+
+    # Each pair is converted once
+    assert ("km", "m") in converter.factors
+    assert [1000.0, None, 2500.0] == converter.convert([1, None, 2.5], "km", "m")
+    assert 180.0 == convert_values(3, "h", "min")
+
+    # Units that are not commensurable, special and arbitrary units, and unparseable codes cannot be converted
+    for from_code, to_code in [("m", "s"), ("Cel", "K"), ("[IU]", "[IU]"), ("xyz[", "m")]:
+        assert not converter.is_commensurable(from_code, to_code)
+    failed = False
+    try:
+        converter.convert([1.0], "m", "s")
+    except ValueError as exc:
+        failed = "not commensurable (m and s)" in str(exc)
+    assert failed
+
+    # Every unit in the conversions table has a scale
+    for atom in converter.conversions:
+        converter.get_scale(atom)
+
+
+def test_convert_values_array():
+    np = pytest.importorskip("numpy")
+    values = np.array([1.0, 2.5, np.nan])
+    result = convert_values(values, "[ft_i]", "m")
+    assert isinstance(result, np.ndarray)
+    assert np.allclose([0.3048, 0.762], result[:2]) and np.isnan(result[2])
@@ -0,0 +1,37 @@
+from rdflib import Graph
+from rdflib.compare import isomorphic
+
+from units_of_measurement.convert import UnitConverter
+from units_of_measurement.helpers import get_exponents
+from units_of_measurement.registry import update_registry
+
+CODES = ["m/s", "kg", "Cel", "m2", "L/s", "kg.m2/s3"]
+
+
+def check_registry(path, fmt, converter, codes):
+    assert isomorphic(converter.convert(codes), Graph().parse(path, format=fmt))
+
+
+def test_update_registry(tmp_path):
+    for fmt in ["nt", "ttl", "json-ld", "xml"]:
+        path = str(tmp_path / f"registry.{fmt}")
+        converter = UnitConverter()
+        assert {"converted": 6, "reused": 0, "removed": 0} == update_registry(converter, CODES, path, fmt)
+        check_registry(path, fmt, converter, CODES)
+
+        # Only new units, and units with new spellings, are converted
+        codes = CODES + ["mol", "m.s-1"]
+        assert {"converted": 2, "reused": 5, "removed": 0} == update_registry(converter, codes, path, fmt)
+        check_registry(path, fmt, converter, codes)
+
+        # Only the units that use a changed row are converted
+        exponents = get_exponents()
+        exponents["2"]["label_en"] = "squared"
+        converter = UnitConverter(unit_exponents=exponents)
+        assert {"converted": 2, "reused": 5, "removed": 0} == update_registry(converter, codes, path, fmt)
+        check_registry(path, fmt, converter, codes)
+
+        # Removed codes are removed from the registry
+        codes.remove("kg")
+        assert {"converted": 0, "reused": 6, "removed": 1} == update_registry(converter, codes, path, fmt)
+        check_registry(path, fmt, converter, codes)
@@ -0,0 +1,50 @@
+from units_of_measurement.cli import run_resolve
+from units_of_measurement.convert import UnitConverter
+from units_of_measurement.resolve import MappingResolver, RESOLVE_COLUMNS, get_reverse_index, resolve_batch
+
+TERMS = [
+    "QUDT:M-PER-SEC",
+    "qudt:M-PER-SEC",
+    "http://purl.obolibrary.org/obo/UO_0000094",
+    "UO:0000094",
+    "<http://www.ontology-of-units-of-measure.org/resource/om-2/metrePerSecond-Time>",
+    "http://vocab.nerc.ac.uk/collection/P06/current/UVAA/",
+    "NERC_P06:UVAA",
+    "QUDT:NOT-A-UNIT",
+    "http://example.com/unit",
+    None,
+]
+
+
+def test_resolve():
+    resolver = MappingResolver()
+    assert "m.s-1" == resolver.resolve("QUDT:M-PER-SEC")
+    assert "https://w3id.org/uom/m.s-1" == resolver.to_iri("UO:0000094")
+    assert resolver.resolve("QUDT:NOT-A-UNIT") is None and resolver.to_iri("xyz:1") is None
+
+    # The terms resolve to the units whose mappings include them
+    converter = UnitConverter()
+    for term in TERMS[:7]:
+        record = converter.get_record(resolver.resolve(term))
+        assert resolver.to_iri(term) == str(converter.get_triples(record)[0][0])
+
+    # Each mapped IRI is resolved with the first code that can be parsed
+    index = get_reverse_index({"http://example.com/a/": ["g/(cm2.a)", "g.cm-2.a-1"], "http://example.com/b": ["xyz["]})
+    assert {"http://example.com/a/": "g.a-1.cm-2", "http://example.com/a": "g.a-1.cm-2"} == index
+
+
+def test_resolve_batch():
+    result = resolve_batch(TERMS)
+    assert RESOLVE_COLUMNS == list(result)
+    assert ["m.s-1"] * 7 + [None] * 3 == result["ucum_code"]
+    assert "https://w3id.org/uom/m.s-1" == result["iri"][0]
+    assert [None] * 3 == result["iri"][7:]
+
+
+def test_run_resolve(tmp_path, capsys):
+    # Other mappings are added to the default mappings, as in uom
+    path = tmp_path / "mappings.csv"
+    path.write_text("IRI,UCUM\nhttp://example.com/kilogram,kg\n", encoding="utf-8")
+    run_resolve(["-m", str(path), "--snapshot", str(tmp_path / "snapshot"), "http://example.com/kilogram", "QUDT:M-PER-SEC"])
+    rows = [line.split("\t") for line in capsys.readouterr().out.splitlines()]
+    assert ["kg", "m.s-1"] == [row[1] for row in rows[1:]]
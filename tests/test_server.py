@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+from units_of_measurement import server as server_module
+from units_of_measurement.server import MEDIA_TYPES, UnitServer, get_format
+
+
+async def request(port, method, path, headers=None, body=b""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    head = f"{method} {path} HTTP/1.1\r\nConnection: close\r\nContent-Length: {len(body)}\r\n"
+    for name, value in (headers or {}).items():
+        head += f"{name}: {value}\r\n"
+    writer.write((head + "\r\n").encode("latin-1") + body)
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, body
+
+
+def test_get_format():
+    assert "ttl" == get_format("", MEDIA_TYPES)
+    assert "ttl" == get_format("*/*", MEDIA_TYPES)
+    assert "json-ld" == get_format("application/ld+json", MEDIA_TYPES)
+    assert "html" == get_format("text/turtle;q=0.5, text/html", MEDIA_TYPES)
+    assert get_format("image/png", MEDIA_TYPES) is None
+
+
+def test_server():
+    async def run():
+        server = UnitServer()
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            status, headers, body = await request(port, "GET", "/m/s")
+            assert 200 == status
+            assert headers["Content-Type"].startswith("text/turtle")
+            assert b"<https://w3id.org/uom/m.s-1>" in body or b"unit:m.s-1" in body
+            status, headers, body = await request(port, "GET", "/m/s", {"Accept": "application/ld+json"})
+            assert headers["Content-Type"].startswith("application/ld+json")
+            json.loads(body)
+            # Rendered units are cached
+            assert (200, body) == (await request(port, "GET", "/m/s", {"Accept": "application/ld+json"}))[::2]
+            status, _, _ = await request(port, "GET", "/xyz%5B")
+            assert 404 == status
+            status, _, _ = await request(port, "GET", "/m?format=png")
+            assert 400 == status
+
+            codes = json.dumps(["m/s", "m.s-1", "xyz["]).encode("utf-8")
+            status, _, body = await request(port, "POST", "/batch", {"Content-Type": "application/json"}, codes)
+            columns = json.loads(body)
+            assert ["m.s-1", "m.s-1", None] == columns["ucum_code"]
+            assert columns["error"][2]
+            # Batches of other values than codes, and bodies of unknown length, are bad requests
+            status, _, _ = await request(port, "POST", "/batch", {"Content-Type": "application/json"}, b"[123]")
+            assert 400 == status
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"POST /batch HTTP/1.1\r\nContent-Length: abc\r\n\r\n")
+            assert (await reader.read()).startswith(b"HTTP/1.1 400 ")
+            writer.close()
+
+            status, _, body = await request(port, "GET", "/_metrics")
+            metrics = json.loads(body)
+            assert 8 == metrics["counters"]["requests"]
+            assert 1 == metrics["response_cache"]["hits"]
+        finally:
+            listener.close()
+            server.stop()
+
+    asyncio.run(run())
+
+
+def test_server_queue():
+    async def run():
+        # Requests beyond the concurrency limit and the queue are turned away
+        server = UnitServer(max_concurrency=1, max_queue=0)
+        await server.start(port=0)
+        try:
+            responses = await asyncio.gather(server.handle("GET", "/m", {}, b""), server.handle("GET", "/kg", {}, b""))
+            assert [200, 503] == [status for status, _, _ in responses]
+        finally:
+            server.stop()
+
+    asyncio.run(run())
+
+
+def test_server_converters():
+    async def run():
+        # Servers in the same process render with the converters of their own workers
+        servers = [UnitServer({"base_iri": f"http://example.com/{n}/"}) for n in range(2)]
+        for server in servers:
+            await server.start(port=0)
+        try:
+            for n, server in enumerate(servers):
+                status, _, body = await server.handle("GET", "/m", {}, b"")
+                assert 200 == status and f"http://example.com/{n}/".encode("utf-8") in body
+        finally:
+            for server in servers:
+                server.stop()
+
+    asyncio.run(run())
+
+
+def test_server_metrics(monkeypatch):
+    async def run():
+        # Only the latest latencies are kept for the percentiles, but every request is counted
+        monkeypatch.setattr(server_module, "LATENCY_WINDOW", 5)
+        server = UnitServer()
+        await server.start(port=0)
+        try:
+            for n in range(1, 21):
+                assert 200 == (await server.handle("GET", f"/m{n}", {}, b""))[0]
+            assert 5 == len(server.profiler.durations["render"])
+            assert 20 == server.get_metrics()["latency"]["render"]["runs"]
+        finally:
+            server.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+import os
+import shutil
+import stat
+
+from units_of_measurement.helpers import EXPONENTS_FILE, get_exponents, get_mappings
+from units_of_measurement.si_parser import get_si_grammar
+from units_of_measurement.snapshot import (
+    compile_resources,
+    get_resources_hash,
+    get_snapshot_path,
+    load_resources,
+    read_snapshot,
+)
+
+
+def test_snapshot(tmp_path):
+    exponents = tmp_path / "exponents.csv"
+    shutil.copy(EXPONENTS_FILE, exponents)
+    snapshot = compile_resources(str(tmp_path / "resources.snapshot"), exponents=str(exponents))
+    resources = load_resources(snapshot, exponents=str(exponents))
+    assert get_exponents() == resources["unit_exponents"]
+    assert get_mappings() == resources["mappings"]
+    assert ["http://qudt.org/vocab/unit/M-PER-SEC"] == [
+        iri for iri in resources["mappings_index"]["m.s-1"] if "qudt" in iri
+    ]
+
+    # The snapshot is rebuilt when one of the tables changes
+    with open(exponents, "a", encoding="utf-8") as f:
+        f.write("5,quintic\n")
+    assert read_snapshot(snapshot, load_resources(snapshot, exponents=str(exponents))["hash"])
+    assert "quintic" == load_resources(snapshot, exponents=str(exponents))["unit_exponents"]["5"]["label_en"]
+    assert read_snapshot(snapshot, resources["hash"]) is None
+
+
+def test_snapshot_path(tmp_path, monkeypatch):
+    # Default snapshots are kept in a private directory of the user, not in the shared temporary directory
+    monkeypatch.delenv("UOM_SNAPSHOT_DIR", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    path = get_snapshot_path(get_resources_hash())
+    assert os.path.dirname(path) == str(tmp_path / "cache" / "units_of_measurement")
+    assert load_resources()["hash"] == read_snapshot(path)["hash"]
+    assert 0 == stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode) & 0o077
+    # So are the parse tables of the Lark parser, which are loaded with pickle
+    get_si_grammar.cache_clear()
+    try:
+        get_si_grammar()
+        assert [name for name in os.listdir(os.path.dirname(path)) if name.endswith(".lark")]
+    finally:
+        get_si_grammar.cache_clear()
+
+    monkeypatch.setenv("UOM_SNAPSHOT_DIR", str(tmp_path))
+    assert os.path.dirname(get_snapshot_path(get_resources_hash())) == str(tmp_path)
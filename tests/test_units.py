@@ -1,9 +1,26 @@
 import logging
 import os
 
-from rdflib import Graph
+from concurrent.futures import ThreadPoolExecutor
+from rdflib import Graph, Literal, OWL, RDF, RDFS, SKOS, URIRef
 from rdflib.compare import graph_diff, to_isomorphic
-from units_of_measurement.convert import convert, get_alternative_ucum_code
+from units_of_measurement.cache import LRUCache, SQLiteCache
+from units_of_measurement.convert import (
+    MAX_COMBINATIONS,
+    ONTOLOGY_PREFIXES,
+    UnitConverter,
+    convert,
+    flatten,
+    get_alternative_ucum_code,
+    get_mapped_terms,
+    get_mappings_index,
+    get_synonyms_part,
+    iter_combinations,
+)
+from units_of_measurement.grammar import SIMPLE_UNITS, UnitsTransformer, scan_code, si_grammar
+from units_of_measurement.normalize import get_unit_parts
+from units_of_measurement.profiling import Profiler, get_percentile
+from units_of_measurement.snapshot import load_resources
 
 from pathlib import Path
 
@@ -39,6 +56,7 @@ def convert_test(n):
             dump_ttl(in_second)
     assert iso_actual == iso_expected
 
+
 def test_convert_unsupported():
     failed_as_expected = False
     try:
@@ -50,6 +68,7 @@ def test_convert_unsupported():
     g = convert(['mm[Hg]'], fail_on_err=False)
     assert len(list(g.triples((None, None, None)))) == 0
 
+
 def test_units():
     for n in range(1, 3):
         convert_test(n)
@@ -59,3 +78,215 @@ def test_get_alternative_ucum_code():
     assert "m/s" == get_alternative_ucum_code("m.s-1")
     assert "m.s" == get_alternative_ucum_code("m.s")
     assert "/s" == get_alternative_ucum_code("s-1")
+
+
+def test_simple_units():
+    # Each (prefix +) atom is a single token mapped to its own decomposition
+    for code, expected in SIMPLE_UNITS.items():
+        assert [expected] == UnitsTransformer().transform(si_grammar.parse(code))
+    assert [{"prefix": "m", "type": "metric", "unit": "m"}] == UnitsTransformer().transform(si_grammar.parse("mm"))
+    assert [{"type": "metric", "unit": "min"}] == UnitsTransformer().transform(si_grammar.parse("min"))
+
+
+def test_scan_code():
+    # The scanner gives the same parts as the parser for every code it accepts, and accepts every
+    # code that the parser reads as units and exponents only
+    codes = {code for codes in load_resources()["mappings"].values() for code in codes}
+    codes.update(SIMPLE_UNITS)
+    codes.update(["/m.s", "/m2/s-3", "mm2.g", "m02", "cd-0", "mol.mol-1", "m-", "m.", "m/", "//m", "10.m", "m s", ""])
+    scanned = 0
+    for code in sorted(codes):
+        try:
+            expected = flatten(UnitsTransformer().transform(si_grammar.parse(code)))
+        except Exception:
+            expected = None
+        if expected is not None and not all(isinstance(part, dict) for part in expected):
+            # Factors are left to the parser
+            expected = None
+        result = scan_code(code)
+        assert expected == result, code
+        scanned += result is not None
+    assert scanned > len(SIMPLE_UNITS)
+
+
+def test_convert_cache():
+    cache = LRUCache(maxsize=2)
+    # Repeated inputs are only looked up once
+    g = convert(["m/s", "m/s", "kg", "m/s"], cache=cache)
+    assert (0, 2) == (cache.hits, cache.misses)
+    # A second call with the same tables reuses the records
+    assert set(g) == set(convert(["m/s", "kg"], cache=cache))
+    assert (2, 2, 0) == (cache.hits, cache.misses, cache.evictions)
+    # The least recently used record is evicted
+    convert(["L"], cache=cache)
+    assert (1, 2) == (cache.evictions, len(cache))
+    convert(["kg", "m/s"], cache=cache)
+    assert (3, 4) == (cache.hits, cache.misses)
+
+
+def test_group_inputs():
+    converter = UnitConverter()
+    inputs = ["m/s", "m.s-1", "s-1.m", "m/s", "kg", "xyz["]
+    assert {
+        "m.s-1": {"m/s": 2, "m.s-1": 1, "s-1.m": 1},
+        "kg": {"kg": 1},
+        "xyz[": {"xyz[": 1},
+    } == converter.group_inputs(inputs)
+    # One subject and one conversion for all the spellings, which are kept as UCUM codes
+    g = converter.convert(inputs)
+    term = URIRef(converter.base_iri + "m.s-1")
+    assert {"m.s-1", "m/s", "s-1.m"} == {str(o) for o in g.objects(term, URIRef(converter.base_iri + "UCUM_code"))}
+    assert 2 == len(set(g.subjects(RDF.type, OWL.NamedIndividual)))
+    assert 3 == converter.cache.cache_info().misses
+
+
+def test_profiler():
+    profiler = Profiler()
+    g = convert(["m/s", "kg", "m.s-1", "kg"], cache=LRUCache(), observer=profiler)
+    summary = profiler.summary()
+    assert {"inputs": 4, "units": 2, "cache_misses": 2, "parsed": 2, "triples": len(g)} == summary["counters"]
+    assert ["group", "cache", "parse", "labels", "codes", "triples", "graph"] == list(summary["stages"])
+    assert 2 == summary["stages"]["parse"]["runs"]
+    # Failed codes are counted before the error is raised
+    converter = UnitConverter(cache=LRUCache(), observer=profiler)
+    try:
+        converter.get_record("xyz[")
+    except ValueError:
+        pass
+    assert 1 == profiler.counters["failed"]
+    assert [1, 5, 10] == [get_percentile(list(range(1, 11)), p) for p in [1, 50, 99]]
+
+
+def test_sqlite_cache(tmp_path):
+    path = str(tmp_path / "cache.db")
+    codes = ["m/s", "kg", "L/s", "Cel"]
+    cache = SQLiteCache(path)
+    g = convert(codes, cache=cache)
+    cache.close()
+
+    # Another run reads the records written by the first one
+    cache = SQLiteCache(path)
+    assert set(g) == set(convert(codes, cache=cache))
+    assert (4, 0, 4) == (cache.hits, cache.misses, len(cache))
+
+    # Records built from other tables are not used, and can be pruned
+    exponents = {"2": {"label_en": "squared"}}
+    converter = UnitConverter(unit_exponents=exponents, cache=cache)
+    converter.convert(["m2"])
+    assert (4, 1, 5) == (cache.hits, cache.misses, len(cache))
+    assert 4 == cache.prune(converter.tables_hash)
+    assert 1 == cache.stats()["records"]
+    cache.close()
+
+
+def test_get_mapped_terms():
+    mappings = [
+        "http://qudt.org/vocab/unit/M-PER-SEC",
+        "http://vocab.nerc.ac.uk/collection/P06/current/UVAA/",
+        "http://example.com/units/meterPerSecond",
+    ]
+    assert {
+        "http://qudt.org/vocab/unit/M-PER-SEC": URIRef("http://qudt.org/vocab/unit/M-PER-SEC"),
+        "http://vocab.nerc.ac.uk/collection/P06/current/UVAA/": URIRef("http://vocab.nerc.ac.uk/collection/P06/current/UVAA"),
+    } == get_mapped_terms(mappings)
+
+    # Other ontologies can be added without changing the module prefixes
+    converter = UnitConverter(
+        mappings={mappings[2]: ["m/s"]}, mapping_prefixes={"EX": "http://example.com/units/"}
+    )
+    g = converter.convert(["m/s"])
+    assert URIRef(mappings[2]) in set(g.objects(None, SKOS.exactMatch))
+    assert "EX" in dict(g.namespaces()) and "EX" not in ONTOLOGY_PREFIXES
+
+
+def test_get_mappings_index():
+    mappings = {
+        "http://qudt.org/vocab/unit/M-PER-SEC": ["m/s"],
+        "http://purl.obolibrary.org/obo/UO_0000094": ["s-1.m"],
+        "http://example.com/unparseable": ["meter per second"],
+    }
+    assert {
+        "m.s-1": ["http://qudt.org/vocab/unit/M-PER-SEC", "http://purl.obolibrary.org/obo/UO_0000094"]
+    } == get_mappings_index(mappings)
+
+
+def test_languages():
+    converter = UnitConverter(lang="en,fr,zh")
+    assert ("en", ["en", "fr", "zh"]) == (converter.lang, converter.langs)
+    codes = ["Cel", "km/s", "[in_i]"]
+    g = converter.convert(codes)
+    term = URIRef(converter.base_iri + "Cel")
+    assert {"en", "fr", "zh"} == {o.language for o in g.objects(term, RDFS.label)}
+    assert Literal("degré Celsius", lang="fr") in set(g.objects(term, RDFS.label))
+    assert {"en", "fr"} == {o.language for o in g.objects(term, SKOS.definition)}
+    # Composed definitions are only in English, and units without labels in a language keep the others
+    assert {"en"} == {o.language for o in g.objects(URIRef(converter.base_iri + "km.s-1"), SKOS.definition)}
+    assert {"en"} == {o.language for o in g.objects(URIRef(converter.base_iri + "%5Bin_i%5D"), RDFS.label)}
+    # Labels in the other languages are only composed when every prefix, exponent and word is translated
+    assert "kilomètre par seconde" == converter.get_record("km/s")["translations"]["fr"]["label"]
+    assert {} == converter.get_record("km2")["translations"]
+    assert ["fr"] == list(converter.get_record("km")["translations"])
+    # The same rule holds for the main language, so a language has the same labels whether it is the
+    # main one or not, and codes that cannot be labelled in the main language are not converted
+    assert {} == converter.get_record("s-1")["translations"]
+    for lang in ["fr", "zh"]:
+        single = UnitConverter(lang=lang)
+        for code in ["km2", "s-1"]:
+            assert single.get_record(code) is None
+            failed_as_expected = False
+            try:
+                single.get_record(code, fail_on_err=True)
+            except ValueError:
+                failed_as_expected = True
+            assert failed_as_expected
+    assert "kilomètre par seconde" == UnitConverter(lang="fr").get_record("km/s")["label"]
+    # Everything but the other languages is the same as in one pass per language
+    en = convert(codes)
+    languages = {t: t[2].language if isinstance(t[2], Literal) else None for t in g}
+    assert set(en) == {t for t, language in languages.items() if language in (None, "en")}
+    fr = UnitConverter(lang="fr").convert(codes[:2])
+    assert {t for t in fr if isinstance(t[2], Literal) and t[2].language == "fr"} == {
+        t for t, language in languages.items() if language == "fr"
+    }
+
+
+def test_long_compound_units():
+    # Each prefixed litre has two equivalent codes, so 12 parts would give 4096 combinations
+    code = ".".join(p + "L" for p in ["", "m", "k", "u", "d", "c", "n", "p", "h", "M", "G", "T"])
+    g = convert([code])
+    assert MAX_COMBINATIONS == len([o for o in g.objects(None, SKOS.exactMatch) if "dm3" in o or "l" in o])
+    # The limit can be set for each converter, and truncating the combinations is logged
+    warnings = []
+    handler = logging.Handler(logging.WARNING)
+    handler.emit = lambda record: warnings.append(record.getMessage())
+    logging.getLogger().addHandler(handler)
+    try:
+        g = convert([code], max_combinations=8)
+    finally:
+        logging.getLogger().removeHandler(handler)
+    assert 8 == len([o for o in g.objects(None, SKOS.exactMatch) if "dm3" in o or "l" in o])
+    assert any("max_combinations" in warning for warning in warnings)
+    assert ["a.c", "a.d", "b.c"] == list(iter_combinations([["a", "b"], ["c", "d"]], limit=3))
+
+
+def test_get_synonyms_part():
+    # The prefix is elided before each "are" synonym, and only before those
+    resources = load_resources()
+    ucum_si = {"ar": {"exact_synonym_en": "are|are|ares"}}
+    part = get_unit_parts("har")[0]
+    assert ["hectare", "hectare", "hectoares"] == get_synonyms_part(
+        part, ucum_si, resources["unit_prefixes"], resources["unit_exponents"]
+    )
+
+
+def test_unit_converter():
+    converters = [UnitConverter(base_iri=f"http://example.com/{n}/") for n in range(4)]
+    codes = ["m/s", "kg", "mmol/L", "[in_i]"] * 50
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        graphs = list(executor.map(lambda c: c.convert(codes), converters))
+    for n, g in enumerate(graphs):
+        assert {f"http://example.com/{n}/"} == {str(s)[:21] for s in g.subjects(RDF.type, OWL.NamedIndividual)}
+    assert "unit" not in ONTOLOGY_PREFIXES
+    assert set(converters[0].convert_one("m/s")) <= set(graphs[0])
+    assert [] == converters[0].convert_one("mm[Hg]")
+    assert set(converters[0].iter_convert(codes)) == set(graphs[0])
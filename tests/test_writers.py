@@ -0,0 +1,101 @@
+import json
+import os
+
+from io import StringIO
+from rdflib import Dataset, Graph
+from rdflib.compare import isomorphic
+
+from units_of_measurement.convert import UnitConverter, graph_to_html, write_html
+from units_of_measurement.writers import get_jsonld_context, write_html_pages, write_jsonld, write_ntriples
+
+CODES = ["m/s", "m.s-1", "kg", "Cel", "mm[Hg]", "m/s"]
+
+
+def test_write_jsonld():
+    converter = UnitConverter()
+    output = StringIO()
+    counts = {}
+    assert 3 == write_jsonld(converter, iter(CODES), output, counts=counts)
+    assert isomorphic(converter.convert(CODES), Graph().parse(data=output.getvalue(), format="json-ld"))
+    assert 3 == sum(counts["m.s-1"].values())
+
+    # JSON lines hold one unit each, in the same context
+    output = StringIO()
+    write_jsonld(converter, iter(CODES), output, lines=True)
+    nodes = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert ["unit:m.s-1", "unit:kg", "unit:Cel"] == [node["@id"] for node in nodes]
+    assert ["m.s-1", "m/s"] == nodes[0]["unit:UCUM_code"]
+    doc = json.dumps({"@context": get_jsonld_context(converter), "@graph": nodes})
+    assert len(Graph().parse(data=doc, format="json-ld")) == len(converter.convert(CODES)) - 4
+
+    # Spellings seen after their unit was written are added with their own node objects
+    codes = CODES + ["s-1.m", "kg"]
+    output = StringIO()
+    write_jsonld(converter, iter(codes), output, lines=True)
+    assert {"@id": "unit:m.s-1", "unit:UCUM_code": ["s-1.m"]} == json.loads(output.getvalue().splitlines()[-1])
+    output = StringIO()
+    assert 3 == write_jsonld(converter, iter(codes), output)
+    assert isomorphic(converter.convert(codes), Graph().parse(data=output.getvalue(), format="json-ld"))
+
+
+def test_write_ntriples():
+    converter = UnitConverter()
+    output = StringIO()
+    count = write_ntriples(converter, iter(CODES), output)
+    lines = output.getvalue().splitlines()
+    assert count == len(lines) == len(set(lines))
+    assert isomorphic(converter.convert(CODES), Graph().parse(data=output.getvalue(), format="nt"))
+
+    # N-Quads put the same triples in the named graph
+    output = StringIO()
+    write_ntriples(converter, iter(CODES), output, graph=converter.base_iri)
+    ds = Dataset()
+    ds.parse(data=output.getvalue(), format="nquads")
+    assert count == len(ds.graph(converter.base_iri))
+
+
+def test_write_ntriples_parallel():
+    codes = CODES + ["dm3", "L/s", "xyz[", "kg.m2/s3"] * 50
+    serial = StringIO()
+    serial_converter = UnitConverter()
+    write_ntriples(serial_converter, iter(codes), serial)
+    parallel = StringIO()
+    converter = UnitConverter(jobs=2)
+    write_ntriples(converter, iter(codes), parallel)
+    assert serial.getvalue() == parallel.getvalue()
+    # Repeated codes are converted once and cached in the parent process
+    assert len(converter.cache) == len(serial_converter.cache) < len(set(codes))
+
+    # The workers canonicalize the codes when building a graph, with the same units and counts
+    serial_counts = {}
+    parallel_counts = {}
+    g = serial_converter.convert(codes + ["s-1.m"], counts=serial_counts)
+    assert isomorphic(g, UnitConverter(jobs=2).convert(codes + ["s-1.m"], counts=parallel_counts))
+    assert serial_counts == parallel_counts
+
+
+def test_write_html(tmp_path):
+    gout = UnitConverter().convert(CODES + ["dm3", "L/s", "kg.m2/s3", "[diop]", "%"])
+    output = StringIO()
+    assert 8 == write_html(gout, output)
+    html = output.getvalue()
+    assert html == graph_to_html(gout)
+    labels = [line.strip()[4:-5] for line in html.splitlines() if line.startswith("  <h3>")]
+    assert 8 == len(labels) and labels == sorted(labels)
+    # With several languages, the headings are the labels in the main language
+    multilingual = UnitConverter(lang="en,fr,zh").convert(CODES + ["dm3", "L/s", "kg.m2/s3", "[diop]", "%"])
+    assert html.count("<h3>") == graph_to_html(multilingual).count("<h3>")
+    assert "<h3>degree Celsius</h3>" in graph_to_html(multilingual)
+    assert "<h3>摄氏度</h3>" in graph_to_html(multilingual, lang="zh")
+
+    # Pages by letter, and of a fixed size, hold the same units as the whole page
+    for page_size in [None, 2]:
+        directory = str(tmp_path / str(page_size))
+        paths = write_html_pages(gout, directory, page_size=page_size)
+        assert os.path.join(directory, "index.html") == paths[-1]
+        units = []
+        for path in paths[:-1]:
+            with open(path, "r", encoding="utf-8") as f:
+                units.extend(line for line in f if line.startswith('<div resource="'))
+        assert sorted(units) == sorted(line + "\n" for line in html.splitlines() if line.startswith('<div resource="'))
+    assert 4 == len(paths) - 1
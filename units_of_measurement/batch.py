@@ -0,0 +1,61 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote as url_quote
+from .convert import UnitConverter
+
+# Columns of the output of convert_batch, in order
+BATCH_COLUMNS = ["ucum_code", "iri", "label", "si_code", "error"]
+
+
+def convert_batch(
+    codes: Iterable[Optional[str]], converter: UnitConverter = None, as_frame: bool = False
+) -> Dict[str, List[Optional[str]]]:
+    """
+    Normalize a column of UCUM codes (e.g., from a table) to the canonical UCUM code, IRI, label and
+    SI code of each unit, without building a graph. Each distinct code is converted once and the
+    results are broadcast back to the order of the input. Rows that cannot be converted get None in
+    every column but the error column, which holds the reason; missing values (None, NaN or blank
+    strings) get None in every column. Nothing is logged.
+
+    :param codes: UCUM codes, e.g. a list or a pandas Series
+    :param converter: converter for the codes (default: a UnitConverter with the default tables)
+    :param as_frame: return a pandas DataFrame (indexed like codes, if it is a Series) instead of a
+                     dict of lists; requires pandas
+    :return: dict of column (see BATCH_COLUMNS) -> list of values, one for each input code
+    """
+    converter = converter or UnitConverter()
+    if as_frame:
+        return get_batch_frame(codes, converter)
+
+    # Factorize the codes into their distinct values and the position of each value
+    index = {}
+    positions = [index.setdefault(code, len(index)) for code in codes]
+    rows = [get_batch_row(code, converter) for code in index]
+    return {column: [rows[p][i] for p in positions] for i, column in enumerate(BATCH_COLUMNS)}
+
+
+def get_batch_frame(codes: Iterable[Optional[str]], converter: UnitConverter):
+    """Get the output of convert_batch as a pandas DataFrame, factorizing the codes with pandas."""
+    try:
+        import numpy as np
+        import pandas as pd
+    except ImportError as exc:
+        raise ImportError("convert_batch with as_frame=True requires pandas") from exc
+    if not isinstance(codes, pd.Series):
+        codes = pd.Series(list(codes), dtype=object)
+    labels, uniques = pd.factorize(codes)
+    # Missing values are labelled -1, which picks the empty row added at the end
+    rows = [get_batch_row(code, converter) for code in uniques] + [(None,) * len(BATCH_COLUMNS)]
+    columns = np.array(rows, dtype=object).reshape(len(rows), len(BATCH_COLUMNS)).T
+    return pd.DataFrame({column: values[labels] for column, values in zip(BATCH_COLUMNS, columns)}, index=codes.index)
+
+
+def get_batch_row(code: Optional[str], converter: UnitConverter) -> Tuple[Optional[str], ...]:
+    """Get the values of BATCH_COLUMNS for one UCUM code."""
+    if not isinstance(code, str) or not code.strip():
+        return (None,) * len(BATCH_COLUMNS)
+    try:
+        record = converter.get_record(code.strip(), fail_on_err=True)
+    except (RecursionError, ValueError) as exc:
+        return None, None, None, None, str(exc)
+    canonical = record["ucum_codes"][0]
+    return canonical, converter.base_iri + url_quote(canonical), record["label"], record["si_code"], None
@@ -0,0 +1,239 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from collections import namedtuple, OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+DEFAULT_CACHE_SIZE = 4096
+
+# Number of writes to a SQLite cache that are committed together
+SQLITE_BATCH_SIZE = 256
+
+# Seconds to wait for another process to release a lock on a SQLite cache
+SQLITE_TIMEOUT = 30
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"])
+
+
+class LRUCache:
+    """A size-bounded, thread-safe least-recently-used cache of converted unit records.
+
+    :param maxsize: maximum number of records to keep; the least recently used record is evicted
+                    when it is exceeded. None keeps every record, 0 disables caching.
+    """
+
+    def __init__(self, maxsize: Optional[int] = DEFAULT_CACHE_SIZE):
+        if maxsize is not None and maxsize < 0:
+            raise ValueError(f"Cache size must be None or >= 0, got {maxsize}")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the record for key and mark it as recently used, or default if it is missing."""
+        with self._lock:
+            try:
+                record = self._records[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._records.move_to_end(key)
+            self.hits += 1
+            return record
+
+    def put(self, key: Hashable, record: Any):
+        """Add a record, evicting the least recently used records when the cache is full."""
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._records[key] = record
+            self._records.move_to_end(key)
+            if self.maxsize is None:
+                return
+            while len(self._records) > self.maxsize:
+                self._records.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all records and reset the counters."""
+        with self._lock:
+            self._records.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def cache_info(self) -> CacheInfo:
+        """Return the hit, miss and eviction counters along with the current size."""
+        return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._records))
+
+
+class SQLiteCache:
+    """A persistent cache of converted unit records in a SQLite database, which can be shared by
+    many processes and runs. Records are keyed by (code, lang, base_iri, tables_hash), so records
+    built from other versions of the resource tables are never returned.
+
+    :param path: path of the database, created if it does not exist
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.maxsize = None
+        self.hits = 0
+        self.misses = 0
+        self._pending = []
+        self._used = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=SQLITE_TIMEOUT, check_same_thread=False)
+        with self._conn:
+            # WAL lets readers continue while another process writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "code TEXT, lang TEXT, base_iri TEXT, tables_hash TEXT, record TEXT, last_used REAL, "
+                "PRIMARY KEY (code, lang, base_iri, tables_hash))"
+            )
+
+    def __contains__(self, key: Tuple[str, str, str, str]) -> bool:
+        with self._lock:
+            return self._select(key) is not None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._flush()
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def _flush(self):
+        """Commit the pending records and last-used times (the lock must be held)."""
+        if not self._pending and not self._used:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?)", self._pending
+            )
+            self._conn.executemany(
+                "UPDATE records SET last_used = ? "
+                "WHERE code = ? AND lang = ? AND base_iri = ? AND tables_hash = ?",
+                self._used,
+            )
+        self._pending = []
+        self._used = []
+
+    def _select(self, key: Tuple[str, str, str, str]) -> Optional[str]:
+        for row in reversed(self._pending):
+            if tuple(row[:4]) == tuple(key):
+                return row[4]
+        row = self._conn.execute(
+            "SELECT record FROM records WHERE code = ? AND lang = ? AND base_iri = ? AND tables_hash = ?",
+            tuple(key),
+        ).fetchone()
+        return row[0] if row else None
+
+    def get(self, key: Tuple[str, str, str, str], default: Any = None) -> Any:
+        """Return the record for key, or default if it is missing."""
+        with self._lock:
+            record = self._select(key)
+            if record is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._used.append((time.time(), *key))
+            if len(self._used) >= SQLITE_BATCH_SIZE:
+                self._flush()
+            return json.loads(record)
+
+    def put(self, key: Tuple[str, str, str, str], record: Any):
+        """Add a record. Records are written in batches; call flush or close to write them all."""
+        with self._lock:
+            self._pending.append((*key, json.dumps(record, ensure_ascii=False), time.time()))
+            if len(self._pending) >= SQLITE_BATCH_SIZE:
+                self._flush()
+
+    def clear(self):
+        """Remove all records and reset the counters."""
+        with self._lock:
+            self._pending = []
+            self._used = []
+            with self._conn:
+                self._conn.execute("DELETE FROM records")
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        """Write the pending records and close the database."""
+        with self._lock:
+            if self._conn is None:
+                return
+            self._flush()
+            self._conn.close()
+            self._conn = None
+
+    def flush(self):
+        """Write the pending records to the database."""
+        with self._lock:
+            self._flush()
+
+    def cache_info(self) -> CacheInfo:
+        """Return the hit and miss counters of this process along with the number of records."""
+        return CacheInfo(self.hits, self.misses, 0, self.maxsize, len(self))
+
+    def prune(self, tables_hash: str = None, lang: str = "en", max_age: float = None) -> int:
+        """
+        Remove the records in lang that were built from other resource tables than tables_hash, and
+        the records that were not used for max_age seconds.
+
+        :param tables_hash: hash of the current resource tables (see UnitConverter.tables_hash)
+        :param lang: language of the current resource tables (default: en)
+        :param max_age: maximum time in seconds since a record was last used
+        :return: number of records removed
+        """
+        with self._lock:
+            self._flush()
+            with self._conn:
+                count = 0
+                if tables_hash:
+                    count += self._conn.execute(
+                        "DELETE FROM records WHERE lang = ? AND tables_hash != ?", (lang, tables_hash)
+                    ).rowcount
+                if max_age is not None:
+                    count += self._conn.execute(
+                        "DELETE FROM records WHERE last_used < ?", (time.time() - max_age,)
+                    ).rowcount
+            self._conn.execute("VACUUM")
+            return count
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the number of records, the number of records per table hash and language, and the
+        size of the database."""
+        with self._lock:
+            self._flush()
+            rows = self._conn.execute(
+                "SELECT tables_hash, lang, COUNT(*), MAX(last_used) FROM records "
+                "GROUP BY tables_hash, lang ORDER BY MAX(last_used) DESC"
+            ).fetchall()
+        return {
+            "path": self.path,
+            "size": os.path.getsize(self.path),
+            "records": sum(row[2] for row in rows),
+            "tables": [
+                {"tables_hash": h, "lang": lang, "records": n, "last_used": last}
+                for h, lang, n, last in rows
+            ],
+        }
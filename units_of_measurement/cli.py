@@ -1,14 +1,29 @@
 import csv
+import json
 import sys
 
 from argparse import ArgumentParser
 from io import TextIOWrapper
-from .convert import convert, graph_to_html
-from .helpers import ENCODING, get_exponents, get_mappings, get_prefixes, get_si_mappings
+from time import perf_counter
+from typing import Iterator
+from .cache import SQLiteCache
+from .helpers import ENCODING, get_langs
+from .profiling import Profiler
+from .snapshot import compile_resources, load_resources
 
+# The converter, writers and server (and rdflib, lark and asyncio with them) are imported by the
+# commands that use them, so that the help, argument errors and uom cache stats start quickly
 
-def main():
-    parser = ArgumentParser()
+LANG_HELP = "Language for annotations, or comma-separated languages annotated in one pass (e.g., en,fr,zh) (default: en)"
+
+
+def main():  # noqa: C901
+    # Run a subcommand if one is given, otherwise convert the input codes
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
+    parser = ArgumentParser(epilog="Commands: " + ", ".join(COMMANDS) + " (see uom COMMAND -h)")
     parser.add_argument("input", nargs="?", default=sys.stdin, help="Input list of UCUM codes")
     parser.add_argument("-s", "--si", help="SI unit labels and codes")
     parser.add_argument("-p", "--prefixes", help="SI prefix labels and codes")
@@ -17,10 +32,11 @@ def main():
     parser.add_argument(
         "-f",
         "--format",
-        help="Output format: ttl, json-ld, html, xml (default: ttl)",
+        help="Output format: ttl, json-ld, ndjson, html, xml, nt, nq (default: ttl); "
+        "json-ld, ndjson (one JSON-LD unit per line), nt and nq are written unit by unit as the input is read",
         default="ttl",
     )
-    parser.add_argument("-l", "--lang", help="Language for annotations (default: en)", default="en")
+    parser.add_argument("-l", "--lang", help=LANG_HELP, default="en")
     parser.add_argument(
         "-x", "--exclude-mappings", action="store_true", help="Exclude ontology mappings"
     )
@@ -33,62 +49,369 @@ def main():
     parser.add_argument(
         "--no-strict", action='store_false', help="If no-strict then do not throw error on unparseable unit"
     )
+    parser.add_argument("--snapshot", help="Resource snapshot (see uom compile-resources)")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="Number of worker processes to convert the codes in (default: 1)"
+    )
+    parser.add_argument(
+        "--counts", help="Write the number of inputs for each unit and its spellings to this TSV file"
+    )
+    parser.add_argument("--cache", help="SQLite cache of converted units to share between runs (see uom cache)")
+    parser.add_argument(
+        "--html-dir",
+        help="With -f html, write the units to pages in this directory (one per letter, or see --page-size) "
+        "with an index.html, instead of to stdout",
+    )
+    parser.add_argument("--page-size", type=int, help="With --html-dir, split the units into pages of this size")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write the time spent in each stage and counts of parsed and failed codes, cache hits and "
+        "triples to stderr as JSON",
+    )
     args = parser.parse_args()
 
     outfmt = args.format
-    if outfmt not in ["html", "json-ld", "ttl", "xml"]:
+    if outfmt not in ["html", "json-ld", "ndjson", "nq", "nt", "ttl", "xml"]:
         raise Exception("Unknown output format: " + outfmt)
 
-    # Read in provided files
-    sep = "\t"
-    if isinstance(args.input, TextIOWrapper):
-        inputs = [x.strip() for x in args.input.readlines()]
-    else:
-        if args.input.endswith(".csv"):
-            sep = ","
-        with open(args.input, "r", encoding=ENCODING) as f:
-            reader = csv.reader(f, delimiter=sep)
-            inputs = [x[0].strip() for x in reader]
+    # Imported here as loading rdflib is the slowest part of starting up
+    from .convert import UnitConverter, write_html
+    from .writers import serialize_graph, write_html_pages, write_jsonld, write_ntriples
 
-    # Get the SI->UCUM mappings
-    ucum_si = get_si_mappings(args.si, args.lang)
+    profiler = Profiler() if args.profile else None
+    if profiler:
+        start = perf_counter()
 
-    # Get the scientific prefixes
-    unit_prefixes = get_prefixes(args.prefixes, args.lang)
-
-    # Get the exponents
-    unit_exponents = get_exponents(args.exponents, args.lang)
+    # Get the SI->UCUM mappings, scientific prefixes, exponents and ontology mappings
+    resources = load_resources(
+        args.snapshot, args.si, args.prefixes, args.exponents, args.mappings, lang=args.lang
+    )
 
-    # Get the ontology mappings
+    # The default ontology mappings (and their index) are added by convert
     mappings = {}
-    if not args.exclude_mappings:
-        mappings = get_mappings(args.mappings)
-
-    gout = convert(
-        inputs,
-        ucum_si,
-        unit_prefixes,
-        unit_exponents,
+    if not args.exclude_mappings and args.mappings:
+        mappings = resources["mappings"]
+
+    converter = UnitConverter(
+        resources["ucum_si"],
+        resources["unit_prefixes"],
+        resources["unit_exponents"],
         mappings,
-        lang=args.lang,
         base_iri=args.base_iri,
+        lang=args.lang,
         fail_on_err=args.strict,
+        jobs=args.jobs,
+        cache=SQLiteCache(args.cache) if args.cache else None,
+        observer=profiler,
     )
+    counts = {} if args.counts else None
+    if profiler:
+        profiler.on_stage("load", perf_counter() - start)
+
+    if outfmt in ["json-ld", "ndjson", "nq", "nt"]:
+        if outfmt in ["json-ld", "ndjson"]:
+            # Stream the JSON-LD node object of each unit
+            write_jsonld(converter, iter_inputs(args.input), sys.stdout, lines=outfmt == "ndjson", counts=counts)
+        else:
+            # Stream the triples of each unit, using the base IRI as the graph name for N-Quads
+            graph = args.base_iri if outfmt == "nq" else None
+            write_ntriples(converter, iter_inputs(args.input), sys.stdout, graph=graph, counts=counts)
+        if args.counts:
+            write_counts(counts, args.counts)
+        if args.cache:
+            converter.cache.close()
+        if profiler:
+            write_profile(profiler)
+        return
+
+    # Read in provided files
+    inputs = list(iter_inputs(args.input))
+
+    gout = converter.convert(inputs, counts=counts)
+    if args.counts:
+        write_counts(counts, args.counts)
+    if args.cache:
+        converter.cache.close()
+    if profiler:
+        start = perf_counter()
     if outfmt == "html":
-        outstr = graph_to_html(gout)
-    elif outfmt == "json-ld":
-        jsonld_context = {}
-        for ns, base in dict(gout.namespaces()).items():
-            jsonld_context[ns] = str(base)
-        jsonld_context = {"@context": jsonld_context}
-        outstr = gout.serialize(format=outfmt, context=jsonld_context)
+        # Stream the HTML unit by unit, or split it into pages
+        if args.html_dir:
+            write_html_pages(gout, args.html_dir, page_size=args.page_size, lang=converter.lang)
+        else:
+            write_html(gout, sys.stdout, lang=converter.lang)
     else:
-        outstr = gout.serialize(format=outfmt)
+        outstr = serialize_graph(gout, outfmt, lang=converter.lang)
+        if profiler:
+            profiler.on_stage("serialize", perf_counter() - start)
+            start = perf_counter()
+        sys.stdout.write(outstr)
+    if profiler:
+        profiler.on_stage("write", perf_counter() - start)
+        write_profile(profiler)
+
+
+def iter_inputs(inpt) -> Iterator[str]:
+    """Read UCUM codes one by one from an input stream (one per line) or from the first column of
+    a CSV/TSV file."""
+    if isinstance(inpt, TextIOWrapper):
+        for x in inpt:
+            yield x.strip()
+        return
+    sep = "\t"
+    if inpt.endswith(".csv"):
+        sep = ","
+    with open(inpt, "r", encoding=ENCODING) as f:
+        reader = csv.reader(f, delimiter=sep)
+        for x in reader:
+            yield x[0].strip()
+
+
+def run_resolve(argv):
+    parser = ArgumentParser(
+        prog="uom resolve",
+        description="Resolve IRIs or CURIEs of mapped ontology terms (e.g., QUDT:M-PER-SEC or UO:0000094) to "
+        "the canonical UCUM codes and IRIs of their units, written as TSV (empty if a term cannot be resolved)",
+    )
+    parser.add_argument("terms", nargs="*", help="IRIs or CURIEs (default: read from -i or stdin)")
+    parser.add_argument("-i", "--input", help="Input list of IRIs or CURIEs, or a CSV/TSV file with them in the first column")
+    parser.add_argument("-m", "--mappings", help="External ontology term to UCUM code mappings, added to the default mappings")
+    parser.add_argument(
+        "-b", "--base-iri", default="https://w3id.org/uom/", help="Base IRI for units"
+    )
+    parser.add_argument("--snapshot", help="Resource snapshot (see uom compile-resources)")
+    args = parser.parse_args(argv)
+
+    # Imported here as the resolver only needs the reverse index of the mappings
+    from .resolve import MappingResolver
+
+    resources = load_resources(args.snapshot, mappings=args.mappings)
+    reverse_index = resources["reverse_index"]
+    if args.mappings:
+        # As in uom, the default mappings are added to the given ones (and win for the terms in both)
+        reverse_index = {**reverse_index, **load_resources()["reverse_index"]}
+    resolver = MappingResolver(reverse_index, base_iri=args.base_iri)
+    terms = args.terms or iter_inputs(args.input or sys.stdin)
+    writer = csv.writer(sys.stdout, delimiter="\t", lineterminator="\n")
+    writer.writerow(["term", "ucum_code", "iri"])
+    stats = {"resolved": 0, "not resolved": 0}
+    for term in terms:
+        code = resolver.resolve(term)
+        if code is None:
+            writer.writerow([term, "", ""])
+            stats["not resolved"] += 1
+        else:
+            writer.writerow([term, code, resolver.to_iri(term)])
+            stats["resolved"] += 1
+    sys.stderr.write(", ".join(f"{v} {k}" for k, v in stats.items()) + "\n")
+
+
+def run_serve(argv):
+    parser = ArgumentParser(
+        prog="uom serve",
+        description="Serve units over HTTP: GET /{code} (ttl, json-ld or html by Accept header or "
+        "?format=), POST /batch (a JSON list of codes, or one per line) and GET /_metrics",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument("-s", "--si", help="SI unit labels and codes")
+    parser.add_argument("-p", "--prefixes", help="SI prefix labels and codes")
+    parser.add_argument("-e", "--exponents", help="Exponent labels")
+    parser.add_argument("-m", "--mappings", help="External ontology term to UCUM code mappings")
+    parser.add_argument("-l", "--lang", help=LANG_HELP, default="en")
+    parser.add_argument(
+        "-b", "--base-iri", default="https://w3id.org/uom/", help="Base IRI for units"
+    )
+    parser.add_argument("--snapshot", help="Resource snapshot (see uom compile-resources)")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="Number of worker processes (default: 1, a thread of the server)"
+    )
+    parser.add_argument(
+        "--max-concurrency", type=int, help="Maximum number of requests converted at once (default: 2 per job)"
+    )
+    parser.add_argument(
+        "--max-queue", type=int, default=1000, help="Maximum number of requests waiting for a worker (default: 1000)"
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=10000, help="Number of responses to keep in memory (default: 10000)"
+    )
+    args = parser.parse_args(argv)
+
+    # Imported here as the server needs asyncio and the converter
+    import asyncio
+    from .server import UnitServer, serve
+
+    resources = load_resources(
+        args.snapshot, args.si, args.prefixes, args.exponents, args.mappings, lang=args.lang
+    )
+    converter_args = {
+        "ucum_si": resources["ucum_si"],
+        "unit_prefixes": resources["unit_prefixes"],
+        "unit_exponents": resources["unit_exponents"],
+        "mappings": resources["mappings"] if args.mappings else {},
+        "base_iri": args.base_iri,
+        "lang": args.lang,
+    }
+    server = UnitServer(
+        converter_args,
+        jobs=args.jobs,
+        max_concurrency=args.max_concurrency,
+        max_queue=args.max_queue,
+        cache_size=args.cache_size,
+    )
+    sys.stderr.write(f"Serving units on http://{args.host}:{args.port}/\n")
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_update(argv):
+    # Imported here as the registry needs the converter and rdflib
+    from .convert import UnitConverter
+    from .registry import REGISTRY_FORMATS, update_registry
+
+    parser = ArgumentParser(
+        prog="uom update",
+        description="Build a registry of units, or update it in place, converting only the codes that "
+        "are new or whose rows in the resource tables changed since the last build",
+    )
+    parser.add_argument("input", help="Input list of all UCUM codes of the registry")
+    parser.add_argument("-o", "--output", required=True, help="Registry path (a manifest is kept next to it)")
+    parser.add_argument(
+        "-f", "--format", default="ttl", help=f"Output format: {', '.join(REGISTRY_FORMATS)} (default: ttl)"
+    )
+    parser.add_argument("-s", "--si", help="SI unit labels and codes")
+    parser.add_argument("-p", "--prefixes", help="SI prefix labels and codes")
+    parser.add_argument("-e", "--exponents", help="Exponent labels")
+    parser.add_argument("-m", "--mappings", help="External ontology term to UCUM code mappings")
+    parser.add_argument("-l", "--lang", help=LANG_HELP, default="en")
+    parser.add_argument(
+        "-b", "--base-iri", default="https://w3id.org/uom/", help="Base IRI for units"
+    )
+    parser.add_argument("--snapshot", help="Resource snapshot (see uom compile-resources)")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="Number of worker processes to convert the codes in (default: 1)"
+    )
+    parser.add_argument("--cache", help="SQLite cache of converted units to share between runs (see uom cache)")
+    args = parser.parse_args(argv)
+
+    resources = load_resources(
+        args.snapshot, args.si, args.prefixes, args.exponents, args.mappings, lang=args.lang
+    )
+    converter = UnitConverter(
+        resources["ucum_si"],
+        resources["unit_prefixes"],
+        resources["unit_exponents"],
+        resources["mappings"] if args.mappings else {},
+        base_iri=args.base_iri,
+        lang=args.lang,
+        fail_on_err=True,
+        jobs=args.jobs,
+        cache=SQLiteCache(args.cache) if args.cache else None,
+    )
+    stats = update_registry(converter, iter_inputs(args.input), args.output, args.format)
+    if args.cache:
+        converter.cache.close()
+    sys.stderr.write(", ".join(f"{v} {k}" for k, v in stats.items()) + "\n")
+
+
+def write_counts(counts: dict, path: str):
+    """Write the number of inputs for each canonical UCUM code, and the spellings of the inputs, to
+    a TSV file (most frequent units first)."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(["ucum_code", "inputs", "spellings"])
+        rows = [(code, sum(spellings.values()), " ".join(spellings)) for code, spellings in counts.items()]
+        writer.writerows(sorted(rows, key=lambda row: -row[1]))
+
+
+def write_profile(profiler: Profiler):
+    """Write the summary of a profiler to stderr as JSON."""
+    sys.stderr.write(json.dumps(profiler.summary(), indent=2) + "\n")
+
+
+def run_cache(argv):
+    parser = ArgumentParser(
+        prog="uom cache",
+        description="Show or prune a SQLite cache of converted units (see uom --cache)",
+    )
+    parser.add_argument("action", choices=["prune", "stats"], help="Show statistics or remove records")
+    parser.add_argument("cache", help="SQLite cache path")
+    parser.add_argument(
+        "--max-age", type=float, help="prune: remove records that were not used for this many days"
+    )
+    parser.add_argument(
+        "--stale",
+        action="store_true",
+        help="prune: remove records built from other versions of the tables (-s, -p, -e, -m) in the language",
+    )
+    parser.add_argument("-s", "--si", help="SI unit labels and codes")
+    parser.add_argument("-p", "--prefixes", help="SI prefix labels and codes")
+    parser.add_argument("-e", "--exponents", help="Exponent labels")
+    parser.add_argument("-m", "--mappings", help="External ontology term to UCUM code mappings")
+    parser.add_argument("-l", "--lang", help=LANG_HELP, default="en")
+    args = parser.parse_args(argv)
+
+    cache = SQLiteCache(args.cache)
+    if args.action == "stats":
+        sys.stdout.write(json.dumps(cache.stats(), indent=2) + "\n")
+        cache.close()
+        return
+
+    tables_hash = None
+    if args.stale:
+        # Imported here as only the hash of the tables is needed from the converter
+        from .convert import UnitConverter
+
+        resources = load_resources(None, args.si, args.prefixes, args.exponents, args.mappings, lang=args.lang)
+        converter = UnitConverter(
+            resources["ucum_si"],
+            resources["unit_prefixes"],
+            resources["unit_exponents"],
+            resources["mappings"] if args.mappings else {},
+            lang=args.lang,
+            cache=cache,
+        )
+        tables_hash = converter.tables_hash
+    max_age = args.max_age * 86400 if args.max_age is not None else None
+    count = cache.prune(tables_hash, lang=",".join(get_langs(args.lang)), max_age=max_age)
+    cache.close()
+    sys.stdout.write(f"Removed {count} records\n")
+
+
+def run_compile_resources(argv):
+    parser = ArgumentParser(
+        prog="uom compile-resources",
+        description="Compile the resource tables and their indexes into a binary snapshot, which is "
+        "loaded instead of the tables and rebuilt automatically when any of them changes",
+    )
+    parser.add_argument("-s", "--si", help="SI unit labels and codes")
+    parser.add_argument("-p", "--prefixes", help="SI prefix labels and codes")
+    parser.add_argument("-e", "--exponents", help="Exponent labels")
+    parser.add_argument("-m", "--mappings", help="External ontology term to UCUM code mappings")
+    parser.add_argument("-l", "--lang", help=LANG_HELP, default="en")
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Snapshot path (default: in the cache directory of the user, e.g. ~/.cache/units_of_measurement, "
+        "or in UOM_SNAPSHOT_DIR, if set)",
+    )
+    args = parser.parse_args(argv)
+    path = compile_resources(
+        args.output, args.si, args.prefixes, args.exponents, args.mappings, lang=args.lang
+    )
+    sys.stdout.write(path + "\n")
+
 
-    # Handle backwards compatibility between rdflib 5.x.x and 6.x.x
-    if isinstance(outstr, bytes):
-        outstr = outstr.decode(ENCODING)
-    sys.stdout.write(outstr)
+COMMANDS = {
+    "cache": run_cache,
+    "compile-resources": run_compile_resources,
+    "resolve": run_resolve,
+    "serve": run_serve,
+    "update": run_update,
+}
 
 
 if __name__ == "__main__":
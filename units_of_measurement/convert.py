@@ -1,16 +1,31 @@
-import json
 import logging
 import re
 
-from collections import defaultdict
+from collections import Counter, defaultdict
 from collections.abc import Iterable
-from itertools import permutations, product
-from lark.exceptions import LarkError
-from rdflib import Graph, Literal, Namespace, OWL, RDF, RDFS, SKOS
-from typing import List, Optional
+from io import StringIO
+from itertools import chain, islice, product
+from math import prod
+from rdflib import Graph, Literal, Namespace, OWL, RDF, RDFS, SKOS, URIRef
+from time import perf_counter
+from typing import IO, Dict, Iterator, List, Optional, Tuple, Union
 from urllib.parse import quote as url_quote
-from .grammar import si_grammar, UnitsTransformer
-from .helpers import get_exponents, get_mappings, get_prefixes, get_si_mappings
+from .cache import LRUCache
+from .grammar import scan_code
+from .helpers import get_langs, get_tables_hash
+from .normalize import (
+    DEFAULT_BASE_IRI,
+    MAPPING_PREFIXES,
+    ONTOLOGY_PREFIXES,
+    flatten,
+    get_canonical_code,
+    get_canonical_ucum_code,
+    get_sort_key,
+    process_result,
+    UnitPart,
+)
+from .profiling import Observer
+from .snapshot import load_resources
 
 KG_DEFINITION_EN = (
     "An SI base unit which 1) is the SI unit of mass and 2) is defined by taking "
@@ -20,23 +35,19 @@ KG_DEFINITION_EN = (
     "of c and ∆νCs."
 )
 
-QUDT_REGEX = r"(http://qudt.org/vocab/unit/)(.*)"
-OM_REGEX = r"(http://www.ontology-of-units-of-measure.org/resource/om-2/)(.*)"
-UO_REGEX = r"(http://purl.obolibrary.org/obo/UO_)(.*)"
-OBOE_REGEX = r"(http://ecoinformatics.org/oboe/oboe.1.2/oboe-standards.owl#)(.*)"
-NERC_REGEX = r"(http://vocab.nerc.ac.uk/collection/P06/current/)(.*)(/)"
-
-ONTOLOGY_PREFIXES = {
-    "NERC_P06": "http://vocab.nerc.ac.uk/collection/P06/current/",
-    "obo": "http://purl.obolibrary.org/obo/",
-    "OBOE": "http://ecoinformatics.org/oboe/oboe.1.2/oboe-standards.owl#",
-    "OM": "http://www.ontology-of-units-of-measure.org/resource/om-2/",
-    "owl": "http://www.w3.org/2002/07/owl#",
-    "QUDT": "http://qudt.org/vocab/unit/",
-    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
-    "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
-    "skos": "http://www.w3.org/2004/02/skos/core#",
-    "UO": "http://purl.obolibrary.org/obo/UO_",
+# Maximum number of equivalent codes or synonyms generated for one unit
+# (the number of combinations grows exponentially with the number of parts)
+MAX_COMBINATIONS = 256
+
+# Maximum number of annotated parts cached by a converter (see get_annotated_parts)
+TERM_CACHE_SIZE = 16384
+
+# Words that join the labels of the parts of a unit in each language: the separator of the parts,
+# and the words before a denominator and before a unit without numerator. Labels and synonyms are
+# only composed from the words of their language, so that they never mix languages
+CONNECTIVES = {
+    "en": {"sep": " ", "per": "per", "reciprocal": "reciprocal"},
+    "fr": {"sep": " ", "per": "par"},
 }
 
 NERC = Namespace(ONTOLOGY_PREFIXES["NERC_P06"])
@@ -46,207 +57,385 @@ QUDT = Namespace(ONTOLOGY_PREFIXES["QUDT"])
 UO = Namespace(ONTOLOGY_PREFIXES["UO"])
 
 
-def convert(  # noqa: C901
-    inputs: list,
-    ucum_si: dict = None,
-    unit_prefixes: dict = None,
-    unit_exponents: dict = None,
-    mappings: dict = None,
-    base_iri: str = "https://w3id.org/uom/",
-    lang: str = "en",
-    fail_on_err: bool = False,
-    use_default_mappings: bool = True
-) -> Graph:
+class UnitConverter:
     """
-    Generates an RDF graph seeded from an input list of UCUM codes
+    Converts UCUM codes to RDF using resource tables and indexes that are prepared once. Converters
+    do not modify their tables (or any global state) after they are created, so one converter can
+    be shared between threads.
 
-    :param inputs: list of UCUM codes
     :param ucum_si: UCUM symbol -> dict containing symbol, label, and definition
                    (e.g., "A": {"symbol": "A", "label_en": "ampere", "definition_en": "..."})
     :param unit_prefixes: prefix symbol -> label and prefix base 10 number
                     (e.g., "Y": {"label_en": "yotta", "number": 24})
     :param unit_exponents: dict of power to label (e.g., 2: "square")
     :param mappings: mapped ontology term IRI -> list of UCUM codes
-    :param base_iri:
-    :param lang: language for annotations (default: en)
-    :param fail_on_err:
-    :param use_default_mappings:
-    :return: rdflib graph object
+    :param base_iri: base IRI for the "unit" namespace
+    :param lang: language for annotations, or list of languages (or comma-separated languages, e.g.
+                 "en,fr,zh") to annotate each unit in all of them at once; the first language is
+                 the main language of the records (default: en)
+    :param fail_on_err: if True, raise an error on unparseable codes instead of skipping them
+    :param use_default_mappings: if True, add the default mappings to the given mappings
+    :param cache: cache of converted unit records to share between converters; by default, each
+                  converter has its own cache
+    :param jobs: number of worker processes to convert the codes in (default: 1, in this process)
+    :param mapping_prefixes: prefix -> namespace IRI of other ontologies that units can be mapped to
+                             (in addition to MAPPING_PREFIXES)
+    :param observer: receives the duration of each stage and counts of inputs, units, parsed and
+                     failed codes, cache hits and misses, and triples (see profiling.Observer)
+    :param max_combinations: maximum number of equivalent codes and of synonyms generated for one
+                             unit, or None for no limit (default: MAX_COMBINATIONS)
     """
-    # Update prefixes with provided base IRI
-    ONTOLOGY_PREFIXES["unit"] = base_iri
-    gout = Graph()
-    # Add ontology prefixes
-    for ns, base in ONTOLOGY_PREFIXES.items():
-        gout.bind(ns, base)
-
-    # Get the default input files if they were not provided
-    if not ucum_si:
-        ucum_si = get_si_mappings(lang=lang)
-    if not unit_prefixes:
-        unit_prefixes = get_prefixes(lang=lang)
-    if not unit_exponents:
-        unit_exponents = get_exponents(lang=lang)
-    if not mappings and use_default_mappings:
-        # Mappings will not be included if use_default_mappings is false
-        mappings = get_mappings()
-    elif use_default_mappings:
-        # Add default mappings to user-provided mappings
-        mappings.update(get_mappings())
-
-    # Create two-wap equivalent code mappings
-    eq_codes = defaultdict(set)
-    for ucum_symbol, details in ucum_si.items():
-        eq_code = details["equivalent_code"]
-        if not eq_code:
-            continue
-        if ucum_symbol not in eq_codes:
-            eq_codes[ucum_symbol] = set()
-        for ec in eq_code.split("|"):
-            if ec not in eq_codes:
-                eq_codes[ec] = set()
-            eq_codes[ec].add(ucum_symbol)
-            eq_codes[ucum_symbol].add(ec)
 
-    # Process given inputs
-    for inpt in inputs:
-        # Parse the input with Lark
-        try:
-            tree = si_grammar.parse(inpt)
-            result = UnitsTransformer().transform(tree)
-        except (LarkError, TypeError) as exc:
-            if fail_on_err:
-                raise ValueError(f"Could not process '{inpt}' with SI parser") from exc
-            logging.error(f"Could not process '{inpt}' with SI parser - this input will be skipped")
-            continue
+    def __init__(
+        self,
+        ucum_si: dict = None,
+        unit_prefixes: dict = None,
+        unit_exponents: dict = None,
+        mappings: dict = None,
+        base_iri: str = DEFAULT_BASE_IRI,
+        lang: Union[str, List[str]] = "en",
+        fail_on_err: bool = False,
+        use_default_mappings: bool = True,
+        cache: LRUCache = None,
+        jobs: int = 1,
+        mapping_prefixes: Dict[str, str] = None,
+        observer: Observer = None,
+        max_combinations: Optional[int] = MAX_COMBINATIONS,
+    ):
+        if jobs < 1:
+            raise ValueError(f"Number of jobs must be >= 1, got {jobs}")
+        langs = get_langs(lang)
+        # Get the default input files if they were not provided
+        # (the default mappings are the same for any language)
+        defaults = {}
+        if not ucum_si or not unit_prefixes or not unit_exponents:
+            defaults = load_resources(lang=langs)
+        elif use_default_mappings:
+            defaults = load_resources()
+        self.ucum_si = ucum_si or defaults["ucum_si"]
+        self.unit_prefixes = unit_prefixes or defaults["unit_prefixes"]
+        self.unit_exponents = unit_exponents or defaults["unit_exponents"]
+        self.mappings_index = None
+        if not mappings and use_default_mappings:
+            # Mappings will not be included if use_default_mappings is false
+            self.mappings = defaults["mappings"]
+            self.mappings_index = defaults["mappings_index"]
+        elif use_default_mappings:
+            # Add default mappings to user-provided mappings
+            self.mappings = {**mappings, **defaults["mappings"]}
+        else:
+            self.mappings = mappings or {}
 
-        # Attempt to flatten the result tree
-        try:
-            res_flat = flatten(result)
-        except RecursionError as exc:
-            if fail_on_err:
-                raise RecursionError(f"Could not flatten result from '{inpt}'") from exc
-            logging.error(f"Could not flatten result from '{inpt}' - this input will be skipped")
-            continue
+        # Create two-wap equivalent code mappings
+        if self.ucum_si is defaults.get("ucum_si"):
+            self.eq_codes = defaults["eq_codes"]
+        else:
+            self.eq_codes = get_two_way_equivalent_codes(self.ucum_si)
 
-        # Convert result into list of dicts
-        processed_units = []
-        for r in res_flat:
-            processed_units.append(process_result(r, inpt))
-
-        # Determine type SI vs. conventional to optionally add SI codes
-        types = [u["type"] for u in processed_units]
-
-        num_list = []
-        denom_list = []
-        for u in processed_units:
-            # Optionally add SI codes
-            if "conventional" not in types:
-                # Create the SI code from prefix & unit
-                symbol_code = get_symbol_code(u, ucum_si)
-                if symbol_code:
-                    u["si_code"] = symbol_code
-
-            # Create the UCUM codes from prefix & unit
-            u["ucum_code"] = u["prefix"] + u["unit"]
-
-            # Try to use the parsed output to create equivalent units
-            u["equivalent_codes"] = [u["prefix"] + x for x in get_equivalent_units(ucum_si, u)]
-
-            # Create label from units & prefixes
-            label = get_label_part(u, ucum_si, unit_prefixes, unit_exponents, lang=lang)
-            if label:
-                u[f"label_{lang}"] = label
-            else:
-                raise ValueError(f"Could not create a label for '{inpt}'")
+        # Index the mapped ontology terms by canonical UCUM code
+        if self.mappings_index is None:
+            self.mappings_index = get_mappings_index(self.mappings)
 
-            # Create synonyms from units & prefixes (empty list if there are none)
-            u[f"exact_synonym_{lang}"] = get_synonyms_part(
-                u, ucum_si, unit_prefixes, unit_exponents, lang=lang
+        # Resolve each mapped ontology term IRI to its term once
+        # (the default mappings are resolved when the snapshot is compiled)
+        if self.mappings is defaults.get("mappings") and not mapping_prefixes:
+            self.mapped_terms = {iri: URIRef(term) for iri, term in defaults["mapped_terms"].items()}
+        else:
+            self.mapped_terms = get_mapped_terms(self.mappings, mapping_prefixes)
+
+        self.base_iri = base_iri
+        # The main language, and all the languages of the annotations
+        self.lang = langs[0]
+        self.langs = langs
+        self.fail_on_err = fail_on_err
+        self.jobs = jobs
+        self.observer = observer
+        self.max_combinations = max_combinations
+        self.namespaces = {**ONTOLOGY_PREFIXES, **(mapping_prefixes or {}), "unit": base_iri}
+        # Annotated parts, shared by the codes converted with these tables (see get_annotated_parts)
+        self.terms = LRUCache(TERM_CACHE_SIZE)
+
+        # Records in a shared cache are also keyed by the contents of the tables and the limit of
+        # combinations
+        if cache is None:
+            self.cache = LRUCache()
+            self.tables_hash = None
+        else:
+            self.cache = cache
+            self.tables_hash = get_tables_hash(
+                self.ucum_si, self.unit_prefixes, self.unit_exponents, self.mappings, max_combinations
             )
 
-            # Split numerator and denominator into two lists
-            if str(u["exponent"])[0] == "-":
-                denom_list.append(u)
-            else:
-                num_list.append(u)
+    def convert(self, inputs: Iterable, counts: Dict[str, Counter] = None) -> Graph:
+        """Generate an RDF graph from the UCUM codes in inputs, converting each distinct unit once.
+        counts, if given, gets the number of inputs per canonical UCUM code and spelling added to it
+        (see group_inputs)."""
+        gout = Graph()
+        # Add ontology prefixes
+        for ns, base in self.namespaces.items():
+            gout.bind(ns, base)
+        for record, _ in self.iter_units(inputs, counts=counts):
+            triples = self.get_triples(record)
+            if self.observer is not None:
+                start = perf_counter()
+            for t in triples:
+                gout.add(t)
+            if self.observer is not None:
+                self.observer.on_stage("graph", perf_counter() - start)
+        if self.observer is not None:
+            self.observer.on_count("triples", len(gout))
+        return gout
+
+    def convert_one(self, inpt: str) -> List[tuple]:
+        """Get the triples for one UCUM code (an empty list if it cannot be processed)."""
+        record = self.get_record(inpt)
+        if record is None:
+            return []
+        return self.get_triples(record)
+
+    def get_cache_key(self, inpt: str) -> tuple:
+        """Get the key of the record for one UCUM code in the cache."""
+        return inpt, ",".join(self.langs), self.base_iri, self.tables_hash
+
+    def get_record(self, inpt: str, fail_on_err: bool = None) -> Optional[dict]:
+        """Get the (cached) record of annotations for one UCUM code, or None if it cannot be
+        processed. See get_unit_record. fail_on_err overrides the setting of the converter."""
+        observer = self.observer
+        key = self.get_cache_key(inpt)
+        if observer is not None:
+            start = perf_counter()
+        record = self.cache.get(key)
+        if observer is not None:
+            observer.on_stage("cache", perf_counter() - start)
+            observer.on_count("cache_misses" if record is None else "cache_hits")
+        if record is None:
+            try:
+                record = get_unit_record(
+                    inpt,
+                    self.ucum_si,
+                    self.unit_prefixes,
+                    self.unit_exponents,
+                    self.mappings_index,
+                    self.eq_codes,
+                    lang=self.langs,
+                    fail_on_err=self.fail_on_err if fail_on_err is None else fail_on_err,
+                    observer=observer,
+                    terms=self.terms,
+                    max_combinations=self.max_combinations,
+                )
+            except ValueError:
+                if observer is not None:
+                    observer.on_count("failed")
+                raise
+            if observer is not None:
+                observer.on_count("failed" if record is None else "parsed")
+            if record is not None:
+                self.cache.put(key, record)
+        return record
+
+    def get_triples(self, record: dict) -> List[tuple]:
+        """Get the triples for the record of a unit. See get_triples."""
+        if self.observer is None:
+            return get_triples(**record, lang=self.lang, base_iri=self.base_iri, mapped_terms=self.mapped_terms)
+        start = perf_counter()
+        triples = get_triples(**record, lang=self.lang, base_iri=self.base_iri, mapped_terms=self.mapped_terms)
+        self.observer.on_stage("triples", perf_counter() - start)
+        return triples
+
+    def group_inputs(self, inputs: Iterable) -> Dict[str, Counter]:
+        """Deduplicate the UCUM codes in inputs and group their spellings by canonical UCUM code
+        (e.g., "m/s" and "s-1.m" -> "m.s-1"), counting the inputs with each spelling. Codes that
+        cannot be parsed are grouped under the code itself."""
+        if self.observer is not None:
+            start = perf_counter()
+        groups = {}
+        for inpt in inputs:
+            canonical = get_canonical_code(inpt) or inpt
+            groups.setdefault(canonical, Counter())[inpt] += 1
+        if self.observer is not None:
+            self.observer.on_stage("group", perf_counter() - start)
+            self.observer.on_count("inputs", sum(sum(counts.values()) for counts in groups.values()))
+            self.observer.on_count("units", len(groups))
+        return groups
+
+    def iter_convert(self, inputs: Iterable) -> Iterator[tuple]:
+        """Generate the triples for each distinct unit in the UCUM codes in inputs."""
+        for record, _ in self.iter_units(inputs):
+            yield from self.get_triples(record)
+
+    def group_records(self, inputs: Iterable) -> Tuple[Dict[str, Counter], Dict[str, Optional[dict]]]:
+        """Convert the UCUM codes in inputs (see iter_records) and group their spellings by the
+        canonical UCUM code of their records, as group_inputs does without converting them. Returns
+        the groups, and the record of the first spelling of each group (None if it cannot be processed)."""
+        groups = {}
+        records = {}
+        for inpt, record in self.iter_records(inputs):
+            canonical = record["ucum_codes"][0] if record else inpt
+            if canonical not in groups:
+                groups[canonical] = Counter()
+                records[canonical] = record
+            groups[canonical][inpt] += 1
+        if self.observer is not None:
+            self.observer.on_count("inputs", sum(sum(counts.values()) for counts in groups.values()))
+            self.observer.on_count("units", len(groups))
+        return groups, records
+
+    def iter_groups(
+        self, groups: Dict[str, Counter], records: Dict[str, Optional[dict]] = None
+    ) -> Iterator[Tuple[dict, Counter]]:
+        """Convert each unit in the output of group_inputs once, or get it from the records of the
+        first spelling of each group if given (see group_records). See iter_units."""
+        if records is None:
+            # The first spelling of each unit is converted
+            spellings = (next(iter(counts)) for counts in groups.values())
+            group_records = (record for _, record in self.iter_records(spellings))
+        else:
+            group_records = (records[canonical] for canonical in groups)
+        for record, counts in zip(group_records, groups.values()):
+            if record is None:
+                continue
+            ucum_codes = record["ucum_codes"] + [s for s in counts if s not in record["ucum_codes"]]
+            yield {**record, "ucum_codes": ucum_codes}, counts
+
+    def iter_records(self, inputs: Iterable) -> Iterator[Tuple[str, Optional[dict]]]:
+        """Lazily get each of the UCUM codes in inputs with its record (None for codes that cannot
+        be processed). With more than one job, the codes are converted in a pool of worker
+        processes, and the records are still yielded in the order of the inputs."""
+        if self.jobs > 1:
+            # Imported here as the worker processes import this module
+            from .parallel import iter_records_parallel
+
+            yield from iter_records_parallel(self, inputs, self.jobs)
+            return
+        for inpt in inputs:
+            yield inpt, self.get_record(inpt)
+
+    def iter_units(self, inputs: Iterable, counts: Dict[str, Counter] = None) -> Iterator[Tuple[dict, Counter]]:
+        """Convert each distinct unit in inputs once (see group_inputs). Yields the record of each unit,
+        with every original spelling added to its UCUM codes, and the number of inputs per spelling.
+        counts, if given, gets the groups of inputs added to it. With more than one job, the distinct
+        spellings are converted by the worker processes, which canonicalize them on the way, and
+        grouped by their records afterwards (see group_records), instead of this process
+        canonicalizing every input before the conversion."""
+        if self.jobs > 1:
+            groups, records = self.group_records(inputs)
+        else:
+            groups, records = self.group_inputs(inputs), None
+        if counts is not None:
+            counts.update(groups)
+        yield from self.iter_groups(groups, records)
 
-        # Sort in canonical alphabetical order
-        try:
-            num_list = sorted(num_list, key=lambda k: (k["ucum_code"].casefold(), k))
-            denom_list = sorted(denom_list, key=lambda k: (k["ucum_code"].casefold(), k))
-        except ValueError as exc:
-            if fail_on_err:
-                raise ValueError(f"Could not sort result from '{inpt}'") from exc
-            logging.error(f"Could not sort result from '{inpt}' - this input will be skipped")
-            continue
 
-        # Generate canonical term label
-        label = get_canonical_label(num_list, denom_list, lang=lang)
+class UnitTerm:
+    """
+    A part of a parsed UCUM code (see normalize.UnitPart) with its annotations in one language:
+    the SI code (None if the part has none), the equivalent UCUM codes, the label and the synonyms.
+    Terms are immutable; the fields of the part are available on the term too.
+    """
 
-        # Generate canonical synonyms
-        synonyms = get_canonical_synonyms(num_list, denom_list, lang=lang)
+    __slots__ = ("part", "si_code", "equivalent_codes", "label", "synonyms")
 
-        # Generate canonical English definition
-        definition = get_canonical_definition(
-            num_list, denom_list, ucum_si, unit_prefixes, unit_exponents, lang=lang
-        )
+    def __init__(
+        self,
+        part: UnitPart,
+        si_code: Optional[str],
+        equivalent_codes: Tuple[str, ...],
+        label: str,
+        synonyms: Tuple[str, ...],
+    ):
+        setattr_ = object.__setattr__
+        setattr_(self, "part", part)
+        setattr_(self, "si_code", si_code)
+        setattr_(self, "equivalent_codes", equivalent_codes)
+        setattr_(self, "label", label)
+        setattr_(self, "synonyms", synonyms)
 
-        # Generate canonical SI code
-        # TODO: fix superscript issue with fstrings
-        si_code = get_canonical_si_code(num_list, denom_list)
-
-        # Generate canonical UCUM code
-        ucum_codes = [get_canonical_ucum_code(num_list, denom_list)]
-        alt_code = get_alternative_ucum_code(ucum_codes[0])
-        if alt_code != ucum_codes[0]:
-            ucum_codes.append(alt_code)
-
-        # Generate equivalent UCUM codes
-        equivalent_codes = get_equivalent_ucum_codes(num_list, denom_list)
-
-        # Add any codes from the two-way mappings based on the canonical code
-        for uc in ucum_codes:
-            if uc in eq_codes and eq_codes[uc] not in equivalent_codes:
-                equivalent_codes.extend(eq_codes[uc])
-
-        # Generate list of UCUM codes from results
-        ucum_si_list = get_si_ucum_list(processed_units)
-
-        # Map UCUM codes to external ontologies
-        # TODO: change this to use mappings of UCUM strings by calling phase 2 on Simon's mappings
-        mappings_complete = [
-            iri
-            for iri, ucum_codes in mappings.items()
-            if set(ucum_si_list).intersection(set(ucum_codes))
-        ]
-
-        # Format TTL from parser results
-        triples = get_triples(
-            ucum_codes,
-            equivalent_codes,
-            label,
-            synonyms,
-            si_code,
-            definition,
-            mappings_complete,
-            lang=lang,
-        )
-        for t in triples:
-            gout.add(t)
-    return gout
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return UnitTerm, (self.part, self.si_code, self.equivalent_codes, self.label, self.synonyms)
+
+    def __repr__(self):
+        return f"UnitTerm({self.part!r}, label={self.label!r})"
+
+    @property
+    def exponent(self) -> int:
+        return self.part.exponent
 
+    @property
+    def prefix(self) -> str:
+        return self.part.prefix
 
-def flatten(x):
+    @property
+    def sort_key(self) -> tuple:
+        return self.part.sort_key
+
+    @property
+    def ucum_code(self) -> str:
+        return self.part.ucum_code
+
+    @property
+    def unit(self) -> str:
+        return self.part.unit
+
+
+def convert(
+    inputs: list,
+    ucum_si: dict = None,
+    unit_prefixes: dict = None,
+    unit_exponents: dict = None,
+    mappings: dict = None,
+    base_iri: str = DEFAULT_BASE_IRI,
+    lang: Union[str, List[str]] = "en",
+    fail_on_err: bool = False,
+    use_default_mappings: bool = True,
+    cache: LRUCache = None,
+    jobs: int = 1,
+    observer: Observer = None,
+    max_combinations: Optional[int] = MAX_COMBINATIONS,
+) -> Graph:
     """
-    https://stackoverflow.com/questions/42102473/parsing-values-from-a-list-of-dictionaries-with-nested-list-in-python
+    Generates an RDF graph seeded from an input list of UCUM codes. To convert many lists with
+    the same tables, create a UnitConverter once instead.
+
+    :param inputs: list of UCUM codes
+    :param ucum_si: UCUM symbol -> dict containing symbol, label, and definition
+                   (e.g., "A": {"symbol": "A", "label_en": "ampere", "definition_en": "..."})
+    :param unit_prefixes: prefix symbol -> label and prefix base 10 number
+                    (e.g., "Y": {"label_en": "yotta", "number": 24})
+    :param unit_exponents: dict of power to label (e.g., 2: "square")
+    :param mappings: mapped ontology term IRI -> list of UCUM codes
+    :param base_iri:
+    :param lang: language for annotations, or list of languages (see UnitConverter) (default: en)
+    :param fail_on_err:
+    :param use_default_mappings:
+    :param cache: cache of converted unit records to share between calls; by default, repeated
+                  codes are only converted once per call
+    :param jobs: number of worker processes to convert the codes in (default: 1, in this process)
+    :param observer: receives the duration of each stage and counts (see profiling.Observer)
+    :param max_combinations: maximum number of equivalent codes and of synonyms generated for one
+                             unit, or None for no limit (default: MAX_COMBINATIONS)
+    :return: rdflib graph object
     """
-    if isinstance(x, dict):
-        return [x]
-    elif isinstance(x, Iterable):
-        return [a for i in x for a in flatten(i)]
-    else:
-        return [x]
+    converter = UnitConverter(
+        ucum_si,
+        unit_prefixes,
+        unit_exponents,
+        mappings,
+        base_iri=base_iri,
+        lang=lang,
+        fail_on_err=fail_on_err,
+        use_default_mappings=use_default_mappings,
+        cache=cache,
+        jobs=jobs,
+        observer=observer,
+        max_combinations=max_combinations,
+    )
+    return converter.convert(inputs)
 
 
 def get_alternative_ucum_code(ucum_code):
@@ -272,43 +461,79 @@ def get_alternative_ucum_code(ucum_code):
     return "".join(alt_code)
 
 
-def get_canonical_label(num_list: List[dict], denom_list: List[dict], lang: str = "en") -> str:
-    """Use the processed numerators and denominators from a unit input to create a label."""
-    if not denom_list:
-        # No denominators
-        return " ".join([n[f"label_{lang}"] for n in num_list])
-    elif not num_list:
-        # No numerators
-        result = ["reciprocal"]
-        result.extend([d[f"label_{lang}"] for d in denom_list])
-        return " ".join(result)
-    # Mix of numerators and denominators
-    result = []
-    result.extend([n[f"label_{lang}"] for n in num_list])
-    result.append("per")
-    result.extend([d[f"label_{lang}"] for d in denom_list])
-    return " ".join(result)
+def get_annotated_parts(
+    inpt: str,
+    processed_units: List[UnitPart],
+    ucum_si: dict,
+    unit_prefixes: dict,
+    unit_exponents: dict,
+    lang: str = "en",
+    terms: LRUCache = None,
+) -> Tuple[List[UnitTerm], List[UnitTerm]]:
+    """Get the codes, label and synonyms of each part of a parsed UCUM code (see process_result)
+    as terms, split into numerator and denominator lists. terms is a cache of the terms of each
+    part that was already annotated with the same tables, by part and language."""
+    # Determine type SI vs. conventional to optionally add SI codes
+    has_si_codes = all(u.type != "conventional" for u in processed_units)
+
+    num_list = []
+    denom_list = []
+    for u in processed_units:
+        key = (u, has_si_codes, lang)
+        term = terms.get(key) if terms is not None else None
+        if term is None:
+            term = get_unit_term(inpt, u, has_si_codes, ucum_si, unit_prefixes, unit_exponents, lang=lang)
+            if terms is not None:
+                terms.put(key, term)
+
+        # Split numerator and denominator into two lists
+        if u.exponent < 0:
+            denom_list.append(term)
+        else:
+            num_list.append(term)
+    return num_list, denom_list
+
+
+def get_canonical_label(
+    num_list: List[UnitTerm], denom_list: List[UnitTerm], lang: str = "en"
+) -> Optional[str]:
+    """Use the processed numerators and denominators from a unit input to create a label, or None
+    if a word that joins the parts is missing in the language (see CONNECTIVES)."""
+    words = CONNECTIVES.get(lang, {})
+    result = [n.label for n in num_list]
+    if denom_list:
+        # "per" between numerators and denominators, or "reciprocal" if there are no numerators
+        result.append(words.get("per" if num_list else "reciprocal"))
+        result.extend([d.label for d in denom_list])
+    sep = words.get("sep") if len(result) > 1 else ""
+    if sep is None or None in result:
+        return None
+    return sep.join(result)
 
 
 def get_canonical_definition(  # noqa: C901
-    num_list: List[dict],
-    denom_list: List[dict],
+    num_list: List[UnitTerm],
+    denom_list: List[UnitTerm],
     ucum_si: dict,
     unit_prefixes: dict,
     unit_exponents: dict,
     lang: str = "en",
 ) -> Optional[str]:
-    """Used the processed numerators and denominators from a unit to create a definition."""
-    if not denom_list and len(num_list) == 1 and num_list[0]["exponent"] == 1:
+    """Used the processed numerators and denominators from a unit to create a definition. Only
+    the definitions of single units come from the SI table; the others are English sentences, so
+    they are only created in English."""
+    if not denom_list and len(num_list) == 1 and num_list[0].exponent == 1:
         # No denominators and an SI base with no exponent
-        prefix = num_list[0].get("prefix", "")
-        unit = num_list[0]["unit"]
+        prefix = num_list[0].prefix
+        unit = num_list[0].unit
         unit_details = ucum_si.get(unit, {})
         if prefix == "":
             # No prefix
             if unit_details:
                 return unit_details[f"definition_{lang}"]
             return None
+        elif lang != "en":
+            return None
         elif prefix == "k" and unit == "g":
             # Special case for kg
             return KG_DEFINITION_EN
@@ -323,6 +548,8 @@ def get_canonical_definition(  # noqa: C901
         else:
             prefix_num = prefix_details["number"]
         return f"A unit which is equal to 10{prefix_num} {si_label}."
+    elif lang != "en":
+        return None
     elif not denom_list:
         # No denominators
         definition_parts = get_definition_parts(
@@ -357,94 +584,96 @@ def get_canonical_definition(  # noqa: C901
     return None
 
 
-def get_canonical_si_code(num_list: List[dict], denom_list: List[dict]) -> Optional[str]:
+def get_canonical_si_code(num_list: List[UnitTerm], denom_list: List[UnitTerm]) -> Optional[str]:
     # TODO: use a dict of exponents mapping to f string superscript nums to write out superscript
     #       OR use the prefix numbers
     return_lst = []
     for n in num_list:
-        if "si_code" in n:
-            if str(n["exponent"]) == "1":
-                return_lst.append(n["si_code"])
+        if n.si_code is not None:
+            if n.exponent == 1:
+                return_lst.append(n.si_code)
             else:
-                return_lst.append(n["si_code"] + str(n["exponent"]))
+                return_lst.append(n.si_code + str(n.exponent))
         else:
             return None
     for n in denom_list:
-        if "si_code" in n:
-            return_lst.append(n["si_code"] + str(n["exponent"]))
+        if n.si_code is not None:
+            return_lst.append(n.si_code + str(n.exponent))
     return " ".join(return_lst)
 
 
-def get_equivalent_ucum_codes(num_list: List[dict], denom_list: List[dict]) -> List[str]:
+def get_equivalent_ucum_codes(
+    num_list: List[UnitTerm], denom_list: List[UnitTerm], limit: Optional[int] = MAX_COMBINATIONS
+) -> List[str]:
     """Use the processed numerators and denominators from a unit input to create a list of all
-    possible equivalent UCUM codes."""
+    possible equivalent UCUM codes (at most limit codes)."""
     possible_codes = []
     has_eq_code = False
     for n in num_list:
-        eq_codes = n["equivalent_codes"]
+        eq_codes = n.equivalent_codes
         if eq_codes:
             has_eq_code = True
         else:
-            eq_codes = [n["ucum_code"]]
-        if str(n["exponent"]) == "1":
+            eq_codes = [n.ucum_code]
+        if n.exponent == 1:
             possible_codes.append(eq_codes)
         else:
-            possible_codes.append([x + str(n["exponent"]) for x in eq_codes])
+            possible_codes.append([x + str(n.exponent) for x in eq_codes])
     for n in denom_list:
-        eq_codes = n["equivalent_codes"]
+        eq_codes = n.equivalent_codes
         if eq_codes:
             has_eq_code = True
         else:
-            eq_codes = [n["ucum_code"]]
-        possible_codes.append([x + str(n["exponent"]) for x in eq_codes])
+            eq_codes = [n.ucum_code]
+        possible_codes.append([x + str(n.exponent) for x in eq_codes])
     if not has_eq_code:
         return []
-    return [".".join(x) for x in product(*possible_codes)]
+    return list(iter_combinations(possible_codes, limit=limit))
 
 
 def get_canonical_synonyms(
-    num_list: List[dict], denom_list: List[dict], lang: str = "en"
+    num_list: List[UnitTerm],
+    denom_list: List[UnitTerm],
+    lang: str = "en",
+    limit: Optional[int] = MAX_COMBINATIONS,
 ) -> List[str]:
     """Use the processed numerators and denominators from a unit input to create a list of all
-    possible synonyms."""
+    possible synonyms (at most limit synonyms), or none if a word that joins the parts is missing
+    in the language (see CONNECTIVES)."""
+    words = CONNECTIVES.get(lang, {})
+    sep = words.get("sep") if len(num_list) + len(denom_list) > 1 or denom_list else " "
+    connective = words.get("per" if num_list else "reciprocal") if denom_list else ""
+    if sep is None or connective is None:
+        return []
     if not denom_list:
         # No denominators
-        return get_possible_synonyms(num_list, lang=lang)
+        return get_possible_synonyms(num_list, lang=lang, limit=limit, sep=sep)
     elif not num_list:
         # No numerators
-        return get_possible_synonyms(denom_list, lang=lang, reciprocal=True)
+        return [connective + sep + x for x in get_possible_synonyms(denom_list, lang=lang, limit=limit, sep=sep)]
     # Mix of numerators and denominators
-    num_synonyms = get_possible_synonyms(num_list, lang=lang)
-    denom_synonyms = get_possible_synonyms(denom_list, lang=lang)
+    num_synonyms = get_possible_synonyms(num_list, lang=lang, limit=limit, sep=sep)
+    denom_synonyms = get_possible_synonyms(denom_list, lang=lang, limit=limit, sep=sep)
     if not num_synonyms and not denom_synonyms:
         return []
     if not num_synonyms:
         # Synonyms exist for denominator, use label in place of numerator(s)
-        num_synonyms = [" ".join([x[f"label_{lang}"] for x in num_list])]
+        num_synonyms = [sep.join([x.label for x in num_list])]
     if not denom_synonyms:
         # Synonyms exist for numerator, use label in place of denominator(s)
-        denom_synonyms = [" ".join([x[f"label_{lang}"] for x in denom_list])]
-    return [" ".join(x) for x in product(num_synonyms, ["per"], denom_synonyms)]
-
-
-def get_canonical_ucum_code(num_list: List[dict], denom_list: List[dict]) -> str:
-    return_lst = []
-    for n in num_list:
-        return_lst.append(get_ucum_code_part(n, numerator=True))
-    for n in denom_list:
-        return_lst.append(get_ucum_code_part(n))
-    return ".".join(return_lst)
+        denom_synonyms = [sep.join([x.label for x in denom_list])]
+    return list(iter_combinations([num_synonyms, [connective], denom_synonyms], sep=sep, limit=limit))
 
 
-def get_curie(iri):
-    for ns, base in ONTOLOGY_PREFIXES.items():
+def get_curie(iri, prefixes: dict = None):
+    for ns, base in (prefixes or ONTOLOGY_PREFIXES).items():
         if iri.startswith(base):
             return iri.replace(base, ns + ":")
     return iri
 
 
 def get_definition_parts(
-    units_list: List[dict],
+    units_list: List[UnitTerm],
     umuc_si: dict,
     unit_prefixes: dict,
     unit_exponents: dict,
@@ -453,16 +682,16 @@ def get_definition_parts(
     """Get a definition for this part of the parsed term."""
     return_lst = []
     for u in units_list:
-        unit_details = umuc_si.get(u["unit"])
+        unit_details = umuc_si.get(u.unit)
         if not unit_details:
-            logging.error("Unknown unit: " + u["unit"])
+            logging.error("Unknown unit: " + u.unit)
             return None
 
         unit = unit_details[f"label_{lang}"]
         power = get_exponent(u, unit_exponents, lang=lang)
 
         # Get the prefix
-        prefix_details = unit_prefixes.get(u["prefix"])
+        prefix_details = unit_prefixes.get(u.prefix)
         if prefix_details:
             # Check if this prefix has a number
             prefix_num = prefix_details.get("number")
@@ -481,9 +710,9 @@ def get_definition_parts(
     return return_lst
 
 
-def get_equivalent_units(ucum_si, unit):
+def get_equivalent_units(ucum_si, unit: UnitPart):
     """Get a list of equivalent UCUM codes for a given unit."""
-    unit_details = ucum_si.get(unit["unit"])
+    unit_details = ucum_si.get(unit.unit)
     if unit_details:
         eq_code = unit_details["equivalent_code"]
         if eq_code:
@@ -491,9 +720,9 @@ def get_equivalent_units(ucum_si, unit):
     return []
 
 
-def get_exponent(result: dict, unit_exponents: dict, lang: str = "en") -> Optional[str]:
+def get_exponent(result: UnitPart, unit_exponents: dict, lang: str = "en") -> Optional[str]:
     """Get an exponent label based on the parsed result."""
-    power = str(result["exponent"]).replace("-", "")
+    power = str(abs(result.exponent))
     power_details = unit_exponents.get(power)
     if not power_details:
         return None
@@ -501,28 +730,34 @@ def get_exponent(result: dict, unit_exponents: dict, lang: str = "en") -> Option
 
 
 def get_label_part(
-    result: dict, ucum_si: dict, unit_prefixes: dict, unit_exponents: dict, lang: str = "en"
+    result: UnitPart, ucum_si: dict, unit_prefixes: dict, unit_exponents: dict, lang: str = "en"
 ) -> Optional[str]:
     """Get the label for this part of the parsed term."""
     # Get prefix
-    prefix_details = unit_prefixes.get(result["prefix"])
+    prefix_details = unit_prefixes.get(result.prefix)
     if prefix_details:
         prefix = prefix_details[f"label_{lang}"]
+        if not prefix:
+            # The prefix has no label in this language (see helpers.get_prefixes)
+            return None
     else:
         prefix = ""
 
     # Maybe get unit
-    unit_details = ucum_si.get(result["unit"])
+    unit_details = ucum_si.get(result.unit)
     if not unit_details:
-        logging.warning("No 'unit' entry in results:\n" + json.dumps(result, indent=4))
+        logging.warning(f"No 'unit' entry in results: {result!r}")
         unit = None
     else:
         unit = unit_details[f"label_{lang}"]
-        if unit == "are" and prefix in ["hecto", "deca"]:
+        if unit == "are" and result.prefix in ["h", "da"]:
             prefix = prefix[:-1]
 
     # Check for an exponent & return formatted string
     power = get_exponent(result, unit_exponents, lang=lang)
+    if power == "":
+        # The exponent has no label in this language (see helpers.get_exponents)
+        return None
     if power is None and unit is None:
         return prefix
     elif power is None:
@@ -530,118 +765,158 @@ def get_label_part(
     return power + " " + prefix + unit
 
 
-def get_possible_codes(lst, denominator: bool = False):
-    code_order = []
-    has_eq_code = False
-    for n in lst:
-        eq_codes = n["equivalent_codes"]
-        if not eq_codes:
-            eq_codes = [n["ucum_code"]]
+def get_mapped_term(iri: str, prefixes: List[Tuple[str, str]]) -> Optional[URIRef]:
+    """Get the term for a mapped ontology term IRI from a list of (namespace IRI, suffix), most
+    specific namespace first, or None if the IRI is not in any of the namespaces."""
+    for namespace, suffix in prefixes:
+        if iri.startswith(namespace) and iri.endswith(suffix) and len(iri) > len(namespace) + len(suffix):
+            return URIRef(iri[:len(iri) - len(suffix)])
+    return None
+
+
+def get_mapped_terms(mappings: Iterable, mapping_prefixes: Dict[str, str] = None) -> Dict[str, URIRef]:
+    """
+    Resolve mapped ontology term IRIs to their terms, warning once for each IRI that is not in the
+    namespace of a known ontology.
+
+    :param mappings: mapped ontology term IRIs (e.g., the keys of the mappings table)
+    :param mapping_prefixes: prefix -> namespace IRI of other ontologies (see UnitConverter)
+    :return: IRI -> term for each IRI in a known namespace
+    """
+    prefixes = [(ONTOLOGY_PREFIXES[p], suffix) for p, suffix in MAPPING_PREFIXES.items()]
+    prefixes.extend((namespace, "") for namespace in (mapping_prefixes or {}).values())
+    prefixes.sort(key=lambda x: -len(x[0]))
+    mapped_terms = {}
+    for iri in mappings:
+        mapped_term = get_mapped_term(iri, prefixes)
+        if mapped_term is None:
+            logging.warning("Unknown mapping: " + iri)
         else:
-            has_eq_code = True
-        if denominator or (str(n["exponent"]) == "1"):
-            eq_codes = [x + str(n["exponent"]) for x in eq_codes]
-        code_order.append(eq_codes)
-    if not has_eq_code:
-        return []
-    return [".".join(x) for x in product(*code_order)]
+            mapped_terms[iri] = mapped_term
+    return mapped_terms
+
 
+def get_mappings_index(mappings: dict) -> Dict[str, List[str]]:
+    """Invert the mapped ontology term IRI -> list of UCUM codes to get the canonical UCUM code
+    -> list of mapped ontology term IRIs. Codes that cannot be parsed are left out."""
+    mappings_index = defaultdict(list)
+    for iri, ucum_codes in mappings.items():
+        for ucum_code in ucum_codes:
+            canonical_code = get_canonical_code(ucum_code)
+            if canonical_code and iri not in mappings_index[canonical_code]:
+                mappings_index[canonical_code].append(iri)
+    return mappings_index
 
-def get_possible_synonyms(lst, lang: str = "en", reciprocal: bool = False):
+
+def get_possible_synonyms(
+    lst, lang: str = "en", reciprocal: bool = False, limit: Optional[int] = MAX_COMBINATIONS, sep: str = " "
+):
     """Return a list of synonyms that contains all possible in-order permutations of the
-    synonym parts."""
+    synonym parts, joined with sep (at most limit synonyms)."""
     synonym_order = []
     has_synonym = False
     for n in lst:
-        synonyms = n[f"exact_synonym_{lang}"]
+        synonyms = n.synonyms
         if not synonyms:
             # Use the label for this part in place of synonym
-            synonym_order.append([n[f"label_{lang}"]])
+            synonym_order.append([n.label])
             continue
         has_synonym = True
         synonym_order.append(synonyms)
     if not has_synonym:
         return []
-    combinations = product(*synonym_order)
+    combinations = iter_combinations(synonym_order, sep=sep, limit=limit)
     if reciprocal:
-        return ["reciprocal " + " ".join(x) for x in combinations]
+        return ["reciprocal " + x for x in combinations]
     else:
-        return [" ".join(x) for x in combinations]
-
-
-def get_si_ucum_list(dict_list: List[dict]) -> List[str]:
-    """
-    Create permutations of possible UCUM strings for input unit list
-    E.g., 'm.s-1' -> ['m.s-1', 's-1.m']
-    https://www.geeksforgeeks.org/generate-all-the-permutation-of-a-list-in-python/
-    At the moment only handels the ucum "." cases not the "/" cases
-    TODO: add the / UCUM cases
-    """
-    return_list = []
-    code_exp_list = []
-    for d in dict_list:
-        if d["exponent"] == 1:
-            exp = ""
-        else:
-            exp = str(d["exponent"])
-        x = d["ucum_code"] + exp
-        code_exp_list.append(x)
-    code_exp_list = list(permutations(code_exp_list))
-
-    for p in code_exp_list:
-        ucum_str_list = []
-        for i in p:
-            ucum_str_list.append(i)
-        outstr = ".".join(ucum_str_list)
-        return_list.append(outstr)
-    return return_list
+        return list(combinations)
 
 
-def get_symbol_code(result: dict, ucum_si: dict) -> Optional[str]:
+def get_symbol_code(result: UnitPart, ucum_si: dict) -> Optional[str]:
     """Get a code str based on prefix and unit."""
-    result_unit = result["unit"]
+    result_unit = result.unit
     unit_details = ucum_si.get(result_unit)
     if not unit_details:
         logging.warning(f"No SI code for '{result_unit}'")
         return None
     unit = unit_details["symbol"]
-    pref = result.get("prefix", "")
-    return pref + unit
+    return result.prefix + unit
 
 
 def get_synonyms_part(
-    result: dict, ucum_si: dict, unit_prefixes: dict, unit_exponents: dict, lang: str = "en"
+    result: UnitPart, ucum_si: dict, unit_prefixes: dict, unit_exponents: dict, lang: str = "en"
 ) -> Optional[List[str]]:
     """Get a list of synonyms for this part of the parsed term."""
     # Get prefix
-    prefix_details = unit_prefixes.get(result["prefix"])
+    prefix_details = unit_prefixes.get(result.prefix)
     if prefix_details:
         prefix = prefix_details[f"label_{lang}"]
     else:
         prefix = ""
 
     # Maybe get unit
-    unit_details = ucum_si.get(result["unit"])
+    unit_details = ucum_si.get(result.unit)
     if not unit_details:
-        logging.warning("No 'unit' entry in results:\n" + json.dumps(result, indent=4))
+        logging.warning(f"No 'unit' entry in results: {result!r}")
         return []
     synonyms = unit_details.get(f"exact_synonym_{lang}")
     if not synonyms:
         return []
 
+    # The last vowel of hecto and deca is elided before "are" (hectare, decare)
+    are_prefix = prefix[:-1] if result.prefix in ["h", "da"] else prefix
+
     # Check for an exponent & add formatted string
     unit_synonyms = []
     power = get_exponent(result, unit_exponents, lang=lang)
     for unit in synonyms.split("|"):
-        if unit == "are" and prefix in ["hecto", "deca"]:
-            prefix = prefix[:-1]
+        unit_prefix = are_prefix if unit == "are" else prefix
         if power is None:
-            unit_synonyms.append(prefix + unit)
+            unit_synonyms.append(unit_prefix + unit)
             continue
-        unit_synonyms.append(power + " " + prefix + unit)
+        unit_synonyms.append(power + " " + unit_prefix + unit)
     return unit_synonyms
 
 
+def get_translations(
+    inpt: str,
+    processed_units: List[UnitPart],
+    ucum_si: dict,
+    unit_prefixes: dict,
+    unit_exponents: dict,
+    langs: List[str],
+    terms: LRUCache = None,
+    max_combinations: Optional[int] = MAX_COMBINATIONS,
+) -> Dict[str, dict]:
+    """Get the label, synonyms (at most max_combinations) and definition of a parsed UCUM code in
+    each of langs, reusing the parsed parts (and the annotated parts in terms). Languages in which
+    a part or a word that joins the parts has no label are left out, so that labels never mix
+    languages."""
+    translations = {}
+    for lang in langs:
+        try:
+            num_list, denom_list = get_annotated_parts(
+                inpt, processed_units, ucum_si, unit_prefixes, unit_exponents, lang=lang, terms=terms
+            )
+        except ValueError:
+            logging.warning(f"Could not create a label for '{inpt}' in '{lang}'")
+            continue
+        num_list = sorted(num_list, key=get_sort_key)
+        denom_list = sorted(denom_list, key=get_sort_key)
+        label = get_canonical_label(num_list, denom_list, lang=lang)
+        if label is None:
+            logging.warning(f"Could not create a label for '{inpt}' in '{lang}'")
+            continue
+        translations[lang] = {
+            "label": label,
+            "synonyms": get_canonical_synonyms(num_list, denom_list, lang=lang, limit=max_combinations),
+            "definition": get_canonical_definition(
+                num_list, denom_list, ucum_si, unit_prefixes, unit_exponents, lang=lang
+            ),
+        }
+    return translations
+
+
 def get_triples(  # noqa: C901
     ucum_codes: List[str],
     equivalent_codes: List[str],
@@ -651,9 +926,16 @@ def get_triples(  # noqa: C901
     definition: str,
     mappings: List[str],
     lang: str = "en",
+    base_iri: str = DEFAULT_BASE_IRI,
+    mapped_terms: Dict[str, URIRef] = None,
+    translations: Dict[str, dict] = None,
 ) -> List[tuple]:
+    # Resolve the mapped ontology term IRIs, unless they were resolved when the mappings were loaded
+    if mapped_terms is None:
+        mapped_terms = get_mapped_terms(mappings)
+
     # Create an identifier from the UCUM code
-    unit_ns = Namespace(ONTOLOGY_PREFIXES["unit"])
+    unit_ns = Namespace(base_iri)
     # The canonical UCUM code is the first entry in the list
     term = unit_ns[url_quote(ucum_codes[0])]
     # Assert that this is an owl instance & add unit annotation properties
@@ -675,6 +957,13 @@ def get_triples(  # noqa: C901
             triples.append((term, SKOS.altLabel, Literal(syn, lang=lang)))
     if definition:
         triples.append((term, SKOS.definition, Literal(definition, lang=lang)))
+    # Add annotations in the other languages (see get_translations)
+    for other_lang, annotations in (translations or {}).items():
+        triples.append((term, RDFS.label, Literal(annotations["label"], lang=other_lang)))
+        for syn in annotations["synonyms"]:
+            triples.append((term, SKOS.altLabel, Literal(syn, lang=other_lang)))
+        if annotations["definition"]:
+            triples.append((term, SKOS.definition, Literal(annotations["definition"], lang=other_lang)))
     if si_code:
         triples.append((term, unit_ns.SI_code, Literal(si_code)))
     for uc in ucum_codes:
@@ -684,167 +973,341 @@ def get_triples(  # noqa: C901
 
     # Add mappings (if present)
     for m in mappings:
-        if re.search(QUDT_REGEX, m):
-            match = re.search(QUDT_REGEX, m)
-            qudt_id = match.group(2)
-            mapped_term = QUDT[qudt_id]
-        elif re.search(OM_REGEX, m):
-            match = re.search(OM_REGEX, m)
-            om_id = match.group(2)
-            mapped_term = OM[om_id]
-        elif re.search(UO_REGEX, m):
-            match = re.search(UO_REGEX, m)
-            uo_id = match.group(2)
-            mapped_term = UO[uo_id]
-        elif re.search(OBOE_REGEX, m):
-            match = re.search(OBOE_REGEX, m)
-            oboe_id = match.group(2)
-            mapped_term = OBOE[oboe_id]
-        elif re.search(NERC_REGEX, m):
-            match = re.search(NERC_REGEX, m)
-            nerc_id = match.group(2)
-            mapped_term = NERC[nerc_id]
-        else:
-            logging.warning("Unknown mapping: " + m)
-            continue
-        triples.append((term, SKOS.exactMatch, mapped_term))
+        mapped_term = mapped_terms.get(m)
+        if mapped_term is not None:
+            triples.append((term, SKOS.exactMatch, mapped_term))
     return triples
 
 
-def get_ucum_code_part(part, numerator: bool = False):
-    """Use the parsed part to create the UCUM code.
-    If the part is a numerator, only include exponent if exponent != 1."""
-    if numerator and str(part["exponent"]) == "1":
-        return part["ucum_code"]
-    return part["ucum_code"] + str(part["exponent"])
+def get_two_way_equivalent_codes(ucum_si: dict) -> Dict[str, set]:
+    """Get the equivalent codes of each UCUM symbol in both directions, i.e., if 'L' has the
+    equivalent code 'l', the result contains 'L' -> {'l'} and 'l' -> {'L'}."""
+    eq_codes = defaultdict(set)
+    for ucum_symbol, details in ucum_si.items():
+        eq_code = details["equivalent_code"]
+        if not eq_code:
+            continue
+        if ucum_symbol not in eq_codes:
+            eq_codes[ucum_symbol] = set()
+        for ec in eq_code.split("|"):
+            if ec not in eq_codes:
+                eq_codes[ec] = set()
+            eq_codes[ec].add(ucum_symbol)
+            eq_codes[ucum_symbol].add(ec)
+    return eq_codes
 
 
-def graph_to_html(gout: Graph, rdf_type=OWL.NamedIndividual) -> str:  # noqa: C901
-    """Convert an rdflib Graph containing UCUM triples to HTML+RDFa."""
-    # Create the RDFa prefix string
-    prefixes = []
-    for ns, base in ONTOLOGY_PREFIXES.items():
-        prefixes.append(f"{ns}: {base}")
-    prefixes = "\n".join(prefixes)
-    html = [f'<div prefix="{prefixes}">']
+def get_unit_term(
+    inpt: str,
+    part: UnitPart,
+    has_si_code: bool,
+    ucum_si: dict,
+    unit_prefixes: dict,
+    unit_exponents: dict,
+    lang: str = "en",
+) -> UnitTerm:
+    """Get the codes, label and synonyms of one part of a parsed UCUM code. The part only has an SI
+    code if has_si_code (i.e., no part of the code is a conventional unit)."""
+    # Optionally add SI codes, created from prefix & unit
+    si_code = get_symbol_code(part, ucum_si) if has_si_code else None
 
-    # Get all labels
+    # Try to use the parsed output to create equivalent units
+    equivalent_codes = tuple(part.prefix + x for x in get_equivalent_units(ucum_si, part))
+
+    # Create label from units & prefixes
+    label = get_label_part(part, ucum_si, unit_prefixes, unit_exponents, lang=lang)
+    if not label:
+        raise ValueError(f"Could not create a label for '{inpt}' in '{lang}'")
+
+    # Create synonyms from units & prefixes (empty if there are none)
+    synonyms = tuple(get_synonyms_part(part, ucum_si, unit_prefixes, unit_exponents, lang=lang))
+    return UnitTerm(part, si_code or None, equivalent_codes, label, synonyms)
+
+
+def get_unit_record(  # noqa: C901
+    inpt: str,
+    ucum_si: dict,
+    unit_prefixes: dict,
+    unit_exponents: dict,
+    mappings_index: dict,
+    eq_codes: dict,
+    lang: Union[str, List[str]] = "en",
+    fail_on_err: bool = False,
+    observer: Observer = None,
+    terms: LRUCache = None,
+    max_combinations: Optional[int] = MAX_COMBINATIONS,
+) -> Optional[dict]:
+    """Parse a UCUM code and build the annotations for its unit. The returned record holds the
+    keyword arguments for get_triples, or None if the input could not be processed. With more than
+    one language, the code is parsed and its codes are built once, and the record also holds the
+    annotations in the other languages (see get_translations). The observer, if any, receives the
+    durations of the parse, labels and codes stages. terms, if given, caches the annotated parts
+    between codes (see get_annotated_parts). At most max_combinations equivalent codes and synonyms
+    (in each language) are generated, or all of them if None."""
+    langs = get_langs(lang)
+    lang = langs[0]
+    if observer is not None:
+        start = perf_counter()
+
+    # Scan codes made only of units and exponents directly, and parse any other input with Lark
+    res_flat = scan_code(inpt)
+    if res_flat is None:
+        # Imported here as lark is only needed for the codes that cannot be scanned
+        from .si_parser import parse_code
+
+        try:
+            result = parse_code(inpt)
+        except (TypeError, ValueError) as exc:
+            if fail_on_err:
+                raise ValueError(f"Could not process '{inpt}' with SI parser") from exc
+            logging.error(f"Could not process '{inpt}' with SI parser - this input will be skipped")
+            return None
+
+        # Attempt to flatten the result tree
+        try:
+            res_flat = flatten(result)
+        except RecursionError as exc:
+            if fail_on_err:
+                raise RecursionError(f"Could not flatten result from '{inpt}'") from exc
+            logging.error(f"Could not flatten result from '{inpt}' - this input will be skipped")
+            return None
+
+    # Convert result into list of dicts
+    processed_units = []
+    for r in res_flat:
+        processed_units.append(process_result(r, inpt))
+
+    if observer is not None:
+        observer.on_stage("parse", perf_counter() - start)
+        start = perf_counter()
+
+    # Generate canonical term label, from the words of the main language only, as in the others
+    # (see get_translations)
+    try:
+        num_list, denom_list = get_annotated_parts(
+            inpt, processed_units, ucum_si, unit_prefixes, unit_exponents, lang=lang, terms=terms
+        )
+    except ValueError:
+        num_list = denom_list = None
+
+    if num_list is not None:
+        # Sort in canonical alphabetical order (parts are totally ordered, see UnitPart)
+        num_list = sorted(num_list, key=get_sort_key)
+        denom_list = sorted(denom_list, key=get_sort_key)
+        label = get_canonical_label(num_list, denom_list, lang=lang)
+    if num_list is None or label is None:
+        if fail_on_err:
+            raise ValueError(f"Could not create a label for '{inpt}' in '{lang}'")
+        logging.error(f"Could not create a label for '{inpt}' in '{lang}' - this input will be skipped")
+        return None
+
+    # Generate canonical synonyms
+    synonyms = get_canonical_synonyms(num_list, denom_list, lang=lang, limit=max_combinations)
+
+    # Generate canonical English definition
+    definition = get_canonical_definition(
+        num_list, denom_list, ucum_si, unit_prefixes, unit_exponents, lang=lang
+    )
+
+    # Annotate the same parts in the other languages
+    translations = None
+    if len(langs) > 1:
+        translations = get_translations(
+            inpt,
+            processed_units,
+            ucum_si,
+            unit_prefixes,
+            unit_exponents,
+            langs[1:],
+            terms=terms,
+            max_combinations=max_combinations,
+        )
+
+    if observer is not None:
+        observer.on_stage("labels", perf_counter() - start)
+        start = perf_counter()
+
+    # Generate canonical SI code
+    # TODO: fix superscript issue with fstrings
+    si_code = get_canonical_si_code(num_list, denom_list)
+
+    # Generate canonical UCUM code
+    ucum_codes = [get_canonical_ucum_code(num_list, denom_list)]
+    alt_code = get_alternative_ucum_code(ucum_codes[0])
+    if alt_code != ucum_codes[0]:
+        ucum_codes.append(alt_code)
+
+    # Generate equivalent UCUM codes
+    equivalent_codes = get_equivalent_ucum_codes(num_list, denom_list, limit=max_combinations)
+
+    # Add any codes from the two-way mappings based on the canonical code
+    for uc in ucum_codes:
+        if uc in eq_codes and eq_codes[uc] not in equivalent_codes:
+            # Sorted so that records do not depend on the hash seed of the (worker) process
+            equivalent_codes.extend(sorted(eq_codes[uc]))
+
+    # Map the canonical UCUM code to external ontologies
+    mappings_complete = list(mappings_index.get(ucum_codes[0], []))
+
+    if observer is not None:
+        observer.on_stage("codes", perf_counter() - start)
+
+    record = {
+        "ucum_codes": ucum_codes,
+        "equivalent_codes": equivalent_codes,
+        "label": label,
+        "synonyms": synonyms,
+        "si_code": si_code,
+        "definition": definition,
+        "mappings": mappings_complete,
+    }
+    if translations is not None:
+        record["translations"] = translations
+    return record
+
+
+def get_html_labels(gout: Graph, lang: str = "en") -> Dict[str, str]:
+    """Get the IRI -> label of the nodes in a graph for HTML output: the label in lang (the main
+    language), or else the untagged label (e.g., of the annotation properties)."""
     labels = {}
+    untagged = {}
     for node, val in gout.subject_objects(RDFS.label):
-        if labels:
+        language = getattr(val, "language", None)
+        if language == lang:
             labels[str(node)] = str(val)
-        else:
-            labels[str(node)] = str(val)
-
-    # Get the attributes of all individuals (the UCUM codes)
-    node_attributes = []
+        elif language is None:
+            untagged[str(node)] = str(val)
+    return {**untagged, **labels}
+
+
+def get_html_namespaces(gout: Graph) -> Dict[str, str]:
+    """Get the prefixes used for the CURIEs in HTML output: the ontology prefixes and the "unit"
+    namespace of the graph, as it depends on the base IRI."""
+    namespaces = dict(ONTOLOGY_PREFIXES)
+    unit_base = dict(gout.namespaces()).get("unit")
+    if unit_base:
+        namespaces["unit"] = str(unit_base)
+    return namespaces
+
+
+def get_html_nodes(gout: Graph, labels: Dict[str, str], rdf_type=OWL.NamedIndividual) -> List[Tuple[str, str]]:
+    """Get the label and IRI of each individual (UCUM unit) in a graph, sorted by label. Units
+    without a label are labelled with their CURIE."""
+    namespaces = get_html_namespaces(gout)
+    nodes = []
     for node in gout.subjects(RDF.type, rdf_type):
         iri = str(node)
-        predicate_values = defaultdict(set)
-        predicate_objects = defaultdict(set)
-        for predicate, obj in gout.predicate_objects(node):
-            p_iri = str(predicate)
-            if isinstance(obj, Literal):
-                if p_iri not in predicate_values:
-                    predicate_values[p_iri] = set()
-                predicate_values[p_iri].add(str(obj))
-            else:
-                if p_iri not in predicate_objects:
-                    predicate_objects[p_iri] = set()
-                predicate_objects[p_iri].add(str(obj))
-        node_curie = get_curie(iri)
-        node_label = labels.get(iri, node_curie)
-        node_attributes.append(
-            {
-                "iri": iri,
-                "curie": node_curie,
-                "label": node_label,
-                "values": predicate_values,
-                "objects": predicate_objects,
-            }
-        )
-
-    # For each node, generate the HTML
-    for attributes in sorted(node_attributes, key=lambda k: k["label"]):
-        iri = attributes["iri"]
-        node_curie = attributes["curie"]
-        node_label = attributes["label"]
-        predicate_objects = attributes["objects"]
-        predicate_values = attributes["values"]
-        html.append(f'<div resource="{node_curie}">')
-        html.append(f"  <h3>{node_label}</h3>")
-        html.append(f'  <p class="lead">{iri}</h5>')
-        html.append("  <ul>")
-        # Handle objects
-        for predicate, objects in predicate_objects.items():
-            predicate_curie = get_curie(predicate)
-            predicate_label = labels.get(predicate, predicate_curie)
-            html.append("    <li>")
-            html.append(f'      <a href="{predicate}">{predicate_label}</a>')
-            html.append("      <ul>")
-            for o in objects:
-                object_curie = get_curie(o)
-                object_label = labels.get(o, object_curie)
-                html.append("        <li>")
-                html.append(
-                    f'{10 * " "}<a rel="{predicate_curie}" resource="{object_curie}" href="{o}">'
-                )
-                html.append((12 * " ") + object_label)
-                html.append(f'{10 * " "}</a>')
-                html.append("        </li>")
-            html.append("      </ul>")
-        # Handle literals
-        for predicate, values in predicate_values.items():
-            predicate_curie = get_curie(predicate)
-            predicate_label = labels.get(predicate, predicate_curie)
-            html.append("    <li>")
-            html.append(f'      <a href="{predicate}">{predicate_label}</a>')
-            html.append("      <ul>")
-            for val in values:
-                html.append(f'        <li><span property="{predicate_curie}">{val}</span></li>')
-            html.append("      </ul>")
-            html.append("    </li>")
-        html.append("  </ul>")
-        html.append("</div>")
+        nodes.append((labels.get(iri) or get_curie(iri, namespaces), iri))
+    return sorted(nodes)
+
+
+def get_html_unit(
+    gout: Graph, iri: str, label: str, labels: Dict[str, str], namespaces: Dict[str, str], curies: Dict[str, str]
+) -> str:
+    """Get the HTML+RDFa of one unit, with its objects and literal values (sorted). The CURIEs of
+    the IRIs are looked up in curies, and added to it if they are missing."""
+    predicate_values = defaultdict(list)
+    predicate_objects = defaultdict(list)
+    for predicate, obj in gout.predicate_objects(URIRef(iri)):
+        if isinstance(obj, Literal):
+            predicate_values[str(predicate)].append(str(obj))
+        else:
+            predicate_objects[str(predicate)].append(str(obj))
+    for x in chain([iri], predicate_objects, predicate_values, *predicate_objects.values()):
+        if x not in curies:
+            curies[x] = get_curie(x, namespaces)
+
+    node_curie = curies[iri]
+    html = [f'<div resource="{node_curie}">']
+    html.append(f"  <h3>{label}</h3>")
+    html.append(f'  <p class="lead">{iri}</h5>')
+    html.append("  <ul>")
+    # Handle objects
+    for predicate in sorted(predicate_objects):
+        predicate_curie = curies[predicate]
+        predicate_label = labels.get(predicate, predicate_curie)
+        html.append("    <li>")
+        html.append(f'      <a href="{predicate}">{predicate_label}</a>')
+        html.append("      <ul>")
+        for o in sorted(set(predicate_objects[predicate])):
+            object_curie = curies[o]
+            object_label = labels.get(o, object_curie)
+            html.append("        <li>")
+            html.append(f'{10 * " "}<a rel="{predicate_curie}" resource="{object_curie}" href="{o}">')
+            html.append((12 * " ") + object_label)
+            html.append(f'{10 * " "}</a>')
+            html.append("        </li>")
+        html.append("      </ul>")
+    # Handle literals
+    for predicate in sorted(predicate_values):
+        predicate_curie = curies[predicate]
+        predicate_label = labels.get(predicate, predicate_curie)
+        html.append("    <li>")
+        html.append(f'      <a href="{predicate}">{predicate_label}</a>')
+        html.append("      <ul>")
+        for val in sorted(set(predicate_values[predicate])):
+            html.append(f'        <li><span property="{predicate_curie}">{val}</span></li>')
+        html.append("      </ul>")
+        html.append("    </li>")
+    html.append("  </ul>")
     html.append("</div>")
     return "\n".join(html)
 
 
-def process_result(result: dict, original: str) -> dict:
+def graph_to_html(gout: Graph, rdf_type=OWL.NamedIndividual, lang: str = "en") -> str:
+    """Convert an rdflib Graph containing UCUM triples to HTML+RDFa. See write_html."""
+    output = StringIO()
+    write_html(gout, output, rdf_type=rdf_type, lang=lang)
+    return output.getvalue()
+
+
+def iter_combinations(
+    options: List[List[str]], sep: str = ".", limit: Optional[int] = MAX_COMBINATIONS
+) -> Iterator[str]:
+    """Lazily join each in-order combination of one option per part, stopping after limit
+    combinations (None for no limit), with a warning if some combinations are left out."""
+    if limit is not None:
+        total = prod(len(x) for x in options)
+        if total > limit:
+            first = sep.join(x[0] for x in options)
+            logging.warning(f"Keeping {limit} of the {total} combinations of '{first}' (see max_combinations)")
+    return islice((sep.join(x) for x in product(*options)), limit)
+
+
+def write_html(
+    gout: Graph,
+    output: IO,
+    rdf_type=OWL.NamedIndividual,
+    nodes: List[Tuple[str, str]] = None,
+    labels: Dict[str, str] = None,
+    lang: str = "en",
+) -> int:
     """
-    Removes operators "." or "/" to get this back `'operator': '.',`
-    Deals with start = "/" special case
-    Writes out all terms with prefixes (empty string if none exist)
-    Write out all terms with exponents (including 1 if none exist)
+    Write the units in an rdflib Graph containing UCUM triples to a text stream as HTML+RDFa, sorted
+    by label. Each unit is written as soon as it is rendered, so that the page is never held in
+    memory.
+
+    :param gout: graph of units
+    :param output: text stream to write to
+    :param rdf_type: type of the units in the graph
+    :param nodes: (label, IRI) of the units to write, in order (default: all, see get_html_nodes)
+    :param labels: IRI -> label of the nodes in the graph (default: built from the graph, see
+                   get_html_labels)
+    :param lang: language of the labels (the main language of the graph)
+    :return: number of units written
     """
-    # Get prefix if existing:
-    if "prefix" in result:
-        prefix = result["prefix"]
-    else:
-        prefix = ""
+    namespaces = get_html_namespaces(gout)
+    if labels is None:
+        labels = get_html_labels(gout, lang=lang)
+    if nodes is None:
+        nodes = get_html_nodes(gout, labels, rdf_type)
 
-    if result.get("operator") == "/":
-        # if it doesn't have an exponent key create one at -1 else change exp to -
-        if "exponent" not in result:
-            x = {
-                "prefix": prefix,
-                "type": result["type"],
-                "unit": result["unit"],
-                "exponent": int("-1"),
-            }
-            return x
-        exp = int("-" + str(result["exponent"]))
-        x = {"prefix": prefix, "type": result["type"], "unit": result["unit"], "exponent": exp}
-        return x
-    # no operator or . case
-    # Get or create exponent
-    if "exponent" in result and original[0] == "/":
-        exponent = int("-" + str(result["exponent"]))
-    elif "exponent" in result:
-        exponent = result["exponent"]
-    elif original[0] == "/":
-        exponent = -1
-    else:
-        exponent = 1
-    x = {"prefix": prefix, "type": result["type"], "unit": result["unit"], "exponent": exponent}
-    return x
+    # Create the RDFa prefix string
+    prefixes = "\n".join(f"{ns}: {base}" for ns, base in namespaces.items())
+    output.write(f'<div prefix="{prefixes}">')
+    curies = {}
+    for label, iri in nodes:
+        output.write("\n")
+        output.write(get_html_unit(gout, iri, label, labels, namespaces, curies))
+    output.write("\n</div>")
+    return len(nodes)
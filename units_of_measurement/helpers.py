@@ -1,18 +1,27 @@
 import csv
+import hashlib
+import json
 import os
 
 from collections import defaultdict
-from typing import Dict
+from typing import Dict, Iterable, List, Tuple, Union
 
 ENCODING = "utf-8-sig"
 
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "resources")
+SI_FILE = os.path.join(RESOURCES_DIR, "si_input.csv")
+PREFIXES_FILE = os.path.join(RESOURCES_DIR, "prefixes.csv")
+EXPONENTS_FILE = os.path.join(RESOURCES_DIR, "exponents.csv")
+MAPPINGS_FILE = os.path.join(RESOURCES_DIR, "mappings.csv")
+CONVERSIONS_FILE = os.path.join(RESOURCES_DIR, "conversions.csv")
 
-def get_si_mappings(filepath: str = None, lang: str = "en") -> Dict[str, dict]:
-    label_key = f"label_{lang}"
-    def_key = f"definition_{lang}"
-    syn_key = f"exact_synonym_{lang}"
+
+def get_si_mappings(filepath: str = None, lang: Union[str, Iterable[str]] = "en") -> Dict[str, dict]:
+    """Read the SI table with the labels, definitions and synonyms in each language (see get_langs).
+    Values in a language that the table has no column for are empty."""
+    keys = [f"{key}_{lang}" for lang in get_langs(lang) for key in ["label", "definition", "exact_synonym"]]
     ucum_si = {}
-    si_file = filepath or os.path.join(os.path.dirname(__file__), "resources/si_input.csv")
+    si_file = filepath or SI_FILE
     sep = "\t"
     if si_file.endswith(".csv"):
         sep = ","
@@ -21,45 +30,83 @@ def get_si_mappings(filepath: str = None, lang: str = "en") -> Dict[str, dict]:
         for row in reader:
             ucum_si[row["UCUM_symbol"]] = {
                 "symbol": row["SI_symbol"],
-                label_key: row[label_key],
-                def_key: row[def_key],
-                syn_key: row[syn_key],
+                **{key: row.get(key) or "" for key in keys},
                 "equivalent_code": row["equivalent_UCUM_code"],
             }
     return ucum_si
 
 
-def get_exponents(filepath: str = None, lang: str = "en") -> Dict[str, dict]:
-    label_key = f"label_{lang}"
+def get_conversions(filepath: str = None) -> Dict[str, Tuple[str, str]]:
+    """Read the conversions table: the value (a number or a fraction, e.g. "1/12") and the unit (a
+    UCUM code, empty if dimensionless) that define each UCUM symbol, e.g. "[ft_i]": ("12", "[in_i]")."""
+    conversions = {}
+    conversions_file = filepath or CONVERSIONS_FILE
+    sep = "\t"
+    if conversions_file.endswith(".csv"):
+        sep = ","
+    with open(conversions_file, "r", encoding=ENCODING) as f:
+        reader = csv.DictReader(f, delimiter=sep)
+        for row in reader:
+            conversions[row["UCUM_symbol"]] = (row["value"], row["unit"])
+    return conversions
+
+
+def get_exponents(filepath: str = None, lang: Union[str, Iterable[str]] = "en") -> Dict[str, dict]:
+    """Read the exponents table with the labels in each language (see get_langs). Labels in a
+    language that the table has no column for are empty."""
+    langs = get_langs(lang)
     unit_exponents = {}
-    exponents_file = filepath or os.path.join(os.path.dirname(__file__), "resources/exponents.csv")
+    exponents_file = filepath or EXPONENTS_FILE
     sep = "\t"
     if exponents_file.endswith(".csv"):
         sep = ","
     with open(exponents_file, "r", encoding=ENCODING) as f:
         reader = csv.DictReader(f, delimiter=sep)
         for row in reader:
-            unit_exponents[row["power"]] = {label_key: row[label_key]}
+            unit_exponents[row["power"]] = {f"label_{lang}": get_label(row, lang) for lang in langs}
     return unit_exponents
 
 
-def get_prefixes(filepath: str = None, lang: str = "en") -> Dict[str, dict]:
-    label_key = f"label_{lang}"
+def get_prefixes(filepath: str = None, lang: Union[str, Iterable[str]] = "en") -> Dict[str, dict]:
+    """Read the prefixes table with the labels in each language (see get_langs). Labels in a
+    language that the table has no column for are empty."""
+    langs = get_langs(lang)
     unit_prefixes = {}
-    prefixes_file = filepath or os.path.join(os.path.dirname(__file__), "resources/prefixes.csv")
+    prefixes_file = filepath or PREFIXES_FILE
     sep = "\t"
     if prefixes_file.endswith(".csv"):
         sep = ","
     with open(prefixes_file, "r", encoding=ENCODING) as f:
         reader = csv.DictReader(f, delimiter=sep)
         for row in reader:
-            unit_prefixes[row["symbol"]] = {label_key: row[label_key], "number": row["prefix_num"]}
+            unit_prefixes[row["symbol"]] = {
+                **{f"label_{lang}": get_label(row, lang) for lang in langs},
+                "number": row["prefix_num"],
+            }
     return unit_prefixes
 
 
+def get_label(row: Dict[str, str], lang: str) -> str:
+    """Get the label in a language from a row of the prefixes or exponents table. If the table has
+    no column for the language, the label is empty, so that no label is composed from it in that
+    language."""
+    return row.get(f"label_{lang}", "")
+
+
+def get_langs(lang: Union[str, Iterable[str]]) -> List[str]:
+    """Get the list of languages from a language, a comma-separated list of languages (e.g.,
+    "en,fr,zh"), or an iterable of languages. The first language is the main language."""
+    if isinstance(lang, str):
+        lang = lang.split(",")
+    langs = list(dict.fromkeys(x.strip() for x in lang if x.strip()))
+    if not langs:
+        raise ValueError("At least one language is required")
+    return langs
+
+
 def get_mappings(filepath: str = None) -> Dict[str, list]:
     mappings = defaultdict(list)
-    mappings_file = filepath or os.path.join(os.path.dirname(__file__), "resources/mappings.csv")
+    mappings_file = filepath or MAPPINGS_FILE
     sep = "\t"
     if mappings_file.endswith(".csv"):
         sep = ","
@@ -71,3 +118,9 @@ def get_mappings(filepath: str = None) -> Dict[str, list]:
                 mappings[iri] = []
             mappings[iri].append(row["UCUM"])
     return mappings
+
+
+def get_tables_hash(*tables) -> str:
+    """Get a SHA-256 hash of the contents of the given resource tables."""
+    content = json.dumps(tables, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
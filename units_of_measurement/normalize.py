@@ -0,0 +1,207 @@
+from collections.abc import Iterable
+from functools import lru_cache, total_ordering
+from typing import List, Optional
+from urllib.parse import quote as url_quote
+from .grammar import scan_code
+
+# Parsing and canonicalization of UCUM codes, without labels, definitions or RDF, so that codes can
+# be resolved to their unit IRIs without importing rdflib
+
+DEFAULT_BASE_IRI = "https://w3id.org/uom/"
+
+ONTOLOGY_PREFIXES = {
+    "NERC_P06": "http://vocab.nerc.ac.uk/collection/P06/current/",
+    "obo": "http://purl.obolibrary.org/obo/",
+    "OBOE": "http://ecoinformatics.org/oboe/oboe.1.2/oboe-standards.owl#",
+    "OM": "http://www.ontology-of-units-of-measure.org/resource/om-2/",
+    "owl": "http://www.w3.org/2002/07/owl#",
+    "QUDT": "http://qudt.org/vocab/unit/",
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+    "skos": "http://www.w3.org/2004/02/skos/core#",
+    "UO": "http://purl.obolibrary.org/obo/UO_",
+}
+
+# Maximum number of memoized canonical codes and of interned parts, so that memory use stays
+# bounded when arbitrary codes are converted (e.g., by clients of the server)
+CANONICAL_CODE_CACHE_SIZE = 16384
+UNIT_PART_CACHE_SIZE = 16384
+
+# Prefixes (in ONTOLOGY_PREFIXES) of the ontologies that units can be mapped to, with the suffix of
+# the mapped IRIs that is not part of the term (e.g., NERC P06 IRIs end with "/")
+MAPPING_PREFIXES = {
+    "NERC_P06": "/",
+    "OBOE": "",
+    "OM": "",
+    "QUDT": "",
+    "UO": "",
+}
+
+
+@total_ordering
+class UnitPart:
+    """
+    One part of a parsed UCUM code: a unit with its prefix ("" if none), type ("metric" or
+    "conventional") and exponent (negative in the denominator), e.g. "km2" in "km2/s" or "s-1".
+
+    Parts are immutable and interned (see get_unit_part), so each distinct part is usually built
+    once and shared by every code it occurs in; parts compare by value, so a part that was evicted
+    from the interned parts and built again is still equal to the others. They are ordered by their canonical sort key: the
+    case-folded UCUM code, then the UCUM code, then the exponent (and the remaining fields, so that
+    the order is total).
+    """
+
+    __slots__ = ("prefix", "unit", "type", "exponent", "ucum_code", "sort_key", "_hash")
+
+    def __init__(self, prefix: str, unit: str, type: str, exponent: int):
+        ucum_code = prefix + unit
+        sort_key = (ucum_code.casefold(), ucum_code, exponent, prefix, type)
+        # Slots are set through object as the parts are immutable
+        setattr_ = object.__setattr__
+        setattr_(self, "prefix", prefix)
+        setattr_(self, "unit", unit)
+        setattr_(self, "type", type)
+        setattr_(self, "exponent", exponent)
+        setattr_(self, "ucum_code", ucum_code)
+        setattr_(self, "sort_key", sort_key)
+        setattr_(self, "_hash", hash(sort_key))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, UnitPart):
+            return NotImplemented
+        return self is other or self.sort_key == other.sort_key
+
+    def __hash__(self):
+        return self._hash
+
+    def __lt__(self, other):
+        if not isinstance(other, UnitPart):
+            return NotImplemented
+        return self.sort_key < other.sort_key
+
+    def __reduce__(self):
+        # Unpickled parts are interned in the receiving process too
+        return get_unit_part, (self.prefix, self.unit, self.type, self.exponent)
+
+    def __repr__(self):
+        return f"UnitPart(prefix={self.prefix!r}, unit={self.unit!r}, type={self.type!r}, exponent={self.exponent!r})"
+
+
+def flatten(x):
+    """
+    https://stackoverflow.com/questions/42102473/parsing-values-from-a-list-of-dictionaries-with-nested-list-in-python
+    """
+    if isinstance(x, dict):
+        return [x]
+    elif isinstance(x, Iterable):
+        return [a for i in x for a in flatten(i)]
+    else:
+        return [x]
+
+
+@lru_cache(maxsize=CANONICAL_CODE_CACHE_SIZE)
+def get_canonical_code(code: str) -> Optional[str]:
+    """Parse a UCUM code and return its canonical UCUM code, or None if it cannot be parsed."""
+    try:
+        processed_units = get_unit_parts(code)
+    except (TypeError, ValueError, RecursionError):
+        return None
+    num_list = sorted(u for u in processed_units if u.exponent >= 0)
+    denom_list = sorted(u for u in processed_units if u.exponent < 0)
+    return get_canonical_ucum_code(num_list, denom_list)
+
+
+def get_canonical_ucum_code(num_list: List[UnitPart], denom_list: List[UnitPart]) -> str:
+    return_lst = []
+    for n in num_list:
+        return_lst.append(get_ucum_code_part(n, numerator=True))
+    for n in denom_list:
+        return_lst.append(get_ucum_code_part(n))
+    return ".".join(return_lst)
+
+
+def get_sort_key(part: UnitPart) -> tuple:
+    """Get the key to sort parsed parts (or annotated terms, see convert.UnitTerm) in canonical
+    alphabetical order (see UnitPart)."""
+    return part.sort_key
+
+
+def get_ucum_code_part(part: UnitPart, numerator: bool = False):
+    """Use the parsed part to create the UCUM code.
+    If the part is a numerator, only include exponent if exponent != 1."""
+    if numerator and part.exponent == 1:
+        return part.ucum_code
+    return part.ucum_code + str(part.exponent)
+
+
+@lru_cache(maxsize=UNIT_PART_CACHE_SIZE)
+def get_unit_part(prefix: str, unit: str, type: str, exponent: int) -> UnitPart:
+    """Get the interned part with these fields, building it the first time it is seen (the least
+    recently used parts are evicted beyond UNIT_PART_CACHE_SIZE parts)."""
+    return UnitPart(prefix, unit, type, exponent)
+
+
+def get_unit_parts(code: str) -> List[UnitPart]:
+    """Parse a UCUM code into its parts, each with a prefix, unit, type and exponent. Raises a
+    TypeError, ValueError or RecursionError if the code cannot be parsed."""
+    res_flat = scan_code(code)
+    if res_flat is None:
+        # Imported here as lark is only needed for the codes that cannot be scanned
+        from .si_parser import parse_code
+
+        res_flat = flatten(parse_code(code))
+    return [process_result(r, code) for r in res_flat]
+
+
+def normalize(code: str) -> Optional[str]:
+    """Get the canonical UCUM code of a UCUM code (e.g., 'm.s-1' for 'm/s'), or None if it cannot
+    be parsed. This is the cheapest way to resolve a code: results are cached, and no labels,
+    definitions, or triples are built."""
+    return get_canonical_code(code)
+
+
+def process_result(result: dict, original: str) -> UnitPart:
+    """
+    Removes operators "." or "/" to get this back `'operator': '.',`
+    Deals with start = "/" special case
+    Writes out all terms with prefixes (empty string if none exist)
+    Write out all terms with exponents (including 1 if none exist)
+    """
+    # Get prefix if existing:
+    if "prefix" in result:
+        prefix = result["prefix"]
+    else:
+        prefix = ""
+
+    if result.get("operator") == "/":
+        # if it doesn't have an exponent key create one at -1 else change exp to -
+        if "exponent" not in result:
+            return get_unit_part(prefix, result["unit"], result["type"], -1)
+        exp = int("-" + str(result["exponent"]))
+        return get_unit_part(prefix, result["unit"], result["type"], exp)
+    # no operator or . case
+    # Get or create exponent
+    if "exponent" in result and original[0] == "/":
+        exponent = int("-" + str(result["exponent"]))
+    elif "exponent" in result:
+        exponent = result["exponent"]
+    elif original[0] == "/":
+        exponent = -1
+    else:
+        exponent = 1
+    return get_unit_part(prefix, result["unit"], result["type"], exponent)
+
+
+def to_iri(code: str, base_iri: str = DEFAULT_BASE_IRI) -> Optional[str]:
+    """Get the IRI of the unit of a UCUM code, i.e., base_iri + the percent-encoded canonical code
+    (the subject of the unit in the output of convert), or None if the code cannot be parsed."""
+    canonical = get_canonical_code(code)
+    if canonical is None:
+        return None
+    return base_iri + url_quote(canonical)
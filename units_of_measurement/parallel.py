@@ -0,0 +1,79 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Number of codes sent to a worker process at a time
+DEFAULT_CHUNK_SIZE = 256
+
+# Tables of the converter in this worker process, set once by init_worker
+WORKER_TABLES = None
+
+
+def get_worker_records(codes: List[str]) -> List[Optional[dict]]:
+    """Get the records for a chunk of UCUM codes in a worker process. See get_unit_record."""
+    from .convert import get_unit_record
+
+    return [get_unit_record(code, **WORKER_TABLES) for code in codes]
+
+
+def init_worker(tables: dict):
+    """Keep the tables of the converter in a worker process, so that they are only loaded once
+    per worker instead of once per chunk. Each worker annotates the parts it sees once, in its own
+    cache of annotated parts."""
+    from .cache import LRUCache
+    from .convert import TERM_CACHE_SIZE
+
+    global WORKER_TABLES
+    WORKER_TABLES = {**tables, "terms": LRUCache(TERM_CACHE_SIZE)}
+
+
+def iter_records_parallel(
+    converter, inputs: Iterable[str], jobs: int, chunksize: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[Tuple[str, Optional[dict]]]:
+    """
+    Lazily get each UCUM code in inputs with its record, converting the codes in a pool of worker
+    processes. Records are yielded in the order of the inputs, so the output is the same as with
+    converter.get_record.
+
+    :param converter: UnitConverter with the tables and the record cache to use
+    :param inputs: iterable of UCUM codes
+    :param jobs: number of worker processes
+    :param chunksize: number of codes sent to a worker at a time
+    :return: iterator of UCUM codes and their records (None for codes that cannot be processed)
+    """
+    tables = {
+        "ucum_si": converter.ucum_si,
+        "unit_prefixes": converter.unit_prefixes,
+        "unit_exponents": converter.unit_exponents,
+        "mappings_index": converter.mappings_index,
+        "eq_codes": converter.eq_codes,
+        "lang": converter.langs,
+        "fail_on_err": converter.fail_on_err,
+        "max_combinations": converter.max_combinations,
+    }
+    inputs = iter(inputs)
+    with ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(tables,)) as pool:
+        # Only keep a few chunks per worker in flight so that memory use does not grow with the input
+        while True:
+            batch = list(islice(inputs, chunksize * jobs * 4))
+            if not batch:
+                break
+
+            # Convert each code that is not cached yet once
+            records = {}
+            todo = []
+            for code in dict.fromkeys(batch):
+                record = converter.cache.get(converter.get_cache_key(code))
+                if record is None:
+                    todo.append(code)
+                else:
+                    records[code] = record
+            chunks = [todo[i:i + chunksize] for i in range(0, len(todo), chunksize)]
+            for chunk, chunk_records in zip(chunks, pool.map(get_worker_records, chunks)):
+                for code, record in zip(chunk, chunk_records):
+                    records[code] = record
+                    if record is not None:
+                        converter.cache.put(converter.get_cache_key(code), record)
+
+            for code in batch:
+                yield code, records[code]
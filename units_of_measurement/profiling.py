@@ -0,0 +1,81 @@
+import math
+import threading
+
+from collections import defaultdict, deque
+from typing import List, Optional
+
+# Stages reported by UnitConverter, the CLI and the writers, in the order they run
+STAGES = ["load", "group", "cache", "parse", "labels", "codes", "triples", "graph", "serialize", "write"]
+
+
+class Observer:
+    """Receives the duration of each run of a stage of the conversion and counts of events, e.g.:
+
+    - stages: load, group, cache, parse, labels, codes, triples, graph, serialize, write
+    - counters: inputs, units, parsed, failed, cache_hits, cache_misses, triples
+
+    This base class ignores everything; subclass it (or pass any object with these two methods)
+    to collect the timings. Observers are only called when one is given, so conversion without
+    an observer has no overhead beyond a check for None.
+    """
+
+    def on_count(self, counter: str, n: int = 1):
+        """Called when a counter is incremented by n."""
+
+    def on_stage(self, stage: str, seconds: float):
+        """Called after one run of a stage, with its duration in seconds."""
+
+
+class Profiler(Observer):
+    """An observer that keeps the durations of every stage and the counters, and summarizes them
+    with percentiles. It is thread-safe.
+
+    :param window: number of the latest durations of each stage to keep for the percentiles, or None
+                   to keep them all (the number of runs and the total duration count every run)
+    """
+
+    def __init__(self, window: Optional[int] = None):
+        self.counters = defaultdict(int)
+        self.durations = defaultdict(lambda: deque(maxlen=window))
+        self.runs = defaultdict(int)
+        self.totals = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def on_count(self, counter: str, n: int = 1):
+        with self._lock:
+            self.counters[counter] += n
+
+    def on_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self.durations[stage].append(seconds)
+            self.runs[stage] += 1
+            self.totals[stage] += seconds
+
+    def summary(self) -> dict:
+        """Get the counters and, for each stage, the number of runs, the total duration and the
+        50th, 90th, 99th percentile and maximum durations (in milliseconds, of the durations in the
+        window)."""
+        with self._lock:
+            stages = {}
+            total = sum(self.totals.values())
+            order = {stage: i for i, stage in enumerate(STAGES)}
+            for stage in sorted(self.durations, key=lambda s: (order.get(s, len(STAGES)), s)):
+                durations = sorted(self.durations[stage])
+                stages[stage] = {
+                    "runs": self.runs[stage],
+                    "total_ms": round(self.totals[stage] * 1000, 3),
+                    "share": round(self.totals[stage] / total, 4) if total else 0,
+                    "p50_ms": round(get_percentile(durations, 50) * 1000, 4),
+                    "p90_ms": round(get_percentile(durations, 90) * 1000, 4),
+                    "p99_ms": round(get_percentile(durations, 99) * 1000, 4),
+                    "max_ms": round(durations[-1] * 1000, 4),
+                }
+            return {"stages": stages, "counters": dict(self.counters)}
+
+
+def get_percentile(values: List[float], percentile: float) -> float:
+    """Get a percentile of sorted values with the nearest-rank method."""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(percentile / 100 * len(values)))
+    return values[rank - 1]
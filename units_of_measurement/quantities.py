@@ -0,0 +1,150 @@
+from fractions import Fraction
+from functools import lru_cache
+from typing import Dict, Tuple
+from .helpers import get_conversions, get_prefixes
+from .normalize import get_unit_parts
+
+# Numeric conversion of values between commensurable units, without labels, definitions or RDF. Each
+# unit is reduced to a scale factor and a dimension vector of BASE_UNITS, from the definitions in the
+# conversions table
+
+# Base units of the dimension vectors, as in UCUM
+BASE_UNITS = ("m", "s", "g", "rad", "K", "C", "cd")
+
+# Digits of the powers of ten in the prefixes table (e.g., "⁻³" for milli)
+SUPERSCRIPTS = str.maketrans("⁻⁰¹²³⁴⁵⁶⁷⁸⁹", "-0123456789")
+
+# Scale factor (relative to the base units) and dimension vector of a unit
+Scale = Tuple[Fraction, Tuple[int, ...]]
+
+
+class QuantityConverter:
+    """
+    Converts numeric values between commensurable UCUM codes, e.g. from "[mi_i]/h" to "m/s". Each
+    code is parsed once and reduced to an exact scale factor and a dimension vector, and the factor
+    of each (from, to) pair is computed once, so converting a column of values is one multiplication
+    per value, or one vectorized multiplication for arrays. Converters only add to their caches, so
+    one converter can be shared between threads.
+
+    Special units, whose values are not proportional to the base units (e.g., Cel, [degF], [pH] or
+    the logarithmic B[...]), and arbitrary units (e.g., [IU]) have no conversion.
+
+    :param conversions: UCUM symbol -> value and unit that define it (default: packaged conversions.csv,
+                        see helpers.get_conversions)
+    :param unit_prefixes: prefix symbol -> dict with the power of ten in "number"
+                          (default: packaged prefixes.csv)
+    """
+
+    def __init__(self, conversions: Dict[str, Tuple[str, str]] = None, unit_prefixes: dict = None):
+        self.conversions = conversions or get_conversions()
+        unit_prefixes = unit_prefixes or get_prefixes()
+        self.prefix_scales = {
+            prefix: Fraction(10) ** int(details["number"].translate(SUPERSCRIPTS))
+            for prefix, details in unit_prefixes.items()
+        }
+        self.scales: Dict[str, Scale] = {}
+        self.factors: Dict[Tuple[str, str], float] = {}
+
+    def convert(self, values, from_code: str, to_code: str):
+        """Convert a number, a sequence of numbers or an array (e.g., a NumPy array or a pandas
+        Series) from one unit to another. Raises a ValueError if the units are not commensurable
+        or cannot be converted."""
+        return scale_values(values, self.get_factor(from_code, to_code))
+
+    def get_atom_scale(self, atom: str, seen: Tuple[str, ...] = ()) -> Scale:
+        """Get the scale of a unit atom from its definition in the conversions table."""
+        if atom in BASE_UNITS:
+            return Fraction(1), tuple(int(atom == base) for base in BASE_UNITS)
+        if atom not in self.conversions:
+            raise ValueError(f"No numeric conversion for '{atom}' (special and arbitrary units cannot be converted)")
+        if atom in seen:
+            raise ValueError(f"Circular definition of '{atom}' in the conversions table")
+        value, unit = self.conversions[atom]
+        factor, dimension = self.get_scale(unit, seen + (atom,))
+        return Fraction(value) * factor, dimension
+
+    def get_dimension(self, code: str) -> Tuple[int, ...]:
+        """Get the exponents of BASE_UNITS in a UCUM code, e.g. (1, -1, 0, 0, 0, 0, 0) for m/s."""
+        return self.get_scale(code)[1]
+
+    def get_factor(self, from_code: str, to_code: str) -> float:
+        """Get the factor that converts values from one unit to another. Raises a ValueError if the
+        units are not commensurable or cannot be converted."""
+        key = (from_code, to_code)
+        factor = self.factors.get(key)
+        if factor is None:
+            from_factor, from_dimension = self.get_scale(from_code)
+            to_factor, to_dimension = self.get_scale(to_code)
+            if from_dimension != to_dimension:
+                raise ValueError(
+                    f"Cannot convert '{from_code}' to '{to_code}': the units are not commensurable "
+                    f"({get_dimension_code(from_dimension)} and {get_dimension_code(to_dimension)})"
+                )
+            factor = float(from_factor / to_factor)
+            self.factors[key] = factor
+        return factor
+
+    def get_scale(self, code: str, seen: Tuple[str, ...] = ()) -> Scale:
+        """Get the scale factor (relative to the base units) and the dimension vector of a UCUM code
+        ("" or "1" for dimensionless). Raises a ValueError if the code cannot be parsed or converted."""
+        scale = self.scales.get(code)
+        if scale is not None:
+            return scale
+        factor = Fraction(1)
+        dimension = [0] * len(BASE_UNITS)
+        if code and code != "1":
+            try:
+                parts = get_unit_parts(code)
+            except (TypeError, RecursionError) as exc:
+                raise ValueError(f"Could not parse '{code}'") from exc
+            for part in parts:
+                atom_factor, atom_dimension = self.get_atom_scale(part.unit, seen)
+                factor *= (self.prefix_scales[part.prefix] * atom_factor if part.prefix else atom_factor) ** part.exponent
+                for i, exponent in enumerate(atom_dimension):
+                    dimension[i] += exponent * part.exponent
+        scale = factor, tuple(dimension)
+        self.scales[code] = scale
+        return scale
+
+    def is_commensurable(self, from_code: str, to_code: str) -> bool:
+        """Check if values can be converted from one unit to another."""
+        try:
+            self.get_factor(from_code, to_code)
+        except ValueError:
+            return False
+        return True
+
+
+def convert_values(values, from_code: str, to_code: str, converter: QuantityConverter = None):
+    """
+    Convert a number, a sequence of numbers or an array from one unit to another, e.g.
+    convert_values([1, 2.5], "km", "m") -> [1000.0, 2500.0]. None values in sequences are kept.
+
+    :param values: a number, a sequence of numbers, or an array (e.g., a NumPy array or a pandas
+                   Series), which is converted in one vectorized multiplication
+    :param from_code: UCUM code of the unit of the values
+    :param to_code: UCUM code of the unit to convert the values to
+    :param converter: converter of the units (default: a shared QuantityConverter with the default tables)
+    :return: the converted values, of the same kind as values (a list for other sequences)
+    """
+    return (converter or get_quantity_converter()).convert(values, from_code, to_code)
+
+
+def get_dimension_code(dimension: Tuple[int, ...]) -> str:
+    """Get the UCUM code in BASE_UNITS of a dimension vector, e.g. "m.s-1", or "1" if dimensionless."""
+    parts = [base + (str(exponent) if exponent != 1 else "") for base, exponent in zip(BASE_UNITS, dimension) if exponent]
+    return ".".join(parts) or "1"
+
+
+@lru_cache(maxsize=None)
+def get_quantity_converter() -> QuantityConverter:
+    """Get the QuantityConverter with the default tables shared by convert_values."""
+    return QuantityConverter()
+
+
+def scale_values(values, factor: float):
+    """Multiply values by a factor: arrays (anything that implements NumPy ufuncs) in one
+    vectorized multiplication, numbers directly, and other sequences value by value, keeping None."""
+    if isinstance(values, (int, float)) or hasattr(values, "__array_ufunc__"):
+        return values * factor
+    return [None if value is None else value * factor for value in values]
@@ -0,0 +1,303 @@
+import json
+import os
+import tempfile
+
+from rdflib import URIRef
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import quote as url_quote
+from .convert import UnitConverter
+from .helpers import get_tables_hash
+from .normalize import get_canonical_code, get_unit_parts
+from .writers import (
+    get_jsonld_id,
+    get_jsonld_node,
+    get_jsonld_prefixes,
+    get_nt_term,
+    get_prefix_names,
+    get_rdfxml_block,
+    get_rdfxml_header,
+    get_turtle_block,
+    get_turtle_header,
+    get_turtle_term,
+    get_xml_attribute,
+)
+
+# Bump when a change to the package changes the output for the same codes and tables,
+# so that registries built with an older version are rebuilt in full
+MANIFEST_VERSION = 3
+
+# Formats that can be read back to splice in updated units
+REGISTRY_FORMATS = ["json-ld", "nt", "ttl", "xml"]
+
+# The registry formats other than nt are written as a header, one block for each subject and a
+# footer, so that updated units are spliced in without parsing or serializing the other units
+BLOCK_SEPARATORS = {"json-ld": ",\n", "ttl": "\n\n", "xml": "\n\n"}
+BLOCK_FOOTERS = {"json-ld": "\n  ]\n}\n", "ttl": "\n", "xml": "\n</rdf:RDF>\n"}
+
+
+def get_block_header(outfmt: str, namespaces: Dict[str, str]) -> str:
+    """Get the text of a registry before the first block: the prefixes, or the JSON-LD context."""
+    if outfmt == "json-ld":
+        context = json.dumps(namespaces, indent=2).replace("\n", "\n  ")
+        return f'{{\n  "@context": {context},\n  "@graph": [\n'
+    if outfmt == "ttl":
+        return get_turtle_header(namespaces)
+    return get_rdfxml_header(namespaces)
+
+
+def get_block_key(outfmt: str, block: str) -> str:
+    """Get the key of the subject of a block of a registry (see get_subject_key)."""
+    if outfmt == "json-ld":
+        return json.loads(block)["@id"]
+    if outfmt == "ttl":
+        return block.split(" ", 1)[0]
+    return block.split("\n", 1)[0]
+
+
+def get_block_prefixes(outfmt: str, namespaces: Dict[str, str]) -> list:
+    """Get the prefixes that IRIs are compacted with in the blocks of a registry."""
+    return get_jsonld_prefixes(namespaces) if outfmt == "json-ld" else get_prefix_names(namespaces)
+
+
+def get_blocks(outfmt: str, triples: List[tuple], namespaces: Dict[str, str]) -> Dict[str, str]:
+    """Group triples by subject, and get the block of each subject in a registry format, keyed by
+    the key of the subject (see get_subject_key)."""
+    prefixes = get_block_prefixes(outfmt, namespaces)
+    subjects = {}
+    for t in dict.fromkeys(triples):
+        subjects.setdefault(t[0], []).append(t)
+    blocks = {}
+    for subject, subject_triples in subjects.items():
+        if outfmt == "json-ld":
+            block = "    " + json.dumps(get_jsonld_node(subject, subject_triples, prefixes), ensure_ascii=False)
+        elif outfmt == "ttl":
+            block = get_turtle_block(subject, subject_triples, prefixes)
+        else:
+            block = get_rdfxml_block(subject, subject_triples, prefixes)
+        blocks[get_subject_key(outfmt, subject, prefixes)] = block
+    return blocks
+
+
+def get_changed_rows(manifest: Optional[dict], rows: dict, equivalents: dict) -> Dict[str, Set[str]]:
+    """Get the keys of the rows of each table that were added, removed, or changed since the manifest
+    was written. The changed SI rows include the codes given as equivalents by changed SI rows."""
+    changed = {table: set() for table in rows}
+    if not manifest:
+        return changed
+    for table, new in rows.items():
+        old = manifest["rows"][table]
+        changed[table] = {key for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
+    for key in list(changed["si"]):
+        for eq in [manifest["equivalents"].get(key), equivalents.get(key)]:
+            if eq:
+                changed["si"].update(eq.split("|"))
+    return changed
+
+
+def get_manifest_path(output: str) -> str:
+    """Get the path of the manifest for a registry output file."""
+    return output + ".manifest.json"
+
+
+def get_row_hashes(table: dict) -> Dict[str, str]:
+    """Get a short hash of each row of a resource table, keyed by the row key."""
+    return {key: get_tables_hash(row)[:16] for key, row in table.items()}
+
+
+def get_subject_key(outfmt: str, subject: URIRef, prefixes: list) -> str:
+    """Get the key of a subject in a registry format: the start of its block (its @id in JSON-LD)."""
+    if outfmt == "json-ld":
+        return get_jsonld_id(str(subject), prefixes)
+    if outfmt == "ttl":
+        return get_turtle_term(subject, prefixes)
+    return f"  <rdf:Description rdf:about={get_xml_attribute(subject)}>"
+
+
+def get_unit_dependencies(record: dict, converter: UnitConverter) -> Dict[str, List[str]]:
+    """Get the keys of the rows of the SI, prefix and exponent tables that the record of a unit was
+    built from. The SI rows include the rows that give equivalent codes for the unit or its parts."""
+    parts = get_unit_parts(record["ucum_codes"][0])
+    si = set()
+    for code in [p.unit for p in parts] + record["ucum_codes"]:
+        si.add(code)
+        si.update(converter.eq_codes.get(code, ()))
+    return {
+        "si": sorted(si),
+        "prefixes": sorted({p.prefix for p in parts if p.prefix}),
+        "exponents": sorted({str(abs(p.exponent)) for p in parts}),
+    }
+
+
+def is_stale(unit: Optional[dict], spellings: Iterable[str], mappings: List[str], changed: dict) -> bool:
+    """Check if a unit in the manifest needs to be converted again: it is new, its spellings or
+    mappings changed, or any of the rows it was built from changed."""
+    if unit is None:
+        return True
+    if set(unit["spellings"]) != set(spellings) or unit["mappings"] != mappings:
+        return True
+    return any(changed[table].intersection(unit.get(table, [])) for table in changed)
+
+
+def read_manifest(output: str, converter: UnitConverter, outfmt: str) -> Optional[dict]:
+    """Read the manifest of a registry, or return None if the registry or its manifest is missing,
+    or if it was built with another format, language, base IRI, or version of this package."""
+    if not os.path.exists(output):
+        return None
+    try:
+        with open(get_manifest_path(output), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    settings = {
+        "version": MANIFEST_VERSION,
+        "format": outfmt,
+        "lang": ",".join(converter.langs),
+        "base_iri": converter.base_iri,
+        "max_combinations": converter.max_combinations,
+    }
+    if any(manifest.get(k) != v for k, v in settings.items()):
+        return None
+    return manifest
+
+
+def read_blocks(output: str, outfmt: str, namespaces: Dict[str, str]) -> Optional[Dict[str, str]]:
+    """Read the blocks of a registry in a format other than nt, keyed by the key of their subject
+    (see get_subject_key), or return None if the registry was not written with these namespaces."""
+    header = get_block_header(outfmt, namespaces)
+    footer = BLOCK_FOOTERS[outfmt]
+    with open(output, "r", encoding="utf-8") as f:
+        text = f.read()
+    if not text.startswith(header) or not text.endswith(footer) or len(text) < len(header) + len(footer):
+        return None
+    body = text[len(header):len(text) - len(footer)]
+    blocks = body.split(BLOCK_SEPARATORS[outfmt]) if body else []
+    return {get_block_key(outfmt, block): block for block in blocks}
+
+
+def splice_blocks(outfmt: str, blocks: Dict[str, str], drop: Set[str], triples: List[tuple], namespaces: dict) -> str:
+    """Remove the blocks of the units in drop (unit IRIs) from the blocks of a registry, add the
+    blocks of the subjects of triples that are not in the registry yet, and join them."""
+    prefixes = get_block_prefixes(outfmt, namespaces)
+    drop = {get_subject_key(outfmt, URIRef(iri), prefixes) for iri in drop}
+    blocks = {key: block for key, block in blocks.items() if key not in drop}
+    for key, block in get_blocks(outfmt, triples, namespaces).items():
+        blocks.setdefault(key, block)
+    return get_block_header(outfmt, namespaces) + BLOCK_SEPARATORS[outfmt].join(blocks.values()) + BLOCK_FOOTERS[outfmt]
+
+
+def splice_ntriples(output: Optional[str], drop: Set[str], triples: List[tuple]) -> str:
+    """Read a registry in N-Triples (none if output is None), remove the lines of the units in drop
+    (unit IRIs) and append the lines for triples that are not in the registry yet."""
+    drop = {f"<{iri}>" for iri in drop}
+    kept = []
+    if output is not None:
+        with open(output, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.split(" ", 1)[0] not in drop:
+                    kept.append(line)
+    seen = set(kept)
+    for s, p, o in dict.fromkeys(triples):
+        line = f"{get_nt_term(s)} {get_nt_term(p)} {get_nt_term(o)} .\n"
+        if line not in seen:
+            seen.add(line)
+            kept.append(line)
+    return "".join(kept)
+
+
+def update_registry(  # noqa: C901
+    converter: UnitConverter, inputs: Iterable[str], output: str, outfmt: str = "ttl"
+) -> dict:
+    """
+    Build a registry of units from UCUM codes, or update it in place, converting only the units that
+    are new, that have new or removed spellings, or whose rows in the resource tables changed since
+    the last build. The input codes and table row hashes of each build are kept in a manifest next
+    to the output (see get_manifest_path).
+
+    :param converter: converter for the UCUM codes
+    :param inputs: all UCUM codes of the registry
+    :param output: path of the registry
+    :param outfmt: format of the registry (json-ld, nt, ttl or xml)
+    :return: dict of the number of units that were converted, reused and removed
+    """
+    if outfmt not in REGISTRY_FORMATS:
+        raise ValueError(f"Cannot update a registry in the '{outfmt}' format")
+    rows = {
+        "si": get_row_hashes(converter.ucum_si),
+        "prefixes": get_row_hashes(converter.unit_prefixes),
+        "exponents": get_row_hashes(converter.unit_exponents),
+    }
+    equivalents = {k: v["equivalent_code"] for k, v in converter.ucum_si.items() if v["equivalent_code"]}
+    manifest = read_manifest(output, converter, outfmt)
+    blocks = {}
+    if manifest and outfmt != "nt":
+        blocks = read_blocks(output, outfmt, converter.namespaces)
+        if blocks is None:
+            # The registry was written with other namespaces (or edited), so it is built in full
+            manifest = None
+    old_units = manifest["units"] if manifest else {}
+
+    changed = get_changed_rows(manifest, rows, equivalents)
+
+    # Group the inputs by canonical code, only parsing the spellings that are not in the manifest
+    spelling_index = {s: canonical for canonical, unit in old_units.items() for s in unit["spellings"]}
+    groups = {}
+    for inpt in inputs:
+        canonical = spelling_index.get(inpt) or get_canonical_code(inpt) or inpt
+        groups.setdefault(canonical, {})[inpt] = None
+
+    # Find the units to (re)convert
+    units = {}
+    stale = []
+    for canonical, spellings in groups.items():
+        unit = old_units.get(canonical)
+        if is_stale(unit, spellings, converter.mappings_index.get(canonical, []), changed):
+            stale.append(canonical)
+        else:
+            units[canonical] = unit
+    removed = [canonical for canonical in old_units if canonical not in groups]
+
+    triples = []
+    for canonical in stale:
+        units[canonical] = {"spellings": list(groups[canonical]), "mappings": []}
+    for record, spellings in converter.iter_units(s for canonical in stale for s in groups[canonical]):
+        canonical = record["ucum_codes"][0]
+        units[canonical] = {
+            "spellings": list(spellings),
+            "mappings": converter.mappings_index.get(canonical, []),
+            **get_unit_dependencies(record, converter),
+        }
+        triples.extend(converter.get_triples(record))
+
+    # Splice the converted units into the registry, or write it in full
+    drop = {converter.base_iri + url_quote(canonical) for canonical in stale + removed}
+    if outfmt != "nt":
+        outstr = splice_blocks(outfmt, blocks, drop, triples, converter.namespaces)
+    else:
+        outstr = splice_ntriples(output if manifest else None, drop, triples)
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "format": outfmt,
+        "lang": ",".join(converter.langs),
+        "base_iri": converter.base_iri,
+        "max_combinations": converter.max_combinations,
+        "rows": rows,
+        "equivalents": equivalents,
+        "units": units,
+    }
+    write_atomic(output, outstr)
+    write_atomic(get_manifest_path(output), json.dumps(manifest, ensure_ascii=False, sort_keys=True))
+    return {"converted": len(stale), "reused": len(groups) - len(stale), "removed": len(removed)}
+
+
+def write_atomic(path: str, content: str):
+    """Write text to a temporary file first so that readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,98 @@
+from typing import Dict, Iterable, Optional
+from urllib.parse import quote as url_quote
+from .normalize import DEFAULT_BASE_IRI, ONTOLOGY_PREFIXES, get_canonical_code
+from .snapshot import load_resources
+
+# Reverse resolution of mapped ontology terms (e.g., QUDT:M-PER-SEC or the IRI of a UO term) to the
+# canonical UCUM codes and IRIs of their units, without importing rdflib
+
+# Columns of the output of resolve_batch, in order
+RESOLVE_COLUMNS = ["ucum_code", "iri"]
+
+
+class MappingResolver:
+    """
+    Resolves the IRIs and CURIEs of the ontology terms in the mappings table (QUDT, OM, UO, OBOE and
+    NERC P06 units) to the canonical UCUM codes and IRIs of their units. Each term is resolved with
+    one dictionary lookup in an index that is built once (see get_reverse_index); the index of the
+    default mappings is compiled into the resource snapshot.
+
+    :param reverse_index: mapped ontology term IRI -> canonical UCUM code (default: the index of the
+                          default mappings)
+    :param base_iri: base IRI for units
+    :param prefixes: CURIE prefix -> namespace IRI, matched case-insensitively (default: ONTOLOGY_PREFIXES)
+    """
+
+    def __init__(
+        self,
+        reverse_index: Dict[str, str] = None,
+        base_iri: str = DEFAULT_BASE_IRI,
+        prefixes: Dict[str, str] = None,
+    ):
+        if reverse_index is None:
+            reverse_index = load_resources()["reverse_index"]
+        self.reverse_index = reverse_index
+        self.base_iri = base_iri
+        self.prefixes = {prefix.casefold(): namespace for prefix, namespace in (prefixes or ONTOLOGY_PREFIXES).items()}
+
+    def expand(self, term: str) -> str:
+        """Get the IRI of a CURIE (e.g., 'UO:0000094'), or the term itself if it is an IRI (with or
+        without angle brackets) or a CURIE with an unknown prefix."""
+        term = term.strip()
+        if term.startswith("<") and term.endswith(">"):
+            return term[1:-1]
+        prefix, sep, local = term.partition(":")
+        if sep and not local.startswith("//"):
+            namespace = self.prefixes.get(prefix.casefold())
+            if namespace is not None:
+                return namespace + local
+        return term
+
+    def resolve(self, term: str) -> Optional[str]:
+        """Get the canonical UCUM code of a mapped ontology term IRI or CURIE, or None if the term
+        is not mapped to a code that can be parsed."""
+        return self.reverse_index.get(self.expand(term))
+
+    def to_iri(self, term: str) -> Optional[str]:
+        """Get the IRI of the unit of a mapped ontology term IRI or CURIE, or None if the term
+        is not mapped to a code that can be parsed."""
+        code = self.resolve(term)
+        if code is None:
+            return None
+        return self.base_iri + url_quote(code)
+
+
+def get_reverse_index(mappings: Dict[str, list]) -> Dict[str, str]:
+    """Invert the mapped ontology term IRI -> list of UCUM codes to get the mapped ontology term
+    IRI -> canonical UCUM code, using the first code of each IRI that can be parsed. IRIs that end
+    with "/" (NERC P06) are also indexed without it, as the terms in the output are."""
+    reverse_index = {}
+    for iri, ucum_codes in mappings.items():
+        canonical_code = next(filter(None, (get_canonical_code(code) for code in ucum_codes)), None)
+        if canonical_code is None:
+            continue
+        reverse_index[iri] = canonical_code
+        if iri.endswith("/"):
+            reverse_index.setdefault(iri[:-1], canonical_code)
+    return reverse_index
+
+
+def resolve_batch(
+    terms: Iterable[Optional[str]], resolver: MappingResolver = None
+) -> Dict[str, list]:
+    """
+    Resolve a column of mapped ontology term IRIs or CURIEs (e.g., from datasets annotated with
+    several vocabularies) to the canonical UCUM code and IRI of each unit. Terms that cannot be
+    resolved and missing values (None or blank strings) get None in every column.
+
+    :param terms: IRIs or CURIEs of mapped ontology terms
+    :param resolver: resolver of the terms (default: a MappingResolver with the default mappings)
+    :return: dict of column (see RESOLVE_COLUMNS) -> list of values, one for each input term
+    """
+    resolver = resolver or MappingResolver()
+    columns = {column: [] for column in RESOLVE_COLUMNS}
+    for term in terms:
+        code = resolver.resolve(term) if isinstance(term, str) else None
+        columns["ucum_code"].append(code)
+        columns["iri"].append(None if code is None else resolver.base_iri + url_quote(code))
+    return columns
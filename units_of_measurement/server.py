@@ -0,0 +1,326 @@
+import asyncio
+import json
+import os
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+from .batch import convert_batch
+from .cache import LRUCache
+from .convert import UnitConverter
+from .profiling import Profiler
+from .writers import serialize_graph
+
+# Media types of the formats that units can be served in, the first is the default
+MEDIA_TYPES = {
+    "ttl": "text/turtle",
+    "json-ld": "application/ld+json",
+    "html": "text/html",
+}
+
+# Media type of the columns (see batch.convert_batch) returned by POST /batch
+JSON_MEDIA_TYPE = "application/json"
+
+# Maximum size of a request body in bytes, and number of codes in one batch
+MAX_BODY_SIZE = 1 << 20
+MAX_BATCH_SIZE = 10000
+
+# Number of the latest latencies of requests and of rendering kept for the percentiles in /_metrics
+LATENCY_WINDOW = 10000
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+# Converters of the workers (threads or processes) of each UnitServer in this process, by key of the
+# server (see UnitServer.key), set once by init_worker
+WORKER_CONVERTERS: Dict[str, UnitConverter] = {}
+
+Response = Tuple[int, str, bytes]
+
+
+def get_format(accept: str, formats: Dict[str, str]) -> Optional[str]:
+    """Get the format (key of formats) of the media type with the highest quality in an Accept
+    header. */* and an empty header give the first format, and None is returned if no media type
+    is acceptable."""
+    if not accept:
+        return next(iter(formats))
+    media_formats = {media_type: fmt for fmt, media_type in formats.items()}
+    best = None
+    best_quality = 0.0
+    for item in accept.split(","):
+        media_type, *params = [x.strip() for x in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type in ("*/*", "text/*", "application/*"):
+            fmt = next((f for f, t in formats.items() if media_type == "*/*" or t.startswith(media_type[:-1])), None)
+        else:
+            fmt = media_formats.get(media_type)
+        if fmt and quality > best_quality:
+            best = fmt
+            best_quality = quality
+    return best
+
+
+def init_worker(key: str, converter_args: dict):
+    """Build the converter of a worker thread or process of a server once, so that its tables are
+    loaded and its cache stays warm for every request it renders."""
+    WORKER_CONVERTERS[key] = UnitConverter(**converter_args)
+
+
+def render_batch(key: str, codes: List[str], outfmt: str) -> Response:
+    """Render the units of many UCUM codes in a worker of a server: as columns in JSON (see
+    convert_batch), or as one graph in an RDF format, without the codes that cannot be converted."""
+    converter = WORKER_CONVERTERS[key]
+    if outfmt == "json":
+        columns = convert_batch(codes, converter)
+        return 200, JSON_MEDIA_TYPE, json.dumps(columns, ensure_ascii=False).encode("utf-8")
+    valid = []
+    for code in dict.fromkeys(codes):
+        try:
+            converter.get_record(code, fail_on_err=True)
+            valid.append(code)
+        except (RecursionError, ValueError):
+            continue
+    outstr = serialize_graph(converter.convert(valid), outfmt, lang=converter.lang)
+    return 200, MEDIA_TYPES[outfmt], outstr.encode("utf-8")
+
+
+def render_unit(key: str, code: str, outfmt: str) -> Response:
+    """Render the unit of one UCUM code in a worker of a server, or a 404 response if it cannot be
+    converted."""
+    converter = WORKER_CONVERTERS[key]
+    try:
+        converter.get_record(code, fail_on_err=True)
+    except (RecursionError, ValueError) as exc:
+        return 404, "text/plain", f"{exc}\n".encode("utf-8")
+    outstr = serialize_graph(converter.convert([code]), outfmt, lang=converter.lang)
+    return 200, MEDIA_TYPES[outfmt], outstr.encode("utf-8")
+
+
+class UnitServer:
+    """
+    An HTTP/1.1 server that resolves UCUM codes to their units, keeping the converter and the
+    caches warm between requests:
+
+    - GET /{code}: the unit in Turtle, JSON-LD or HTML, chosen by the Accept header or ?format=
+    - POST /batch: a JSON list of codes (or one code per line) converted at once, as JSON columns
+      (see batch.convert_batch) or, if the Accept header asks for it, as one graph
+    - GET /_metrics: counts of requests and responses, and latency percentiles in JSON
+
+    Conversion and serialization run in a pool of workers, each with its own converter, so that
+    the event loop only handles connections. At most max_concurrency requests are rendered at once
+    and at most max_queue more wait for a worker; any others get a 503 response right away.
+
+    :param converter_args: keyword arguments of the UnitConverter of each worker
+    :param jobs: number of worker processes, or 1 to render in one thread of this process
+    :param max_concurrency: maximum number of requests rendered at once (default: 2 per worker)
+    :param max_queue: maximum number of requests waiting for a worker
+    :param cache_size: number of rendered responses to keep
+    """
+
+    def __init__(
+        self,
+        converter_args: dict = None,
+        jobs: int = 1,
+        max_concurrency: int = None,
+        max_queue: int = 1000,
+        cache_size: int = 10000,
+    ):
+        if jobs < 1:
+            raise ValueError(f"Number of jobs must be >= 1, got {jobs}")
+        self.converter_args = converter_args or {}
+        self.jobs = jobs
+        self.max_concurrency = max_concurrency or 2 * jobs
+        self.max_queue = max_queue
+        self.responses = LRUCache(cache_size)
+        # Key of the converters of the workers of this server (see init_worker)
+        self.key = f"{os.getpid()}-{id(self)}"
+        self.profiler = Profiler(window=LATENCY_WINDOW)
+        self.executor: Optional[Executor] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.in_flight = 0
+
+    async def handle(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> Response:
+        """Route one request and get its status, content type and body."""
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        path = unquote(url.path)
+        if method == "GET" and path == "/_metrics":
+            return 200, JSON_MEDIA_TYPE, json.dumps(self.get_metrics(), indent=2).encode("utf-8")
+        if method == "POST" and path == "/batch":
+            return await self.handle_batch(query, headers, body)
+        if method != "GET":
+            return 405, "text/plain", b"Method not allowed\n"
+        code = path[1:]
+        if not code:
+            return 400, "text/plain", b"Usage: GET /{UCUM code}, POST /batch\n"
+        outfmt = query["format"][0] if "format" in query else get_format(headers.get("accept"), MEDIA_TYPES)
+        if outfmt not in MEDIA_TYPES:
+            return 400, "text/plain", f"Unsupported format, use one of: {', '.join(MEDIA_TYPES)}\n".encode("utf-8")
+        key = (code, outfmt)
+        response = self.responses.get(key)
+        if response is None:
+            response = await self.run(render_unit, self.key, code, outfmt)
+            if response[0] in (200, 404):
+                self.responses.put(key, response)
+        return response
+
+    async def handle_batch(self, query: Dict[str, List[str]], headers: Dict[str, str], body: bytes) -> Response:
+        """Convert the codes in the body of a POST /batch request."""
+        if "format" in query:
+            outfmt = query["format"][0]
+        else:
+            outfmt = get_format(headers.get("accept"), {"json": JSON_MEDIA_TYPE, **MEDIA_TYPES})
+        if outfmt not in MEDIA_TYPES and outfmt != "json":
+            return 400, "text/plain", f"Unsupported format, use json or one of: {', '.join(MEDIA_TYPES)}\n".encode()
+        text = body.decode("utf-8", errors="replace")
+        if headers.get("content-type", "").startswith(JSON_MEDIA_TYPE):
+            try:
+                codes = json.loads(text)
+            except ValueError:
+                return 400, "text/plain", b"Invalid JSON\n"
+            if isinstance(codes, dict):
+                codes = codes.get("codes")
+            if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+                return 400, "text/plain", b"Expected a list of codes (strings)\n"
+        else:
+            codes = [line.strip() for line in text.splitlines()]
+        if len(codes) > MAX_BATCH_SIZE:
+            return 413, "text/plain", f"At most {MAX_BATCH_SIZE} codes per batch\n".encode("utf-8")
+        return await self.run(render_batch, self.key, codes, outfmt)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):  # noqa: C901
+        """Read requests from a connection and write the responses, until the client closes it or
+        asks for it to be closed."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                start = perf_counter()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.write_response(writer, (400, "text/plain", b"Bad request\n"), False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # The end of the body is unknown, so the connection cannot be reused
+                    response = (400, "text/plain", b"Invalid Content-Length\n")
+                    keep_alive = False
+                elif length > MAX_BODY_SIZE:
+                    response = (413, "text/plain", b"Request body too large\n")
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    response = await self.handle(method, target, headers, body)
+                await self.write_response(writer, response, keep_alive)
+                self.profiler.on_stage("request", perf_counter() - start)
+                self.profiler.on_count("requests")
+                self.profiler.on_count(f"status_{response[0]}")
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def get_metrics(self) -> dict:
+        """Get the counts of requests and responses by status, the latency percentiles of the
+        requests and of the rendering in workers (in milliseconds), and the state of the queue."""
+        summary = self.profiler.summary()
+        return {
+            "counters": summary["counters"],
+            "latency": summary["stages"],
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "response_cache": self.responses.cache_info()._asdict(),
+        }
+
+    async def run(self, func, *args) -> Response:
+        """Run a render function in the pool of workers, waiting for a free slot if max_concurrency
+        requests are already rendered, or return a 503 response if the queue is full."""
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            return 503, "text/plain", b"Too many requests, try again later\n"
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        start = perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.profiler.on_stage("render", perf_counter() - start)
+            self.in_flight -= 1
+            self.semaphore.release()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8000) -> asyncio.AbstractServer:
+        """Start the workers and listen for connections (port 0 picks a free port)."""
+        if self.jobs > 1:
+            self.executor = ProcessPoolExecutor(
+                self.jobs, initializer=init_worker, initargs=(self.key, self.converter_args)
+            )
+        else:
+            self.executor = ThreadPoolExecutor(1, initializer=init_worker, initargs=(self.key, self.converter_args))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def stop(self):
+        """Shut down the workers."""
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+            WORKER_CONVERTERS.pop(self.key, None)
+
+    async def write_response(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool):
+        """Write the status line, headers and body of a response."""
+        status, content_type, body = response
+        head = [
+            f"HTTP/1.1 {status} {REASONS[status]}",
+            f"Content-Type: {content_type}; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            head.append("Retry-After: 1")
+        if status in (200, 404) and content_type in MEDIA_TYPES.values():
+            head.append("Vary: Accept")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(server: UnitServer, host: str = "127.0.0.1", port: int = 8000):
+    """Run a UnitServer until it is cancelled (e.g., with Ctrl+C)."""
+    listener = await server.start(host, port)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.stop()
@@ -0,0 +1,126 @@
+import hashlib
+import lark
+import os
+import re
+import sys
+
+from functools import lru_cache
+from lark import Lark, Transformer
+from lark.exceptions import LarkError
+from .grammar import SIMPLE_UNITS
+from .snapshot import get_snapshot_dir
+
+# The Lark parser of UCUM codes, for the codes that grammar.scan_code cannot scan. This module is
+# imported on first use, as importing lark and loading the parse tables is slow
+
+
+class UnitsTransformer(Transformer):
+    def SIGN(self, args):
+        return args[0]
+
+    def DIGIT(self, args):
+        return args[0]
+
+    def digits(self, args):
+        return "".join(args)
+
+    def factor(self, args):
+        return args[0]
+
+    def exponent(self, args):
+        if len(args) == 1:
+            return {
+                "exponent": int(args[0]),
+            }
+        if len(args) == 2:
+            return {
+                "exponent": int("".join(args)),
+            }
+
+    def start(self, args):
+        return args
+
+    def term(self, args):
+        if len(args) == 1:
+            return args[0]
+        elif len(args) == 3:
+            return [args[0], {**args[1], **args[2]}]
+
+    def component(self, args):
+        return args[0]
+
+    def simple_unit(self, args):
+        return args[0]
+
+    def annotatable(self, args):
+        if len(args) == 1:
+            return args[0]
+        elif len(args) == 2:
+            return {**args[0], **args[1]}
+
+    # def annotation(self, args):
+    #     return args[0]
+
+    def OPERATOR(self, args):
+        return {
+            "operator": args[0],
+        }
+
+    def SIMPLE_UNIT(self, args):
+        return dict(SIMPLE_UNITS[args[:]])
+
+    # def ANNOTATION(self, args):
+    #     return {
+    #       "type": "non-unit",
+    #       "unit": "".join(args)
+    #     }
+
+
+# SI grammar based on "Exhibit 1" https://ucum.org/ucum.html
+# The prefixed and unprefixed atoms are collapsed into a single SIMPLE_UNIT terminal, ordered
+# longest first, so that the grammar is deterministic and can be parsed with LALR(1)
+# instead of Earley. The transformer looks up the prefix and unit for each matched atom.
+SI_GRAMMAR = r"""
+SIGN: "-"
+DIGIT: "0" | "1" | "2" | "3" | "4" | "5" | "6" | "7" | "8" | "9"
+digits: DIGIT digits | DIGIT
+factor: digits
+exponent: SIGN digits | digits
+simple_unit: SIMPLE_UNIT
+annotatable: simple_unit exponent
+           | simple_unit
+component: annotatable
+         | factor
+term: term OPERATOR component
+    | component
+start: "/" term | term
+OPERATOR: /\.|\//
+SIMPLE_UNIT: /%s/
+%%ignore " "           // Disregard spaces in text
+""" % "|".join(re.escape(x) for x in sorted(SIMPLE_UNITS, key=lambda x: (-len(x), x)))
+
+
+@lru_cache(maxsize=None)
+def get_si_grammar() -> Lark:
+    """Build the LALR parser for SI_GRAMMAR once. The parse tables are cached next to the default
+    snapshots (see snapshot.get_snapshot_dir), keyed by a hash of the grammar text and the versions
+    of lark and Python, so only the first run pays for building them. Lark loads the cache with
+    pickle, so it is not kept in the shared temporary directory, where another local user could
+    plant one."""
+    key = f"{SI_GRAMMAR}{lark.__version__}{sys.version_info[:2]}"
+    cache = os.path.join(get_snapshot_dir(), f"si_grammar_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}.lark")
+    try:
+        os.makedirs(os.path.dirname(cache), mode=0o700, exist_ok=True)
+        return Lark(SI_GRAMMAR, parser="lalr", cache=cache)
+    except OSError:
+        # The cache file could not be written, e.g. on a read-only file system
+        return Lark(SI_GRAMMAR, parser="lalr")
+
+
+def parse_code(code: str) -> list:
+    """Parse a UCUM code with SI_GRAMMAR into the tree of parts given by UnitsTransformer (see
+    normalize.flatten). Raises a ValueError if the code cannot be parsed."""
+    try:
+        return UnitsTransformer().transform(get_si_grammar().parse(code))
+    except LarkError as exc:
+        raise ValueError(f"Could not parse '{code}'") from exc
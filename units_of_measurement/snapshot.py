@@ -0,0 +1,182 @@
+import hashlib
+import logging
+import marshal
+import mmap
+import os
+import sys
+import tempfile
+
+from typing import Optional
+from .helpers import (
+    EXPONENTS_FILE,
+    MAPPINGS_FILE,
+    PREFIXES_FILE,
+    SI_FILE,
+    get_exponents,
+    get_langs,
+    get_mappings,
+    get_prefixes,
+    get_si_mappings,
+)
+
+# A snapshot is a header line with the magic bytes and the hash of its source tables,
+# followed by the marshalled tables and their derived indexes
+SNAPSHOT_MAGIC = b"UOMSNAPSHOT"
+SNAPSHOT_VERSION = 5
+
+
+def build_resources(
+    si: str = None,
+    prefixes: str = None,
+    exponents: str = None,
+    mappings: str = None,
+    lang: str = "en",
+    resources_hash: str = None,
+) -> dict:
+    """Read the resource tables from their CSV/TSV files and build their derived indexes."""
+    # Imported here as convert loads its default tables from the snapshot
+    from .convert import get_mapped_terms, get_mappings_index, get_two_way_equivalent_codes
+    from .resolve import get_reverse_index
+
+    ucum_si = get_si_mappings(si, lang)
+    ontology_mappings = dict(get_mappings(mappings))
+    return {
+        "hash": resources_hash or get_resources_hash(si, prefixes, exponents, mappings, lang=lang),
+        "ucum_si": ucum_si,
+        "unit_prefixes": get_prefixes(prefixes, lang),
+        "unit_exponents": get_exponents(exponents, lang),
+        "mappings": ontology_mappings,
+        "eq_codes": dict(get_two_way_equivalent_codes(ucum_si)),
+        "mappings_index": dict(get_mappings_index(ontology_mappings)),
+        "mapped_terms": {iri: str(term) for iri, term in get_mapped_terms(ontology_mappings).items()},
+        "reverse_index": get_reverse_index(ontology_mappings),
+    }
+
+
+def compile_resources(
+    output: str = None,
+    si: str = None,
+    prefixes: str = None,
+    exponents: str = None,
+    mappings: str = None,
+    lang: str = "en",
+) -> str:
+    """
+    Compile the resource tables and their derived indexes into a binary snapshot
+
+    :param output: path to write the snapshot to (default: see get_snapshot_path)
+    :param si: path to the SI mapping table (default: packaged si_input.csv)
+    :param prefixes: path to the prefixes table (default: packaged prefixes.csv)
+    :param exponents: path to the exponents table (default: packaged exponents.csv)
+    :param mappings: path to the ontology mappings table (default: packaged mappings.csv)
+    :param lang: language for annotations, or languages (e.g., "en,fr"; see helpers.get_langs) (default: en)
+    :return: path of the written snapshot
+    """
+    resources_hash = get_resources_hash(si, prefixes, exponents, mappings, lang=lang)
+    output = output or get_snapshot_path(resources_hash, lang=lang)
+    resources = build_resources(si, prefixes, exponents, mappings, lang=lang, resources_hash=resources_hash)
+
+    # Write to a temporary file first so that readers never see a partial snapshot
+    directory = os.path.dirname(os.path.abspath(output))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(SNAPSHOT_MAGIC + b" " + resources_hash.encode("ascii") + b"\n")
+            marshal.dump(resources, f)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, output)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return output
+
+
+def get_resources_hash(
+    si: str = None, prefixes: str = None, exponents: str = None, mappings: str = None, lang: str = "en"
+) -> str:
+    """Get a SHA-256 hash of the contents of the resource tables, the language and the snapshot
+    format, used to detect when a snapshot is out of date."""
+    h = hashlib.sha256()
+    langs = ",".join(get_langs(lang))
+    h.update(f"{SNAPSHOT_VERSION} {marshal.version} {sys.version_info[:2]} {langs}".encode("utf-8"))
+    for path in [si or SI_FILE, prefixes or PREFIXES_FILE, exponents or EXPONENTS_FILE, mappings or MAPPINGS_FILE]:
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def get_snapshot_dir() -> str:
+    """Get the directory of the default snapshots: the directory in UOM_SNAPSHOT_DIR, or else a
+    directory in the cache of the user (LOCALAPPDATA on Windows, XDG_CACHE_HOME or ~/.cache
+    elsewhere). Snapshots are trusted if their hash matches, so they are not kept in the shared
+    temporary directory, where another local user could plant one."""
+    snapshot_dir = os.environ.get("UOM_SNAPSHOT_DIR")
+    if snapshot_dir:
+        return snapshot_dir
+    if os.name == "nt":
+        cache_dir = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_dir, "units_of_measurement")
+
+
+def get_snapshot_path(resources_hash: str, lang: str = "en") -> str:
+    """Get the default snapshot path for a hash of the resource tables, in get_snapshot_dir."""
+    return os.path.join(get_snapshot_dir(), f"uom_resources_{'-'.join(get_langs(lang))}_{resources_hash[:16]}.snapshot")
+
+
+def load_resources(
+    snapshot: str = None,
+    si: str = None,
+    prefixes: str = None,
+    exponents: str = None,
+    mappings: str = None,
+    lang: str = "en",
+) -> dict:
+    """
+    Load the resource tables and their derived indexes from a snapshot, (re)compiling the
+    snapshot first if it is missing or if any of the tables changed since it was compiled.
+
+    :param snapshot: path to the snapshot (default: see get_snapshot_path)
+    :param si: path to the SI mapping table (default: packaged si_input.csv)
+    :param prefixes: path to the prefixes table (default: packaged prefixes.csv)
+    :param exponents: path to the exponents table (default: packaged exponents.csv)
+    :param mappings: path to the ontology mappings table (default: packaged mappings.csv)
+    :param lang: language for annotations, or languages (e.g., "en,fr"; see helpers.get_langs) (default: en)
+    :return: dict of hash, ucum_si, unit_prefixes, unit_exponents, mappings, eq_codes
+             (UCUM symbol -> set of equivalent codes), mappings_index (canonical UCUM code
+             -> list of mapped ontology term IRIs), mapped_terms (mapped ontology term IRI
+             -> term IRI) and reverse_index (mapped ontology term IRI -> canonical UCUM code,
+             see resolve.get_reverse_index)
+    """
+    resources_hash = get_resources_hash(si, prefixes, exponents, mappings, lang=lang)
+    snapshot = snapshot or get_snapshot_path(resources_hash, lang=lang)
+    resources = read_snapshot(snapshot, resources_hash)
+    if resources is not None:
+        return resources
+    try:
+        compile_resources(snapshot, si, prefixes, exponents, mappings, lang=lang)
+    except OSError as exc:
+        logging.warning(f"Could not write resource snapshot to '{snapshot}': {exc}")
+        return build_resources(si, prefixes, exponents, mappings, lang=lang, resources_hash=resources_hash)
+    return read_snapshot(snapshot, resources_hash)
+
+
+def read_snapshot(path: str, resources_hash: str = None) -> Optional[dict]:
+    """Read a snapshot through a read-only memory map, so that the payload is unmarshalled without
+    first being read into a copy. Unmarshalling builds new objects, so each process still holds its
+    own copy of the tables. Return None if the snapshot is missing, invalid, or does not match the
+    given hash."""
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header_end = mm.find(b"\n")
+            magic, _, snapshot_hash = mm[:header_end].partition(b" ")
+            if magic != SNAPSHOT_MAGIC:
+                return None
+            if resources_hash and snapshot_hash.decode("ascii") != resources_hash:
+                return None
+            with memoryview(mm)[header_end + 1:] as payload:
+                return marshal.loads(payload)
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
@@ -0,0 +1,440 @@
+import json
+import os
+import re
+
+from collections import Counter
+from html import escape
+from rdflib import Graph, Literal, Namespace, OWL, RDF, RDFS, SKOS, URIRef
+from time import perf_counter
+from typing import IO, Dict, Iterable, List, Tuple, Union
+from urllib.parse import quote as url_quote
+from .convert import UnitConverter, get_html_labels, get_html_nodes, graph_to_html, write_html
+from .helpers import ENCODING
+
+# In JSON-LD 1.1, only terms whose IRI ends with one of these characters can be used as the
+# prefix of a compact IRI
+JSONLD_PREFIX_ENDINGS = ("/", "#", ":", "?", "[", "]", "@")
+
+# Local names that are written as prefixed names: a subset of the Turtle PN_LOCAL production
+# (without escapes), and XML NCNames for the properties in RDF/XML
+TURTLE_LOCAL_NAME = re.compile(r"[A-Za-z0-9_](?:[A-Za-z0-9_.-]*[A-Za-z0-9_-])?")
+XML_LOCAL_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_.-]*")
+
+
+def get_jsonld_node(subject: URIRef, triples: Iterable[tuple], prefixes: List[Tuple[str, str]]) -> dict:
+    """Get the JSON-LD node object of a subject from its triples, compacting IRIs with prefixes
+    (see get_jsonld_prefixes)."""
+    values = {}
+    for _, p, o in triples:
+        if p == RDF.type:
+            key, value = "@type", get_jsonld_id(str(o), prefixes)
+        elif isinstance(o, Literal):
+            key = get_jsonld_id(str(p), prefixes)
+            if o.language:
+                value = {"@language": o.language, "@value": str(o)}
+            elif o.datatype:
+                value = {"@type": get_jsonld_id(str(o.datatype), prefixes), "@value": str(o)}
+            else:
+                value = str(o)
+        else:
+            key, value = get_jsonld_id(str(p), prefixes), {"@id": get_jsonld_id(str(o), prefixes)}
+        values.setdefault(key, []).append(value)
+    node = {"@id": get_jsonld_id(str(subject), prefixes)}
+    node.update((key, v[0] if len(v) == 1 else v) for key, v in values.items())
+    return node
+
+
+def get_jsonld_context(converter: UnitConverter) -> Dict[str, str]:
+    """Get the JSON-LD context of the output of write_jsonld: the prefixes of the converter."""
+    return dict(converter.namespaces)
+
+
+def get_jsonld_id(iri: str, prefixes: List[Tuple[str, str]]) -> str:
+    """Compact an IRI with the first prefix (a list of (prefix, namespace) pairs, most specific
+    namespace first) that it starts with, or keep the full IRI."""
+    for ns, base in prefixes:
+        # A suffix that starts with // would make the compact IRI read as an absolute IRI
+        if iri.startswith(base) and not iri.startswith("//", len(base)):
+            return f"{ns}:{iri[len(base):]}"
+    return iri
+
+
+def get_jsonld_keys(converter: UnitConverter, prefixes: List[Tuple[str, str]]) -> Dict[str, str]:
+    """Get the compact IRIs of the properties of units in JSON-LD, and of the type of units."""
+    unit_ns = Namespace(converter.base_iri)
+    iris = {
+        "type": OWL.NamedIndividual,
+        "label": RDFS.label,
+        "altLabel": SKOS.altLabel,
+        "definition": SKOS.definition,
+        "SI_code": unit_ns.SI_code,
+        "UCUM_code": unit_ns.UCUM_code,
+        "exactMatch": SKOS.exactMatch,
+    }
+    return {key: get_jsonld_id(str(iri), prefixes) for key, iri in iris.items()}
+
+
+def get_jsonld_prefixes(context: Dict[str, str]) -> List[Tuple[str, str]]:
+    """Get the prefixes of a JSON-LD context that can compact IRIs, most specific namespace first."""
+    prefixes = [(ns, base) for ns, base in context.items() if base.endswith(JSONLD_PREFIX_ENDINGS)]
+    return sorted(prefixes, key=lambda x: -len(x[1]))
+
+
+def get_jsonld_properties(converter: UnitConverter, prefixes: List[Tuple[str, str]]) -> List[dict]:
+    """Get the JSON-LD node objects of the annotation properties shared by all units."""
+    unit_ns = Namespace(converter.base_iri)
+    return [
+        {
+            "@id": get_jsonld_id(str(prop), prefixes),
+            "@type": get_jsonld_id(str(OWL.AnnotationProperty), prefixes),
+            get_jsonld_id(str(RDFS.label), prefixes): label,
+        }
+        for prop, label in [(unit_ns.SI_code, "SI code"), (unit_ns.UCUM_code, "UCUM code")]
+    ]
+
+
+def get_jsonld_text(value: str, lang: str = None) -> Union[dict, str]:
+    """Get the JSON-LD value of a literal in a language (a plain string without a language)."""
+    return {"@language": lang, "@value": value} if lang else value
+
+
+def get_jsonld_unit(
+    record: dict, converter: UnitConverter, prefixes: List[Tuple[str, str]], keys: Dict[str, str] = None
+) -> dict:
+    """
+    Get the JSON-LD node object of a unit straight from its record, with the same statements as
+    UnitConverter.get_triples. Multi-valued properties are always lists, so that every unit has the
+    same shape; with more than one language, so are the labels and definitions.
+
+    :param record: record of the unit (see get_unit_record)
+    :param converter: converter that made the record
+    :param prefixes: prefixes to compact IRIs with (see get_jsonld_prefixes)
+    :param keys: compact IRIs of the properties (see get_jsonld_keys), computed if not given
+    :return: node object
+    """
+    keys = keys or get_jsonld_keys(converter, prefixes)
+    base_iri = converter.base_iri
+    node = {"@id": get_jsonld_id(base_iri + url_quote(record["ucum_codes"][0]), prefixes), "@type": keys["type"]}
+    # The annotations in the main language, then in the other languages
+    annotations = [(converter.lang, record)] + list(record.get("translations", {}).items())
+    labels = [get_jsonld_text(x["label"], lang) for lang, x in annotations if x["label"]]
+    synonyms = [get_jsonld_text(syn, lang) for lang, x in annotations for syn in x["synonyms"]]
+    definitions = [get_jsonld_text(x["definition"], lang) for lang, x in annotations if x["definition"]]
+    for key, values in [("label", labels), ("altLabel", synonyms), ("definition", definitions)]:
+        if values:
+            node[keys[key]] = values[0] if key != "altLabel" and len(converter.langs) == 1 else values
+    if record["si_code"]:
+        node[keys["SI_code"]] = record["si_code"]
+    node[keys["UCUM_code"]] = list(record["ucum_codes"])
+    matches = [base_iri + url_quote(ec) for ec in record["equivalent_codes"]]
+    for m in record["mappings"]:
+        mapped_term = converter.mapped_terms.get(m)
+        if mapped_term is not None:
+            matches.append(str(mapped_term))
+    if matches:
+        node[keys["exactMatch"]] = [{"@id": get_jsonld_id(iri, prefixes)} for iri in dict.fromkeys(matches)]
+    return node
+
+
+def get_nt_term(term) -> str:
+    """Format an rdflib term (IRI or literal) for N-Triples and N-Quads."""
+    if isinstance(term, Literal):
+        value = str(term).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+        if term.language:
+            return f'"{value}"@{term.language}'
+        if term.datatype:
+            return f'"{value}"^^<{term.datatype}>'
+        return f'"{value}"'
+    return f"<{term}>"
+
+
+def get_prefix_names(namespaces: Dict[str, str]) -> List[Tuple[str, str]]:
+    """Get the (prefix, namespace) pairs of the namespaces, most specific namespace first."""
+    return sorted(namespaces.items(), key=lambda x: -len(x[1]))
+
+
+def get_page_key(label: str) -> str:
+    """Get the page of a unit in HTML output split by letter: the first letter of its label, or "_"
+    if the label does not start with a letter."""
+    first = label[:1].upper()
+    return first if first.isalpha() and first.isascii() else "_"
+
+
+def get_rdfxml_block(subject: URIRef, triples: Iterable[tuple], prefixes: List[Tuple[str, str]]) -> str:
+    """Get the rdf:Description element of a subject in RDF/XML, with its properties as qualified
+    names with prefixes (see get_prefix_names). Line breaks in literals are escaped, so the element
+    never contains a blank line."""
+    lines = [f"  <rdf:Description rdf:about={get_xml_attribute(subject)}>"]
+    for _, p, o in triples:
+        name = get_xml_name(str(p), prefixes)
+        if isinstance(o, Literal):
+            if o.language:
+                attribute = f" xml:lang={get_xml_attribute(o.language)}"
+            elif o.datatype:
+                attribute = f" rdf:datatype={get_xml_attribute(o.datatype)}"
+            else:
+                attribute = ""
+            text = escape(str(o), quote=False).replace("\n", "&#10;").replace("\r", "&#13;")
+            lines.append(f"    <{name}{attribute}>{text}</{name}>")
+        else:
+            lines.append(f"    <{name} rdf:resource={get_xml_attribute(o)}/>")
+    lines.append("  </rdf:Description>")
+    return "\n".join(lines)
+
+
+def get_rdfxml_header(namespaces: Dict[str, str]) -> str:
+    """Get the XML declaration and the opening rdf:RDF element with the namespaces."""
+    declarations = "".join(f"\n   xmlns:{ns}={get_xml_attribute(base)}" for ns, base in sorted(namespaces.items()))
+    return f'<?xml version="1.0" encoding="utf-8"?>\n<rdf:RDF{declarations}\n>\n'
+
+
+def get_turtle_block(subject: URIRef, triples: Iterable[tuple], prefixes: List[Tuple[str, str]]) -> str:
+    """Get the statements about a subject in Turtle, one predicate and object per line, with
+    prefixed names where possible (see get_prefix_names)."""
+    pairs = [
+        ("a" if p == RDF.type else get_turtle_term(p, prefixes)) + " " + get_turtle_term(o, prefixes)
+        for _, p, o in triples
+    ]
+    return get_turtle_term(subject, prefixes) + " " + " ;\n    ".join(pairs) + " ."
+
+
+def get_turtle_header(namespaces: Dict[str, str]) -> str:
+    """Get the prefix declarations of the namespaces in Turtle."""
+    return "".join(f"@prefix {ns}: <{base}> .\n" for ns, base in sorted(namespaces.items())) + "\n"
+
+
+def get_turtle_term(term, prefixes: List[Tuple[str, str]]) -> str:
+    """Format an rdflib term for Turtle: an IRI as a prefixed name if it is in a namespace and the
+    rest is a simple local name, and any other term as in N-Triples."""
+    if isinstance(term, URIRef):
+        iri = str(term)
+        for ns, base in prefixes:
+            if iri.startswith(base) and TURTLE_LOCAL_NAME.fullmatch(iri, len(base)):
+                return f"{ns}:{iri[len(base):]}"
+    return get_nt_term(term)
+
+
+def get_xml_attribute(value) -> str:
+    """Quote and escape an XML attribute value."""
+    return '"' + escape(str(value)) + '"'
+
+
+def get_xml_name(iri: str, prefixes: List[Tuple[str, str]]) -> str:
+    """Get the qualified name of a property IRI in RDF/XML. Raises a ValueError if the IRI is not
+    in a namespace, or the rest is not an XML name."""
+    for ns, base in prefixes:
+        if iri.startswith(base) and XML_LOCAL_NAME.fullmatch(iri, len(base)):
+            return f"{ns}:{iri[len(base):]}"
+    raise ValueError(f"Cannot write the property '{iri}' in RDF/XML without a namespace")
+
+
+def serialize_graph(gout: Graph, outfmt: str = "ttl", lang: str = "en") -> str:
+    """Serialize a graph of units to html (labelled in lang), json-ld (with the graph prefixes as
+    context), or any other rdflib format."""
+    if outfmt == "html":
+        outstr = graph_to_html(gout, lang=lang)
+    elif outfmt == "json-ld":
+        jsonld_context = {}
+        for ns, base in dict(gout.namespaces()).items():
+            jsonld_context[ns] = str(base)
+        jsonld_context = {"@context": jsonld_context}
+        outstr = gout.serialize(format=outfmt, context=jsonld_context)
+    else:
+        outstr = gout.serialize(format=outfmt)
+
+    # Handle backwards compatibility between rdflib 5.x.x and 6.x.x
+    if isinstance(outstr, bytes):
+        outstr = outstr.decode(ENCODING)
+    return outstr
+
+
+def write_jsonld(  # noqa: C901
+    converter: UnitConverter,
+    inputs: Iterable[str],
+    output: IO,
+    lines: bool = False,
+    counts: Dict[str, Counter] = None,
+) -> int:
+    """
+    Convert UCUM codes and write each unit to output as a JSON-LD node object as soon as it is
+    converted, without building a graph, so that the output is never held in memory (only the
+    distinct units and spellings are kept, to write each of them once). The units are written to
+    the @graph of one JSON-LD document, followed by the annotation properties shared by all units,
+    or with lines=True as JSON lines (NDJSON): one node object per line, compacted with the context
+    of get_jsonld_context. A spelling of a unit that is seen after the unit was written is added
+    with its own node object with the same @id and only the UCUM code, which JSON-LD processors
+    merge into the unit.
+
+    :param converter: converter for the UCUM codes
+    :param inputs: iterable of UCUM codes (e.g., an open file)
+    :param output: text stream to write to
+    :param lines: write one node object per line instead of a JSON-LD document
+    :param counts: dict to add the number of inputs per canonical UCUM code and spelling to
+                   (see UnitConverter.group_inputs)
+    :return: number of units written
+    """
+    context = get_jsonld_context(converter)
+    prefixes = get_jsonld_prefixes(context)
+    keys = get_jsonld_keys(converter, prefixes)
+
+    observer = converter.observer
+    if not lines:
+        context_str = json.dumps(context, indent=2).replace("\n", "\n  ")
+        output.write(f'{{\n  "@context": {context_str},\n  "@graph": [\n')
+    separator = "\n" if lines else ",\n"
+    # Each unit is written once, and each other spelling that is seen later once
+    seen_units = {}
+    n_nodes = 0
+    n_inputs = 0
+    for inpt, record in converter.iter_records(inputs):
+        n_inputs += 1
+        canonical = record["ucum_codes"][0] if record else inpt
+        if counts is not None:
+            counts.setdefault(canonical, Counter())[inpt] += 1
+        if record is None:
+            continue
+        if canonical in seen_units:
+            node_id, spellings = seen_units[canonical]
+            if inpt in spellings:
+                continue
+            spellings.add(inpt)
+            node = {"@id": node_id, keys["UCUM_code"]: [inpt]}
+        else:
+            record = {**record, "ucum_codes": list(dict.fromkeys(record["ucum_codes"] + [inpt]))}
+            node = get_jsonld_unit(record, converter, prefixes, keys)
+            seen_units[canonical] = (node["@id"], set(record["ucum_codes"]))
+        node_str = json.dumps(node, ensure_ascii=False)
+        if observer is not None:
+            start = perf_counter()
+        if lines:
+            output.write(node_str + "\n")
+        else:
+            output.write(f"{separator if n_nodes else ''}    {node_str}")
+        if observer is not None:
+            observer.on_stage("write", perf_counter() - start)
+        n_nodes += 1
+    if not lines:
+        # Declare the annotation properties once, as rdflib would for a graph with units
+        if n_nodes:
+            for node in get_jsonld_properties(converter, prefixes):
+                output.write(f"{separator}    {json.dumps(node, ensure_ascii=False)}")
+        output.write("\n  ]\n}\n")
+    if observer is not None:
+        observer.on_count("inputs", n_inputs)
+        observer.on_count("units", len(seen_units))
+    return len(seen_units)
+
+
+def write_ntriples(  # noqa: C901
+    converter: UnitConverter,
+    inputs: Iterable[str],
+    output: IO,
+    graph: str = None,
+    counts: Dict[str, Counter] = None,
+) -> int:
+    """
+    Convert UCUM codes and write the triples of each unit to output as soon as it is converted,
+    so that the output is never held in memory (only the distinct units and spellings are kept,
+    to write each of them once)
+
+    :param converter: converter for the UCUM codes
+    :param inputs: iterable of UCUM codes (e.g., an open file)
+    :param output: text stream to write to
+    :param graph: graph IRI to write N-Quads, or None to write N-Triples
+    :param counts: dict to add the number of inputs per canonical UCUM code and spelling to
+                   (see UnitConverter.group_inputs)
+    :return: number of lines written
+    """
+    suffix = f" <{graph}> .\n" if graph else " .\n"
+    ucum_code = get_nt_term(Namespace(converter.base_iri).UCUM_code)
+    # Each unit is written once, with a UCUM code triple for each other spelling that is seen
+    # later, and the annotation properties shared by all units are only declared for the first unit
+    seen_units = {}
+    seen_properties = set()
+    count = 0
+    n_inputs = 0
+    for inpt, record in converter.iter_records(inputs):
+        n_inputs += 1
+        canonical = record["ucum_codes"][0] if record else inpt
+        if counts is not None:
+            counts.setdefault(canonical, Counter())[inpt] += 1
+        if record is None:
+            continue
+        if canonical in seen_units:
+            term, spellings = seen_units[canonical]
+            if inpt not in spellings:
+                spellings.add(inpt)
+                output.write(f"{term} {ucum_code} {get_nt_term(Literal(inpt))}{suffix}")
+                count += 1
+            continue
+        record = {**record, "ucum_codes": list(dict.fromkeys(record["ucum_codes"] + [inpt]))}
+        triples = converter.get_triples(record)
+        # The unit itself is the subject of the first triple
+        term = triples[0][0]
+        seen_units[canonical] = (get_nt_term(term), set(record["ucum_codes"]))
+        lines = []
+        for s, p, o in dict.fromkeys(triples):
+            if s != term:
+                if (s, p, o) in seen_properties:
+                    continue
+                seen_properties.add((s, p, o))
+            lines.append(f"{get_nt_term(s)} {get_nt_term(p)} {get_nt_term(o)}{suffix}")
+        if converter.observer is not None:
+            start = perf_counter()
+            output.write("".join(lines))
+            converter.observer.on_stage("write", perf_counter() - start)
+        else:
+            output.write("".join(lines))
+        count += len(lines)
+    if converter.observer is not None:
+        converter.observer.on_count("inputs", n_inputs)
+        converter.observer.on_count("units", len(seen_units))
+        converter.observer.on_count("triples", count)
+    return count
+
+
+def write_html_pages(
+    gout: Graph, directory: str, page_size: int = None, rdf_type=OWL.NamedIndividual, lang: str = "en"
+) -> List[str]:
+    """
+    Write the units in a graph as HTML+RDFa split into pages, one for each first letter of the
+    labels (units-A.html, ..., units-_.html for other characters) or of page_size units each
+    (units-1.html, ...), with an index.html that links to the pages. Each page is streamed to its
+    file, so memory use does not grow with the size of the output.
+
+    :param gout: graph of units
+    :param directory: directory to write the pages to (created if missing)
+    :param page_size: number of units per page, or None to split by letter
+    :param rdf_type: type of the units in the graph
+    :param lang: language of the labels (the main language of the graph)
+    :return: paths of the pages, then the index
+    """
+    if page_size is not None and page_size < 1:
+        raise ValueError(f"Page size must be >= 1, got {page_size}")
+    os.makedirs(directory, exist_ok=True)
+    labels = get_html_labels(gout, lang=lang)
+    nodes = get_html_nodes(gout, labels, rdf_type)
+    if page_size:
+        pages = [(str(i // page_size + 1), nodes[i:i + page_size]) for i in range(0, len(nodes), page_size)]
+    else:
+        letters = {}
+        for node in nodes:
+            letters.setdefault(get_page_key(node[0]), []).append(node)
+        pages = sorted(letters.items())
+
+    paths = []
+    index = ["<ul>"]
+    for key, page_nodes in pages:
+        filename = f"units-{key}.html"
+        path = os.path.join(directory, filename)
+        with open(path, "w", encoding="utf-8") as f:
+            write_html(gout, f, rdf_type=rdf_type, nodes=page_nodes, labels=labels)
+        paths.append(path)
+        first, last = escape(page_nodes[0][0]), escape(page_nodes[-1][0])
+        index.append(f'  <li><a href="{filename}">{escape(key)}</a>: {first} - {last} ({len(page_nodes)} units)</li>')
+    index.append("</ul>")
+    path = os.path.join(directory, "index.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(index))
+    paths.append(path)
+    return paths